@@ -11,7 +11,7 @@ docker ps
 :: Scripts Python
 echo Lancement des scripts Python...
 docker-compose exec flask_model python -m app.startup
-docker compose exec flask_model python app/run_clustering.py
+docker compose exec flask_model python -m app.run_clustering
 
 echo OK
 
@@ -1,26 +1,28 @@
-from flask import Flask,Response
-from .routes.search import search_bp
-from .routes.cluster import clusters_bp
+import time
+import logging
+from flask import Flask,jsonify
 from prometheus_flask_exporter import PrometheusMetrics
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from .warmup import is_ready, start_warmup, warmup_state
 
-def create_app():
+def create_app(warmup: str = None):
     app = Flask(__name__)
+    # Sert /metrics ; avec PROMETHEUS_MULTIPROC_DIR, agrège les métriques de tous les workers.
     metrics = PrometheusMetrics(app)
-    app.register_blueprint(search_bp)
-    app.register_blueprint(clusters_bp)
-    
-    @app.route('/metrics')
-    def get_metrics():
-        return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
-    return app
-
-
-
-
-
-
 
+    # Les blueprints (et donc sentence-transformers/torch via app.embeddings) ne sont importés qu'ici.
+    start = time.perf_counter()
+    from .routes.search import search_bp
+    from .routes.cluster import clusters_bp
+    logging.info(f"Import des routes en {time.perf_counter() - start:.2f}s.")
 
+    app.register_blueprint(search_bp)
+    app.register_blueprint(clusters_bp)
 
+    @app.route('/ready')
+    def get_ready():
+        if is_ready():
+            return jsonify(warmup_state()), 200
+        return jsonify(warmup_state()), 503
 
+    start_warmup(warmup)
+    return app
@@ -0,0 +1,21 @@
+import json
+import argparse
+from app.embeddings import EMBEDDING_BACKEND, EMBEDDING_QUANTIZATION, check_backend_quality
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vérifie un backend d'inférence par rapport à la référence torch fp32.")
+    parser.add_argument("--texts", required=True, help="Fichier texte contenant un texte par ligne (échantillon du corpus).")
+    parser.add_argument("--backend", default=EMBEDDING_BACKEND, choices=["torch", "onnx", "openvino"])
+    parser.add_argument("--quantization", default=EMBEDDING_QUANTIZATION, choices=["none", "int8"])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--min-overlap", type=float, default=0.9)
+    args = parser.parse_args()
+
+    with open(args.texts, "r", encoding="utf-8") as f:
+        sample = [line.strip() for line in f if line.strip()]
+    report = check_backend_quality(sample, backend=args.backend, quantization=args.quantization, k=args.k)
+    report["passed"] = report["cosine_min"] >= args.min_cosine and report["topk_overlap"] >= args.min_overlap
+    print(json.dumps(report, indent=2))
+    raise SystemExit(0 if report["passed"] else 1)
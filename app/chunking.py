@@ -0,0 +1,154 @@
+import os
+import time
+import logging
+import numpy as np
+from typing import Callable, List
+
+
+# Découpage des articles en chunks, partagé par startup.py et benchmark.py.
+#   "chars"  : découpage par fenêtres de caractères (chunk_text_robust), mode par défaut ;
+#   "tokens" : chunks dimensionnés avec le tokenizer du modèle, jamais tronqués par l'encodeur.
+# Changer de mode change les chunks, donc les identifiants de points : prévoir une
+# reconstruction complète (`python -m app.startup --full`).
+CHUNKING_MODE = os.getenv("CHUNKING_MODE", "chars")
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "0"))  # 0 : limite du modèle
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+CHUNK_SIZE_CHARS = 1000
+CHUNK_OVERLAP_CHARS = 200
+ENCODE_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+
+def chunk_text_robust(content: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> list[str]:
+    """
+    Découpe un texte en chunks de taille fixe avec un chevauchement.
+    Cette méthode est robuste aux variations de formatage.
+    """
+    if not isinstance(content, str) or not content.strip():
+        return []
+
+    chunks_by_paragraph = content.split('\n\n')
+
+    final_chunks = []
+    for paragraph in chunks_by_paragraph:
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+
+        # Si un paragraphe est plus grand que notre taille cible, on le découpe
+        if len(paragraph) > chunk_size:
+            start_index = 0
+            while start_index < len(paragraph):
+                end_index = start_index + chunk_size
+                final_chunks.append(paragraph[start_index:end_index])
+                start_index += chunk_size - chunk_overlap
+        else:
+            final_chunks.append(paragraph)
+
+    return final_chunks
+
+
+def split_paragraphs(content: str) -> List[str]:
+    if not isinstance(content, str) or not content.strip():
+        return []
+    return [p.strip() for p in content.split('\n\n') if p.strip()]
+
+
+class TokenChunker:
+    """
+    Découpe les articles par paragraphe ; un paragraphe qui dépasse `max_tokens` tokens
+    est découpé en fenêtres de `max_tokens` tokens chevauchantes de `overlap_tokens`.
+    Tous les paragraphes d'un article sont tokenisés en un seul appel au tokenizer
+    rapide, et les fenêtres sont extraites du texte d'origine grâce aux offsets des
+    tokens : aucun caractère n'est perdu ni tronqué par l'encodeur.
+    """
+
+    def __init__(self, tokenizer, max_tokens: int, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+        if max_tokens <= 0 or not 0 <= overlap_tokens < max_tokens:
+            raise ValueError(f"Paramètres de découpage invalides : max_tokens={max_tokens}, overlap_tokens={overlap_tokens}.")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    @classmethod
+    def for_model(cls, model, max_tokens: int = None, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> "TokenChunker":
+        """Chunker dimensionné sur la longueur maximale d'un modèle SentenceTransformer (tokens spéciaux déduits)."""
+        budget = model.max_seq_length - model.tokenizer.num_special_tokens_to_add(pair=False)
+        return cls(model.tokenizer, min(max_tokens or CHUNK_MAX_TOKENS or budget, budget), overlap_tokens)
+
+    def chunk(self, content: str) -> List[str]:
+        paragraphs = split_paragraphs(content)
+        if not paragraphs:
+            return []
+        encoded = self.tokenizer(paragraphs, add_special_tokens=False, return_offsets_mapping=True)
+        step = self.max_tokens - self.overlap_tokens
+        chunks = []
+        for paragraph, offsets in zip(paragraphs, encoded["offset_mapping"]):
+            if len(offsets) <= self.max_tokens:
+                chunks.append(paragraph)
+                continue
+            for start in range(0, len(offsets), step):
+                end = min(start + self.max_tokens, len(offsets))
+                chunks.append(paragraph[offsets[start][0]:offsets[end - 1][1]])
+                if end == len(offsets):
+                    break
+        return chunks
+
+
+def make_chunker(model=None, mode: str = None) -> Callable[[str], List[str]]:
+    """Fonction de découpage `contenu -> chunks` selon CHUNKING_MODE."""
+    mode = mode or CHUNKING_MODE
+    if mode == "tokens" and model is not None:
+        chunker = TokenChunker.for_model(model)
+        logging.info(f"Découpage par tokens : {chunker.max_tokens} tokens max par chunk, chevauchement de {chunker.overlap_tokens}.")
+        return chunker.chunk
+    if mode not in ("tokens", "chars"):
+        raise ValueError(f"Mode de découpage inconnu : '{mode}' (attendu : tokens ou chars).")
+    return lambda content: chunk_text_robust(content, chunk_size=CHUNK_SIZE_CHARS, chunk_overlap=CHUNK_OVERLAP_CHARS)
+
+
+def token_lengths(model, texts: List[str]) -> List[int]:
+    """Nombre de tokens effectivement encodés pour chaque texte (tokens spéciaux inclus, troncature à max_seq_length)."""
+    encoded = model.tokenizer(texts, add_special_tokens=True, truncation=True, max_length=model.max_seq_length)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def encode_length_bucketed(model, texts: List[str], batch_size: int = ENCODE_BATCH_SIZE, pool=None, **encode_kwargs):
+    """
+    Encode les textes par lots de longueurs homogènes. `model.encode` trie déjà ses
+    entrées par longueur (en caractères) avant de former les lots, et rend les vecteurs
+    dans l'ordre d'origine. Le débit en tokens/s est calculé après coup, à partir des
+    longueurs données par le tokenizer rapide du modèle (hors temps d'encodage).
+
+    Avec un `pool` (app.embeddings.EncodePool), les textes sont triés par longueur avant
+    d'être répartis entre ses processus, pour que chaque envoi soit lui aussi homogène,
+    sauf si le lot compte moins de `pool.min_texts` textes.
+
+    Returns:
+        (vectors, stats): les embeddings (float32) et le débit en textes/s et tokens/s.
+    """
+    if not texts:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32), {"texts": 0, "tokens": 0}
+
+    start = time.perf_counter()
+    if pool is not None and len(texts) >= pool.min_texts:
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        pooled = np.asarray(pool.encode([texts[row] for row in order], batch_size=batch_size, **encode_kwargs), dtype=np.float32)
+        vectors = np.empty_like(pooled)
+        vectors[order] = pooled
+    else:
+        vectors = np.asarray(model.encode(texts, batch_size=batch_size, **encode_kwargs), dtype=np.float32)
+    elapsed = time.perf_counter() - start
+
+    tokens = sum(token_lengths(model, texts))
+    stats = {
+        "texts": len(texts),
+        "tokens": tokens,
+        "seconds": round(elapsed, 3),
+        "texts_per_second": round(len(texts) / elapsed, 1) if elapsed else None,
+        "tokens_per_second": round(tokens / elapsed, 1) if elapsed else None,
+    }
+    logging.info(
+        f"Encodage de {len(texts)} textes ({tokens} tokens) en {elapsed:.2f}s : "
+        f"{stats['texts_per_second']} textes/s, {stats['tokens_per_second']} tokens/s."
+    )
+    return vectors, stats
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from typing import Optional
+import numpy as np
+
+
+CLUSTER_INDEX_DIR = os.getenv(
+    "CLUSTER_INDEX_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "cluster_index")
+)
+CLUSTER_INDEX_CHECK_INTERVAL = float(os.getenv("CLUSTER_INDEX_CHECK_INTERVAL", "5"))
+VERSION_FILE = "VERSION"
+
+
+def dominant_clusters(article_ids, cluster_ids) -> dict:
+    """
+    Calcule le cluster majoritaire de chaque article à partir des couples (article, cluster)
+    de ses chunks : comptage des seuls couples présents (groupby vectorisé), puis, par
+    article, le couple le plus fréquent. En cas d'égalité, le cluster rencontré en premier
+    l'emporte, comme avec `Counter.most_common(1)`.
+    """
+    article_ids = np.asarray(article_ids, dtype=object)
+    cluster_ids = np.asarray(cluster_ids, dtype=np.int64)
+    if len(article_ids) == 0:
+        return {}
+    articles, article_codes = np.unique(article_ids.astype(str), return_inverse=True)
+    pairs, first_seen, counts = np.unique(
+        np.column_stack((article_codes, cluster_ids)), axis=0, return_index=True, return_counts=True
+    )
+    order = np.lexsort((first_seen, -counts, pairs[:, 0]))
+    ranked = pairs[order]
+    winners = ranked[np.r_[True, ranked[1:, 0] != ranked[:-1, 0]]]
+    return dict(zip(articles[winners[:, 0]].tolist(), winners[:, 1].tolist()))
+
+
+def write_atomic(path: str, content: str) -> None:
+    """Remplace `path` par `content` via un fichier temporaire unique du même dossier."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)  # mkstemp crée le fichier en 0600
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _table_paths() -> list:
+    if not os.path.isdir(CLUSTER_INDEX_DIR):
+        return []
+    return [os.path.join(CLUSTER_INDEX_DIR, name) for name in os.listdir(CLUSTER_INDEX_DIR) if name.endswith(".json")]
+
+
+def _write_table(path: str, table: dict) -> None:
+    write_atomic(path, json.dumps(table, separators=(",", ":")))
+
+
+def publish_article_clusters(code_id: str, clusters: dict) -> str:
+    """
+    Publie la table article -> cluster dominant d'un code, puis incrémente la version
+    globale de l'index pour que les processus de l'API la rechargent.
+
+    Returns:
+        str: la nouvelle version de l'index.
+    """
+    os.makedirs(CLUSTER_INDEX_DIR, exist_ok=True)
+    version = f"{time.time_ns()}"
+    _write_table(os.path.join(CLUSTER_INDEX_DIR, f"{code_id}.json"), {"code_id": code_id, "version": version, "clusters": clusters})
+    write_atomic(os.path.join(CLUSTER_INDEX_DIR, VERSION_FILE), version)
+    logging.info(f"Index article -> cluster du code '{code_id}' publié ({len(clusters)} articles, version {version}).")
+    return version
+
+
+def forget_article_clusters(article_ids) -> Optional[str]:
+    """
+    Retire des tables publiées les articles modifiés par une synchronisation incrémentale :
+    leurs chunks ont changé depuis le dernier clustering, /cluster recalcule donc leur
+    cluster dominant depuis Qdrant jusqu'au prochain run_clustering.
+
+    Returns:
+        la nouvelle version de l'index, ou None si aucune table ne contenait ces articles.
+    """
+    article_ids = set(article_ids)
+    if not article_ids:
+        return None
+    version = f"{time.time_ns()}"
+    removed = 0
+    for path in _table_paths():
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                table = json.load(f)
+            clusters = table["clusters"]
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Table de clusters illisible ({os.path.basename(path)}) : {e}")
+            continue
+        kept = {article_id: cluster for article_id, cluster in clusters.items() if article_id not in article_ids}
+        if len(kept) == len(clusters):
+            continue
+        removed += len(clusters) - len(kept)
+        _write_table(path, {**table, "version": version, "clusters": kept})
+    if not removed:
+        return None
+    write_atomic(os.path.join(CLUSTER_INDEX_DIR, VERSION_FILE), version)
+    logging.info(f"Index article -> cluster : {removed} articles modifiés retirés (version {version}).")
+    return version
+
+
+def clear_article_clusters() -> Optional[str]:
+    """
+    Supprime toutes les tables publiées, calculées sur une autre collection que celle
+    servie désormais (reconstruction complète ou rollback).
+
+    Returns:
+        la nouvelle version de l'index, ou None s'il n'y avait aucune table.
+    """
+    paths = _table_paths()
+    if not paths:
+        return None
+    for path in paths:
+        os.unlink(path)
+    version = f"{time.time_ns()}"
+    write_atomic(os.path.join(CLUSTER_INDEX_DIR, VERSION_FILE), version)
+    logging.info(f"Index article -> cluster vidé ({len(paths)} tables, version {version}).")
+    return version
+
+
+def current_version():
+    """Version courante de l'index (None s'il n'a jamais été publié)."""
+    try:
+        with open(os.path.join(CLUSTER_INDEX_DIR, VERSION_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class ArticleClusterIndex:
+    """
+    Table en mémoire article -> cluster dominant, chargée depuis les fichiers publiés
+    par run_clustering (et élagués par startup). La version est vérifiée au plus toutes les `check_interval`
+    secondes et la table est rechargée dès qu'elle change.
+    """
+
+    def __init__(self, check_interval: float = CLUSTER_INDEX_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.version = None
+        self._clusters = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            version = current_version()
+            if version == self.version:
+                return
+            clusters = {}
+            if version is not None:
+                for name in os.listdir(CLUSTER_INDEX_DIR):
+                    if not name.endswith(".json"):
+                        continue
+                    try:
+                        with open(os.path.join(CLUSTER_INDEX_DIR, name), "r", encoding="utf-8") as f:
+                            clusters.update(json.load(f)["clusters"])
+                    except (OSError, ValueError, KeyError) as e:
+                        logging.warning(f"Table de clusters illisible ({name}) : {e}")
+            self._clusters = clusters
+            self.version = version
+            logging.info(f"Index article -> cluster chargé : {len(clusters)} articles (version {version}).")
+
+    def lookup(self, article_ids: list):
+        """
+        Returns:
+            (found, missing): le dictionnaire des articles présents dans l'index
+            et la liste des identifiants absents.
+        """
+        self._maybe_reload()
+        clusters = self._clusters
+        found, missing = {}, []
+        for article_id in article_ids:
+            if article_id in clusters:
+                found[article_id] = clusters[article_id]
+            else:
+                missing.append(article_id)
+        return found, missing
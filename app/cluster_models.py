@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import joblib
+import logging
+import threading
+import numpy as np
+from app.cluster_index import write_atomic
+
+
+CLUSTER_MODELS_DIR = os.getenv(
+    "CLUSTER_MODELS_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "cluster_models")
+)
+LATEST_FILE = "LATEST"
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def _code_dir(code_id: str) -> str:
+    return os.path.join(CLUSTER_MODELS_DIR, code_id)
+
+
+def save_cluster_models(code_id: str, reducer, clusterer, params: dict) -> str:
+    """
+    Sauvegarde les modèles UMAP/HDBSCAN ajustés pour un code sous une nouvelle version,
+    puis la désigne comme version courante (écriture atomique du fichier LATEST).
+
+    Returns:
+        str: l'identifiant de version créé.
+    """
+    version = time.strftime("%Y%m%dT%H%M%S") + f"{int(time.time() * 1000) % 1000:03d}"
+    version_dir = os.path.join(_code_dir(code_id), version)
+    os.makedirs(version_dir, exist_ok=True)
+    joblib.dump({"reducer": reducer, "clusterer": clusterer}, os.path.join(version_dir, "models.joblib"))
+    with open(os.path.join(version_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"code_id": code_id, "version": version, "params": params}, f)
+
+    write_atomic(os.path.join(_code_dir(code_id), LATEST_FILE), version)
+    logging.info(f"Modèles de clustering du code '{code_id}' sauvegardés (version {version}).")
+    return version
+
+
+def latest_version(code_id: str):
+    """Version courante des modèles d'un code (None si aucun modèle n'a été sauvegardé)."""
+    try:
+        with open(os.path.join(_code_dir(code_id), LATEST_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_cluster_models(code_id: str):
+    """
+    Charge (avec cache en mémoire) la version courante des modèles d'un code.
+    Le cache est invalidé dès que LATEST désigne une nouvelle version.
+
+    Returns:
+        tuple | None: (version, reducer, clusterer), ou None si aucun modèle n'existe.
+    """
+    version = latest_version(code_id)
+    if version is None:
+        return None
+    with _loaded_lock:
+        cached = _loaded.get(code_id)
+        if cached is None or cached[0] != version:
+            logging.info(f"Chargement des modèles de clustering du code '{code_id}' (version {version})...")
+            models = joblib.load(os.path.join(_code_dir(code_id), version, "models.joblib"))
+            cached = (version, models["reducer"], models["clusterer"])
+            _loaded[code_id] = cached
+        return cached
+
+
+def assign_clusters(code_id: str, vectors) -> np.ndarray:
+    """
+    Affecte un cluster à de nouveaux vecteurs sans réajuster les modèles :
+    projection par `reducer.transform` puis prédiction approchée HDBSCAN.
+
+    Returns:
+        np.ndarray | None: les labels (-1 pour le bruit), ou None si le code n'a pas de modèle.
+    """
+    import hdbscan
+
+    loaded = load_cluster_models(code_id)
+    if loaded is None:
+        return None
+    _, reducer, clusterer = loaded
+    reduced = reducer.transform(np.asarray(vectors, dtype=np.float32))
+    labels, _ = hdbscan.approximate_predict(clusterer, reduced)
+    return np.asarray(labels, dtype=np.int64)
@@ -0,0 +1,144 @@
+import os
+import time
+import logging
+from qdrant_client import models
+
+
+# Nom servi par l'API et les scripts : un alias qui désigne la version courante de la
+# collection (voir app/collection_versions.py).
+COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "articles_chunked")
+
+# Schéma de la collection `articles_chunked` et paramètres de recherche associés.
+#
+# Par défaut, les vecteurs originaux (float32) sont stockés sur disque et seule leur
+# version quantifiée int8 (4x plus petite) reste en RAM pour parcourir le graphe HNSW ;
+# les meilleurs candidats sont ensuite re-classés (rescore) avec les vecteurs originaux.
+COLLECTION_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "scalar")  # none, scalar ou binary
+COLLECTION_SCALAR_QUANTILE = float(os.getenv("QDRANT_SCALAR_QUANTILE", "0.99"))
+COLLECTION_QUANTIZATION_ALWAYS_RAM = os.getenv("QDRANT_QUANTIZATION_ALWAYS_RAM", "1") == "1"
+COLLECTION_VECTORS_ON_DISK = os.getenv("QDRANT_VECTORS_ON_DISK", "1") == "1"
+COLLECTION_HNSW_M = int(os.getenv("QDRANT_HNSW_M", "16"))
+COLLECTION_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "100"))
+COLLECTION_HNSW_ON_DISK = os.getenv("QDRANT_HNSW_ON_DISK", "0") == "1"
+# Degré des sous-graphes HNSW construits par valeur de `code_parent` (clé de tenant) :
+# une recherche filtrée sur un code ne parcourt que le sous-graphe de ce code.
+COLLECTION_HNSW_PAYLOAD_M = int(os.getenv("QDRANT_HNSW_PAYLOAD_M", str(COLLECTION_HNSW_M)))
+
+SEARCH_HNSW_EF = int(os.getenv("QDRANT_SEARCH_HNSW_EF", "128"))
+SEARCH_RESCORE = os.getenv("QDRANT_SEARCH_RESCORE", "1") == "1"
+SEARCH_OVERSAMPLING = float(os.getenv("QDRANT_SEARCH_OVERSAMPLING", "2.0"))
+
+QUANTIZATION_MODES = ("none", "scalar", "binary")
+
+
+def quantization_config(mode: str = None, always_ram: bool = None):
+    """Configuration de quantification de la collection (None si désactivée)."""
+    mode = mode or COLLECTION_QUANTIZATION
+    always_ram = COLLECTION_QUANTIZATION_ALWAYS_RAM if always_ram is None else always_ram
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Quantification inconnue : '{mode}' (attendu : {', '.join(QUANTIZATION_MODES)}).")
+    if mode == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=COLLECTION_SCALAR_QUANTILE,
+                always_ram=always_ram,
+            )
+        )
+    if mode == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=always_ram))
+    return None
+
+
+def hnsw_config(m: int = None, ef_construct: int = None) -> models.HnswConfigDiff:
+    return models.HnswConfigDiff(
+        m=m or COLLECTION_HNSW_M,
+        ef_construct=ef_construct or COLLECTION_HNSW_EF_CONSTRUCT,
+        on_disk=COLLECTION_HNSW_ON_DISK,
+        payload_m=COLLECTION_HNSW_PAYLOAD_M,
+    )
+
+
+def vectors_config(vector_size: int, on_disk: bool = None) -> models.VectorParams:
+    return models.VectorParams(
+        size=vector_size,
+        distance=models.Distance.COSINE,
+        on_disk=COLLECTION_VECTORS_ON_DISK if on_disk is None else on_disk,
+    )
+
+
+def collection_schema(vector_size: int, quantization: str = None, on_disk: bool = None, m: int = None, ef_construct: int = None) -> dict:
+    """
+    Arguments de `create_collection` pour la collection des chunks
+    (valeurs par défaut : variables d'environnement QDRANT_*).
+    """
+    return {
+        "vectors_config": vectors_config(vector_size, on_disk),
+        "hnsw_config": hnsw_config(m, ef_construct),
+        "quantization_config": quantization_config(quantization),
+    }
+
+
+def payload_indexes() -> dict:
+    """
+    Index de payload des filtres utilisés par l'API et les scripts : `code_parent`
+    (filtre de /search et de run_clustering, déclaré clé de tenant pour que Qdrant
+    regroupe les points de chaque code), `original_id` (filtre MatchAny de
+    /clusters_for_articles) et `cluster_id` (entier).
+    """
+    return {
+        "code_parent": models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True),
+        "original_id": models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD),
+        "cluster_id": models.IntegerIndexParams(type=models.IntegerIndexType.INTEGER, lookup=True, range=False),
+    }
+
+
+def ensure_payload_indexes(client, collection_name: str) -> None:
+    """Crée les index de payload absents de la collection."""
+    existing = client.get_collection(collection_name).payload_schema or {}
+    for field_name, field_schema in payload_indexes().items():
+        if field_name in existing:
+            continue
+        logging.info(f"Création de l'index de payload '{field_name}' sur la collection '{collection_name}'...")
+        client.create_payload_index(collection_name=collection_name, field_name=field_name, field_schema=field_schema, wait=True)
+
+
+def wait_for_green(client, collection_name: str, timeout: float = 600) -> bool:
+    """Attend que Qdrant ait fini d'indexer la collection (statut vert)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if client.get_collection(collection_name).status == models.CollectionStatus.GREEN:
+            return True
+        time.sleep(1)
+    logging.warning(f"La collection '{collection_name}' n'est pas entièrement indexée après {timeout}s.")
+    return False
+
+
+def update_collection_schema(client, collection_name: str) -> None:
+    """
+    Applique la configuration courante (quantification, stockage sur disque, HNSW) à une
+    collection existante ; Qdrant reconstruit les index concernés en arrière-plan.
+    """
+    quantization = quantization_config()
+    logging.info(f"Mise à jour du schéma de la collection '{collection_name}' (quantification : {COLLECTION_QUANTIZATION}, vecteurs sur disque : {COLLECTION_VECTORS_ON_DISK}).")
+    client.update_collection(
+        collection_name=collection_name,
+        vectors_config={"": models.VectorParamsDiff(on_disk=COLLECTION_VECTORS_ON_DISK)},
+        hnsw_config=hnsw_config(),
+        quantization_config=quantization if quantization is not None else models.Disabled.DISABLED,
+    )
+
+
+def search_params(hnsw_ef: int = None, rescore: bool = None, oversampling: float = None, exact: bool = False) -> models.SearchParams:
+    """
+    Paramètres de recherche : largeur de la recherche HNSW et, si la collection est
+    quantifiée, sur-échantillonnage des candidats puis re-classement avec les vecteurs originaux.
+    """
+    return models.SearchParams(
+        hnsw_ef=hnsw_ef or SEARCH_HNSW_EF,
+        exact=exact,
+        quantization=models.QuantizationSearchParams(
+            rescore=SEARCH_RESCORE if rescore is None else rescore,
+            oversampling=oversampling or SEARCH_OVERSAMPLING,
+        ),
+    )
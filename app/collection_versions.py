@@ -0,0 +1,201 @@
+import os
+import re
+import time
+import logging
+from qdrant_client import models
+
+
+# Réindexation blue/green : chaque reconstruction complète remplit une nouvelle collection
+# versionnée (`articles_chunked_v<date>`) pendant que l'alias `articles_chunked` continue de
+# servir l'ancienne, puis l'alias est basculé atomiquement vers la nouvelle version.
+REINDEX_MIN_POINTS_RATIO = float(os.getenv("REINDEX_MIN_POINTS_RATIO", "0.9"))
+REINDEX_CHECK_SAMPLES = int(os.getenv("REINDEX_CHECK_SAMPLES", "20"))
+REINDEX_MIN_SELF_RECALL = float(os.getenv("REINDEX_MIN_SELF_RECALL", "0.9"))
+# Chunks identiques (ex. "(Abrogé)") : leurs points sont à égalité en tête de l'auto-recherche.
+REINDEX_SELF_RECALL_TIES = int(os.getenv("REINDEX_SELF_RECALL_TIES", "10"))
+REINDEX_SCORE_TOLERANCE = float(os.getenv("REINDEX_SCORE_TOLERANCE", "1e-3"))
+REINDEX_INDEX_TIMEOUT = float(os.getenv("REINDEX_INDEX_TIMEOUT", "3600"))
+REINDEX_KEEP_VERSIONS = int(os.getenv("REINDEX_KEEP_VERSIONS", "1"))  # versions précédentes conservées pour le rollback
+PUBLISHED_MARKER_SUFFIX = "_published"
+LEGACY_VERSION_SUFFIX = "_v00000000T000000"  # copie de l'ancienne collection non versionnée, première cible de rollback
+COPY_PAGE_SIZE = 1000
+
+
+def new_version_name(alias: str) -> str:
+    return f"{alias}_v{time.strftime('%Y%m%dT%H%M%S')}"
+
+
+def resolve_alias(client, alias: str):
+    """Collection actuellement désignée par l'alias (None si l'alias n'existe pas)."""
+    for description in client.get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+
+def list_versions(client, alias: str) -> list:
+    """Collections versionnées de l'alias, de la plus ancienne à la plus récente."""
+    pattern = re.compile(rf"^{re.escape(alias)}_v\d{{8}}T\d{{6}}$")
+    return sorted(c.name for c in client.get_collections().collections if pattern.match(c.name))
+
+
+def published_marker(collection_name: str) -> str:
+    """
+    Alias témoin posé sur chaque version que l'alias principal a désignée : seules ces
+    versions servent de cible au rollback (une version rejetée ou interrompue n'en a pas).
+    """
+    return f"{collection_name}{PUBLISHED_MARKER_SUFFIX}"
+
+
+def published_versions(client, alias: str) -> list:
+    """Versions que l'alias a effectivement servies, de la plus ancienne à la plus récente."""
+    aliases = {description.alias_name for description in client.get_aliases().aliases}
+    return [name for name in list_versions(client, alias) if published_marker(name) in aliases]
+
+
+def delete_version(client, collection_name: str) -> None:
+    """Supprime une version et son alias témoin éventuel."""
+    aliases = {description.alias_name for description in client.get_aliases().aliases}
+    if published_marker(collection_name) in aliases:
+        client.update_collection_aliases(change_aliases_operations=[
+            models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=published_marker(collection_name)))
+        ])
+    client.delete_collection(collection_name)
+
+
+def validate_collection(client, collection_name: str, previous: str = None,
+                        min_ratio: float = REINDEX_MIN_POINTS_RATIO, samples: int = REINDEX_CHECK_SAMPLES,
+                        min_self_recall: float = REINDEX_MIN_SELF_RECALL):
+    """
+    Contrôle une nouvelle version avant bascule : elle ne doit pas être vide, doit contenir
+    au moins `min_ratio` fois le nombre de points de la version servie, et quelques points
+    tirés de la collection doivent se retrouver eux-mêmes en tête de leur propre recherche.
+    Un point dont le texte est dupliqué est retrouvé s'il figure parmi les premiers résultats
+    à égalité de score, ou si le premier résultat a un score de 1 (vecteur identique).
+
+    Returns:
+        (ok, report): le verdict et les mesures effectuées.
+    """
+    report = {"points": client.count(collection_name=collection_name, exact=True).count}
+    problems = []
+    if report["points"] == 0:
+        problems.append("collection vide")
+    if previous:
+        report["previous_points"] = client.count(collection_name=previous, exact=True).count
+        if report["points"] < min_ratio * report["previous_points"]:
+            problems.append(f"{report['points']} points contre {report['previous_points']} dans '{previous}'")
+
+    if samples and report["points"]:
+        points, _ = client.scroll(collection_name=collection_name, limit=samples, with_payload=False, with_vectors=True)
+        found = 0
+        for point in points:
+            hits = client.query_points(collection_name=collection_name, query=point.vector, limit=REINDEX_SELF_RECALL_TIES, with_payload=False).points
+            found += bool(hits) and _is_self_hit(point.id, hits)
+        report["self_recall"] = round(found / len(points), 3) if points else None
+        if points and report["self_recall"] < min_self_recall:
+            problems.append(f"auto-recherche à {report['self_recall']:.0%}")
+
+    report["problems"] = problems
+    return not problems, report
+
+
+def _is_self_hit(point_id, hits) -> bool:
+    if hits[0].score >= 1.0 - REINDEX_SCORE_TOLERANCE:
+        return True
+    return any(hit.id == point_id for hit in hits if hit.score >= hits[0].score - REINDEX_SCORE_TOLERANCE)
+
+
+def preserve_legacy_collection(client, alias: str) -> str:
+    """
+    Copie l'ancienne collection non versionnée `alias` (vecteurs et payloads) dans la
+    version `alias_v00000000T000000`, qui reste ainsi disponible pour un rollback une fois
+    l'ancienne collection remplacée par l'alias.
+
+    Returns:
+        str: le nom de la copie.
+    """
+    from app.collection import ensure_payload_indexes
+
+    legacy = f"{alias}{LEGACY_VERSION_SUFFIX}"
+    if client.collection_exists(legacy):
+        client.delete_collection(legacy)
+    client.create_collection(collection_name=legacy, vectors_config=client.get_collection(alias).config.params.vectors)
+    ensure_payload_indexes(client, legacy)
+    offset = None
+    copied = 0
+    while True:
+        page, offset = client.scroll(collection_name=alias, limit=COPY_PAGE_SIZE, offset=offset, with_payload=True, with_vectors=True)
+        if page:
+            client.upload_collection(
+                collection_name=legacy,
+                vectors=[point.vector for point in page],
+                payload=[point.payload for point in page],
+                ids=[point.id for point in page],
+                wait=True
+            )
+            copied += len(page)
+        if offset is None or not page:
+            break
+    logging.info(f"Ancienne collection '{alias}' copiée dans '{legacy}' ({copied} points).")
+    return legacy
+
+
+def switch_alias(client, alias: str, collection_name: str) -> None:
+    """
+    Fait pointer l'alias vers `collection_name` en une seule opération atomique, qui pose
+    aussi l'alias témoin de publication sur l'ancienne et la nouvelle version.
+
+    Une ancienne collection physique portant le nom de l'alias (installation antérieure
+    aux versions) ne peut pas coexister avec lui : elle est d'abord copiée en version
+    publiée `alias_v00000000T000000` (cible du rollback), puis supprimée juste avant la
+    création de l'alias, une fois la copie et la nouvelle version prêtes.
+    """
+    current = resolve_alias(client, alias)
+    legacy = current is None and client.collection_exists(alias)
+    if legacy:
+        current = preserve_legacy_collection(client, alias)
+    aliases = {description.alias_name for description in client.get_aliases().aliases}
+    operations = []
+    if alias in aliases:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    operations.append(models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias)))
+    for name in {current, collection_name} - {None}:
+        if published_marker(name) not in aliases:
+            operations.append(models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name=name, alias_name=published_marker(name))))
+    if legacy:
+        logging.warning(f"Remplacement de l'ancienne collection non versionnée '{alias}' par un alias.")
+        client.delete_collection(alias)
+    client.update_collection_aliases(change_aliases_operations=operations)
+    logging.info(f"Alias '{alias}' basculé vers '{collection_name}'.")
+
+
+def prune_versions(client, alias: str, keep: int = REINDEX_KEEP_VERSIONS) -> list:
+    """
+    Supprime les versions plus anciennes que la version servie : celles que l'alias n'a
+    jamais servies (rejetées ou interrompues), et les versions publiées au-delà des
+    `keep` plus récentes.
+    """
+    current = resolve_alias(client, alias)
+    published = set(published_versions(client, alias))
+    older = [name for name in list_versions(client, alias) if current is None or name < current]
+    older_published = [name for name in older if name in published]
+    removed = [name for name in older if name not in published] + older_published[:max(0, len(older_published) - keep)]
+    for name in sorted(removed):
+        logging.info(f"Suppression de l'ancienne version '{name}'.")
+        delete_version(client, name)
+    return sorted(removed)
+
+
+def rollback(client, alias: str) -> str:
+    """
+    Rebascule l'alias vers la dernière version publiée avant la version servie.
+
+    Returns:
+        str: la collection désormais servie.
+    """
+    current = resolve_alias(client, alias)
+    previous = [name for name in published_versions(client, alias) if current is None or name < current]
+    if not previous:
+        raise RuntimeError(f"Aucune version antérieure à '{current}' disponible pour l'alias '{alias}'.")
+    switch_alias(client, alias, previous[-1])
+    return previous[-1]
@@ -0,0 +1,208 @@
+import os
+import re
+import json
+import fcntl
+import hashlib
+import logging
+import threading
+import numpy as np
+from typing import List, Tuple
+
+
+EMBEDDING_STORE_DIR = os.getenv(
+    "EMBEDDING_STORE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "embedding_store")
+)
+
+KEY_SIZE = 16  # octets de l'empreinte SHA-256 conservés par texte
+
+
+def text_key(text: str) -> bytes:
+    """Empreinte binaire d'un texte, utilisée comme clé du stockage."""
+    return hashlib.sha256(text.encode("utf-8")).digest()[:KEY_SIZE]
+
+
+class EmbeddingStore:
+    """
+    Stockage disque des embeddings adressé par contenu, pour un couple (modèle, mode de préfixe).
+
+    Les vecteurs sont ajoutés à la suite dans `vectors.f32` (float32 brut, lisible en memmap)
+    et leurs clés, dans le même ordre, dans `keys.bin`. L'index clé -> ligne est reconstruit
+    en mémoire à l'ouverture. Les écritures sont protégées par un verrou de fichier : l'ETL
+    et le benchmark peuvent partager le même répertoire.
+    """
+
+    def __init__(self, model_name: str, prefix_mode: str = "none", root_dir: str = EMBEDDING_STORE_DIR):
+        safe_model = re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+        self.directory = os.path.join(root_dir, safe_model, prefix_mode)
+        os.makedirs(self.directory, exist_ok=True)
+        self.keys_path = os.path.join(self.directory, "keys.bin")
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.meta_path = os.path.join(self.directory, "meta.json")
+        self.lock_path = os.path.join(self.directory, ".lock")
+        self.dim = None
+        self._index = {}
+        self._rows = 0
+        self._memmap = None
+        self._lock = threading.Lock()
+        with self._lock, self._file_lock():
+            self._load_meta()
+            self._repair()
+            self._refresh()
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _file_lock(self):
+        return _FileLock(self.lock_path)
+
+    def _load_meta(self) -> None:
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+
+    def _disk_rows(self) -> int:
+        if self.dim is None:
+            return 0
+        n_keys = os.path.getsize(self.keys_path) // KEY_SIZE if os.path.exists(self.keys_path) else 0
+        n_vectors = os.path.getsize(self.vectors_path) // (self.dim * 4) if os.path.exists(self.vectors_path) else 0
+        return min(n_keys, n_vectors)
+
+    def _repair(self) -> None:
+        # Après une écriture interrompue, les deux fichiers peuvent être désalignés :
+        # on les tronque au dernier enregistrement complet.
+        if self.dim is None:
+            return
+        rows = self._disk_rows()
+        for path, row_size in ((self.keys_path, KEY_SIZE), (self.vectors_path, self.dim * 4)):
+            if os.path.exists(path) and os.path.getsize(path) != rows * row_size:
+                logging.warning(f"Stockage d'embeddings incohérent, troncature de {path} à {rows} lignes.")
+                with open(path, "r+b") as f:
+                    f.truncate(rows * row_size)
+
+    def _refresh(self) -> None:
+        """Indexe les lignes ajoutées sur disque depuis la dernière lecture (éventuellement par un autre processus)."""
+        rows = self._disk_rows()
+        if rows <= self._rows:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._rows * KEY_SIZE)
+            data = f.read((rows - self._rows) * KEY_SIZE)
+        for i in range(rows - self._rows):
+            self._index.setdefault(data[i * KEY_SIZE:(i + 1) * KEY_SIZE], self._rows + i)
+        self._rows = rows
+        self._memmap = None
+
+    def _vectors(self) -> np.ndarray:
+        if self._memmap is None:
+            self._memmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+        return self._memmap
+
+    def lookup(self, texts: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """
+        Cherche les textes dans le stockage.
+
+        Returns:
+            (rows, missing): l'indice de ligne de chaque texte (-1 si absent)
+            et les positions des textes absents.
+        """
+        with self._lock:
+            self._refresh()
+            rows = np.array([self._index.get(text_key(t), -1) for t in texts], dtype=np.int64)
+        missing = np.flatnonzero(rows < 0).tolist()
+        return rows, missing
+
+    def read(self, rows: np.ndarray) -> np.ndarray:
+        """Lit les vecteurs des lignes demandées (copie float32 contiguë)."""
+        with self._lock:
+            return np.array(self._vectors()[rows], dtype=np.float32)
+
+    def add(self, texts: List[str], vectors) -> None:
+        """Ajoute des vecteurs au stockage (les textes déjà présents sont ignorés)."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(texts) == 0:
+            return
+        with self._lock, self._file_lock():
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim}, f)
+            self._refresh()
+            keys, new_rows = [], []
+            seen = set()
+            for i, text in enumerate(texts):
+                key = text_key(text)
+                if key in self._index or key in seen:
+                    continue
+                seen.add(key)
+                keys.append(key)
+                new_rows.append(i)
+            if not keys:
+                return
+            # Vecteurs d'abord, clés ensuite : une clé n'est jamais visible sans son vecteur.
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors[new_rows].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(keys))
+            for offset, key in enumerate(keys):
+                self._index[key] = self._rows + offset
+            self._rows += len(keys)
+            self._memmap = None
+
+
+class _FileLock:
+    """Verrou exclusif inter-processus sur un fichier (fcntl)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_CREAT | os.O_RDWR)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(model_name: str, prefix_mode: str = "none") -> EmbeddingStore:
+    """Retourne (en le créant au besoin) le stockage associé à un modèle et un mode de préfixe."""
+    key = (model_name, prefix_mode)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = EmbeddingStore(model_name, prefix_mode, EMBEDDING_STORE_DIR)
+        return _stores[key]
+
+
+def encode_with_store(texts: List[str], model_name: str, prefix_mode: str, encode_fn) -> np.ndarray:
+    """
+    Retourne les embeddings des textes en ne calculant (via `encode_fn`) que ceux
+    absents du stockage ; les nouveaux vecteurs y sont ajoutés.
+    """
+    store = get_store(model_name, prefix_mode)
+    if not texts:
+        return np.empty((0, store.dim or 0), dtype=np.float32)
+    rows, missing = store.lookup(texts)
+    logging.info(f"Stockage d'embeddings : {len(texts) - len(missing)} vecteurs réutilisés, {len(missing)} à calculer.")
+
+    computed = None
+    if missing:
+        computed = np.asarray(encode_fn([texts[i] for i in missing]), dtype=np.float32)
+        store.add([texts[i] for i in missing], computed)
+
+    dim = store.dim if store.dim is not None else computed.shape[1]
+    vectors = np.empty((len(texts), dim), dtype=np.float32)
+    found = np.flatnonzero(rows >= 0)
+    if len(found):
+        vectors[found] = store.read(rows[found])
+    if missing:
+        vectors[missing] = computed
+    return vectors
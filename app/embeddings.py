@@ -1,6 +1,18 @@
-from sentence_transformers import SentenceTransformer
-from typing import List
+from prometheus_client import Counter, Histogram
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, TYPE_CHECKING
+import numpy as np
+import atexit
 import logging
+import os
+import queue
+import re
+import threading
+import time
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
 
 logging.basicConfig(level=logging.INFO,
@@ -11,53 +23,432 @@ logging.basicConfig(level=logging.INFO,
                     ])
 
 _models = {}
+_models_lock = threading.Lock()
 
 
 DEFAULT_MODEL = "OrdalieTech/Solon-embeddings-large-0.1"
 
+# Backend d'inférence sentence-transformers ("torch", "onnx" ou "openvino") et
+# quantification optionnelle ("none" ou "int8", dynamique, backend onnx uniquement).
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "none")
+ONNX_QUANTIZATION_CONFIG = os.getenv("ONNX_QUANTIZATION_CONFIG", "avx512_vnni")
+EMBEDDING_EXPORT_DIR = os.getenv(
+    "EMBEDDING_EXPORT_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "exported_models")
+)
+EXPORTED_FILES = {"onnx": "onnx/model.onnx", "openvino": "openvino/openvino_model.xml"}
+
+QUERY_CACHE_MAX_SIZE = int(os.getenv("QUERY_CACHE_MAX_SIZE", "10000"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+
+QUERY_CACHE_HITS = Counter("embedding_query_cache_hits_total", "Embeddings servis depuis le cache des requêtes.")
+QUERY_CACHE_MISSES = Counter("embedding_query_cache_misses_total", "Embeddings absents du cache des requêtes.")
+QUERY_CACHE_EVICTIONS = Counter("embedding_query_cache_evictions_total", "Entrées évincées du cache (taille ou TTL).")
 
-def load_model(model_name: str = DEFAULT_MODEL) -> SentenceTransformer:
+
+class QueryEmbeddingCache:
+    """
+    Cache LRU borné avec expiration (TTL) pour les embeddings de requêtes.
+    Thread-safe : les threads Flask partagent la même instance.
+    """
+
+    def __init__(self, max_size: int = QUERY_CACHE_MAX_SIZE, ttl_seconds: float = QUERY_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                QUERY_CACHE_MISSES.inc()
+                return None
+            expires_at, vector = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                QUERY_CACHE_EVICTIONS.inc()
+                QUERY_CACHE_MISSES.inc()
+                return None
+            self._entries.move_to_end(key)
+            QUERY_CACHE_HITS.inc()
+            return vector
+
+    def put(self, key, vector) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                QUERY_CACHE_EVICTIONS.inc()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_query_cache = QueryEmbeddingCache()
+
+
+# Encodage multi-processus des gros lots (ETL, benchmark) : les textes sont répartis par
+# paquets de EMBEDDING_POOL_CHUNK_SIZE entre EMBEDDING_PROCESSES processus (démarrés en
+# spawn), chacun limité à EMBEDDING_THREADS_PER_PROCESS threads. Les lots de moins de
+# EMBEDDING_POOL_MIN_TEXTS textes restent encodés dans le processus courant.
+EMBEDDING_PROCESSES = os.getenv("EMBEDDING_PROCESSES", "0")  # 0 : désactivé, auto : tous les cœurs
+EMBEDDING_THREADS_PER_PROCESS = int(os.getenv("EMBEDDING_THREADS_PER_PROCESS", "2"))
+EMBEDDING_POOL_MIN_TEXTS = int(os.getenv("EMBEDDING_POOL_MIN_TEXTS", "256"))
+EMBEDDING_POOL_CHUNK_SIZE = int(os.getenv("EMBEDDING_POOL_CHUNK_SIZE", "64"))
+
+
+def encode_process_count(setting: str = None) -> int:
+    """Nombre de processus d'encodage configuré ("auto" : un processus par groupe de threads)."""
+    from app.parallel import default_worker_count
+    setting = str(setting or EMBEDDING_PROCESSES)
+    if setting == "auto":
+        return default_worker_count(EMBEDDING_THREADS_PER_PROCESS)
+    return int(setting)
+
+
+class EncodePool:
+    """
+    Pool multi-processus sentence-transformers d'un modèle, démarré au premier gros lot.
+    Les files du pool étant partagées, un seul appel à `encode` s'exécute à la fois.
+    """
+
+    def __init__(self, model: "SentenceTransformer", processes: int, threads_per_process: int = EMBEDDING_THREADS_PER_PROCESS,
+                 min_texts: int = EMBEDDING_POOL_MIN_TEXTS, chunk_size: int = EMBEDDING_POOL_CHUNK_SIZE):
+        self.model = model
+        self.processes = processes
+        self.threads_per_process = threads_per_process
+        self.min_texts = min_texts
+        self.chunk_size = chunk_size
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        from app.parallel import thread_env
+        logging.info(f"Démarrage du pool d'encodage : {self.processes} processus, {self.threads_per_process} thread(s) chacun.")
+        start_time = time.perf_counter()
+        with thread_env(self.threads_per_process):
+            self._pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.processes)
+        logging.info(f"Pool d'encodage démarré en {time.perf_counter() - start_time:.1f}s.")
+
+    def encode(self, texts: List[str], **encode_kwargs) -> np.ndarray:
+        with self._lock:
+            if self._pool is None:
+                self._start()
+            encode_kwargs.setdefault("show_progress_bar", False)
+            return self.model.encode(texts, pool=self._pool, chunk_size=self.chunk_size, **encode_kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self.model.stop_multi_process_pool(self._pool)
+                self._pool = None
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_encode_pool(model_name: str = DEFAULT_MODEL):
+    """Pool d'encodage du modèle (None si EMBEDDING_PROCESSES < 2)."""
+    processes = encode_process_count()
+    if processes < 2:
+        return None
+    key = (model_name, EMBEDDING_BACKEND, EMBEDDING_QUANTIZATION, os.getpid())
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = EncodePool(load_model(model_name), processes)
+        return _pools[key]
+
+
+@atexit.register
+def stop_encode_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "1") == "1"
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "5"))
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "32"))
+
+MICROBATCH_SIZE = Histogram(
+    "embedding_microbatch_size", "Nombre de requêtes regroupées par appel à encode.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+MICROBATCH_WAIT_SECONDS = Histogram(
+    "embedding_microbatch_wait_seconds", "Attente de la première requête d'un lot avant l'appel à encode.",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+
+
+class MicroBatcher:
+    """
+    Regroupe les textes soumis en parallèle par les threads Flask et les vectorise
+    en un seul appel à `model.encode`. Un lot part dès qu'il atteint `max_batch_size`
+    ou que la première requête a attendu `max_wait_ms`.
+    """
+
+    def __init__(self, model_name: str, max_batch_size: int = MICROBATCH_MAX_SIZE, max_wait_ms: float = MICROBATCH_MAX_WAIT_MS):
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, text: str) -> Future:
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def _ensure_worker(self) -> None:
+        # Le thread ne survit pas à un fork : on le relance dans chaque processus.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=f"microbatch-{self.model_name}", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            MICROBATCH_SIZE.observe(len(batch))
+            MICROBATCH_WAIT_SECONDS.observe(time.monotonic() - batch[0][2])
+            try:
+                vectors = load_model(self.model_name).encode([text for text, _, _ in batch])
+            except Exception as e:
+                logging.error(f"Erreur lors de l'encodage d'un micro-lot : {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(model_name: str = DEFAULT_MODEL) -> MicroBatcher:
+    """Retourne le micro-batcher associé à un modèle (créé à la demande)."""
+    with _batchers_lock:
+        if model_name not in _batchers:
+            _batchers[model_name] = MicroBatcher(model_name)
+        return _batchers[model_name]
+
+
+def normalize_query(text: str) -> str:
+    """Normalise une requête pour la clé de cache (espaces superflus supprimés)."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def load_model(model_name: str = DEFAULT_MODEL, backend: str = None, quantization: str = None) -> "SentenceTransformer":
     """
     Charge et met en cache le modèle SentenceTransformer.
+
+    Args:
+        model_name (str): Le nom du modèle Hugging Face.
+        backend (str): "torch", "onnx" ou "openvino" (EMBEDDING_BACKEND par défaut).
+        quantization (str): "none" ou "int8" (EMBEDDING_QUANTIZATION par défaut).
     """
-    if model_name not in _models:
-        logging.info(f"Chargement du modèle {model_name}...")
-        _models[model_name] = SentenceTransformer(model_name)
+    backend = backend or EMBEDDING_BACKEND
+    quantization = quantization or EMBEDDING_QUANTIZATION
+    key = (model_name, backend, quantization)
+    if key not in _models:
+        with _models_lock:
+            if key not in _models:
+                logging.info(f"Chargement du modèle {model_name} (backend={backend}, quantization={quantization})...")
+                _models[key] = _build_model(model_name, backend, quantization)
     logging.info(f"Modèle {model_name} chargé depuis le cache.")
-    return _models[model_name]
+    return _models[key]
+
+
+def model_identity(model_name: str = DEFAULT_MODEL) -> str:
+    """Nom du modèle qualifié par le backend et la quantification actifs (les vecteurs en dépendent)."""
+    if EMBEDDING_BACKEND == "torch" and EMBEDDING_QUANTIZATION == "none":
+        return model_name
+    return f"{model_name}@{EMBEDDING_BACKEND}-{EMBEDDING_QUANTIZATION}"
+
+
+def _build_model(model_name: str, backend: str, quantization: str) -> "SentenceTransformer":
+    # Import différé : sentence_transformers/torch ne sont chargés que si un modèle est réellement utilisé.
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in ("torch", "onnx", "openvino"):
+        raise ValueError(f"Backend d'inférence inconnu : {backend}")
+    if quantization not in ("none", "int8"):
+        raise ValueError(f"Quantification inconnue : {quantization}")
+    if quantization == "int8" and backend != "onnx":
+        raise ValueError("La quantification int8 dynamique n'est disponible qu'avec le backend onnx.")
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+
+    # Les modèles exportés sont mis en cache dans le volume model_cache : l'export
+    # (et la quantification) n'a lieu qu'au premier chargement.
+    export_dir = os.path.join(EMBEDDING_EXPORT_DIR, re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name), backend)
+    if not os.path.exists(os.path.join(export_dir, EXPORTED_FILES[backend])):
+        logging.info(f"Export du modèle {model_name} vers {backend} dans {export_dir}...")
+        exported = SentenceTransformer(model_name, backend=backend)
+        exported.save_pretrained(export_dir)
+    file_name = EXPORTED_FILES[backend]
+
+    if quantization == "int8":
+        file_name = f"onnx/model_qint8_{ONNX_QUANTIZATION_CONFIG}.onnx"
+        if not os.path.exists(os.path.join(export_dir, file_name)):
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+            logging.info(f"Quantification int8 dynamique ({ONNX_QUANTIZATION_CONFIG}) du modèle {model_name}...")
+            export_dynamic_quantized_onnx_model(
+                SentenceTransformer(export_dir, backend="onnx"),
+                quantization_config=ONNX_QUANTIZATION_CONFIG,
+                model_name_or_path=export_dir
+            )
+    return SentenceTransformer(export_dir, backend=backend, model_kwargs={"file_name": file_name})
 
 
-def get_embedding(text: str, model_name: str = DEFAULT_MODEL, is_query: bool = False) -> List[float]:
+def check_backend_quality(texts: List[str], model_name: str = DEFAULT_MODEL, backend: str = None,
+                          quantization: str = None, k: int = 10) -> dict:
+    """
+    Compare les vecteurs d'un backend (et d'une quantification) à la référence torch fp32 :
+    similarité cosinus texte à texte et recouvrement des top-k voisins (chaque texte servant
+    de requête sur l'ensemble des autres), ainsi que le gain de temps d'encodage.
+    """
+    def encode(model):
+        start_time = time.perf_counter()
+        vectors = np.asarray(model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+        return vectors, time.perf_counter() - start_time
+
+    reference, reference_time = encode(load_model(model_name, "torch", "none"))
+    candidate, candidate_time = encode(load_model(model_name, backend, quantization))
+
+    cosines = np.sum(reference * candidate, axis=1)
+    k = max(1, min(k, len(texts) - 1))
+    reference_sim = reference @ reference.T
+    candidate_sim = candidate @ candidate.T
+    np.fill_diagonal(reference_sim, -np.inf)
+    np.fill_diagonal(candidate_sim, -np.inf)
+    reference_top = np.argsort(-reference_sim, axis=1)[:, :k]
+    candidate_top = np.argsort(-candidate_sim, axis=1)[:, :k]
+    overlaps = [len(set(r) & set(c)) / k for r, c in zip(reference_top, candidate_top)]
+
+    return {
+        "backend": backend or EMBEDDING_BACKEND,
+        "quantization": quantization or EMBEDDING_QUANTIZATION,
+        "n_texts": len(texts),
+        "cosine_mean": float(cosines.mean()),
+        "cosine_min": float(cosines.min()),
+        "k": k,
+        "topk_overlap": float(np.mean(overlaps)),
+        "speedup": reference_time / candidate_time if candidate_time > 0 else None,
+    }
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """Copie float32 des vecteurs ramenés à une norme L2 de 1 (un vecteur nul reste nul)."""
+    vectors = np.array(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def get_embedding(text: str, model_name: str = DEFAULT_MODEL, is_query: bool = False, normalize: bool = False) -> np.ndarray:
     """
     Retourne le vecteur embedding pour UN SEUL texte.
     
     Args:
-        text (str): Le texte à vectoriser.
+        text (str): Le texte à vectoriser (normalisé par normalize_query, comme la clé de cache).
         model_name (str): Le nom du modèle Hugging Face.
         is_query (bool): Mettre à True si le texte est une requête de recherche.
+        normalize (bool): Renvoie le vecteur normalisé (norme L2 de 1).
+
+    Returns:
+        np.ndarray: vecteur float32 de forme (dim,), en lecture seule (partagé avec le cache).
     """
-    logging.info(f"Génération d'un embedding pour un texte (is_query={is_query})...")
-    if is_query:
-        text = "query: " + text
-        
-    model = load_model(model_name)
-    logging.info("Embedding généré avec succès.")
-    return model.encode(text).tolist()
+    text = normalize_query(text)
+    cache_key = (model_name, is_query, text)
+    vector = _query_cache.get(cache_key)
+    if vector is not None:
+        logging.info(f"Embedding servi depuis le cache (is_query={is_query}).")
+    else:
+        logging.info(f"Génération d'un embedding pour un texte (is_query={is_query})...")
+        if is_query:
+            text = "query: " + text
+
+        if MICROBATCH_ENABLED:
+            vector = get_batcher(model_name).submit(text).result()
+        else:
+            vector = load_model(model_name).encode(text)
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        _query_cache.put(cache_key, vector)
+        logging.info("Embedding généré avec succès.")
+    return l2_normalize(vector) if normalize else vector
 
 
-def get_embeddings_batch(texts: List[str], model_name: str = DEFAULT_MODEL, is_query: bool = False) -> List[List[float]]:
+def get_embeddings_batch(texts: List[str], model_name: str = DEFAULT_MODEL, is_query: bool = False,
+                         use_store: bool = False, normalize: bool = False) -> np.ndarray:
     """
-    Retourne une liste de vecteurs embeddings pour une LISTE de textes.
+    Retourne les vecteurs embeddings d'une LISTE de textes.
     
     Args:
         texts (List[str]): La liste de textes à vectoriser.
         model_name (str): Le nom du modèle Hugging Face.
         is_query (bool): Mettre à True si les textes sont des requêtes de recherche.
+        use_store (bool): Réutilise les vecteurs du stockage disque (app.embedding_store)
+            et n'encode que les textes absents.
+        normalize (bool): Renvoie des vecteurs normalisés (norme L2 de 1).
+
+    Returns:
+        np.ndarray: matrice float32 contiguë de forme (len(texts), dim).
     """
     logging.info(f"Génération d'embeddings pour un lot de {len(texts)} textes (is_query={is_query})...")
+    if use_store:
+        from app.embedding_store import encode_with_store
+        vectors = encode_with_store(
+            texts, model_identity(model_name), "query" if is_query else "none",
+            lambda missing: _encode_texts(missing, model_name, is_query)
+        )
+    else:
+        vectors = _encode_texts(texts, model_name, is_query)
+    logging.info("Embeddings générés avec succès.")
+    if normalize:
+        return l2_normalize(vectors)
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def _encode_texts(texts: List[str], model_name: str, is_query: bool):
+    from app.chunking import encode_length_bucketed
+
     if is_query:
         texts = ["query: " + t for t in texts]
-        
     model = load_model(model_name)
-    logging.info("Embeddings générés avec succès.")
-    return model.encode(texts).tolist()
\ No newline at end of file
+    vectors, _ = encode_length_bucketed(model, texts, pool=get_encode_pool(model_name))
+    return vectors
+
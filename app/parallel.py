@@ -0,0 +1,87 @@
+import os
+import logging
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "NUMBA_NUM_THREADS",
+)
+
+
+def limit_worker_threads(n_threads: int) -> None:
+    """
+    Plafonne les pools de threads natifs (BLAS/OpenMP, numba) du processus courant,
+    pour que plusieurs workers ne se disputent pas les mêmes cœurs.
+    """
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(n_threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=n_threads)
+    except ImportError:
+        pass
+    try:
+        import numba
+        numba.set_num_threads(min(n_threads, numba.config.NUMBA_NUM_THREADS))
+    except ImportError:
+        pass
+
+
+def default_worker_count(threads_per_worker: int) -> int:
+    """Nombre de workers qui occupe tous les cœurs sans surallocation."""
+    return max(1, (os.cpu_count() or 1) // max(1, threads_per_worker))
+
+
+def worker_pool(max_workers: int, threads_per_worker: int) -> ProcessPoolExecutor:
+    """
+    Crée un pool de processus (démarrage `spawn`) dont chaque worker est limité à
+    `threads_per_worker` threads natifs dès son initialisation. Le processus parent
+    n'est pas affecté.
+    """
+    logging.info(f"Pool de {max_workers} workers, {threads_per_worker} thread(s) chacun.")
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=limit_worker_threads,
+        initargs=(threads_per_worker,),
+    )
+
+
+def limit_torch_threads(n_threads: int) -> None:
+    """
+    Plafonne les threads intra-op de torch (et des bibliothèques BLAS/OpenMP) du processus
+    courant. Appelé dans chaque worker du serveur après le fork.
+    """
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(n_threads)
+    try:
+        import torch
+        torch.set_num_threads(n_threads)
+    except ImportError:
+        pass
+
+
+@contextmanager
+def thread_env(n_threads: int):
+    """
+    Fixe temporairement les variables d'environnement des pools de threads natifs :
+    les processus démarrés (spawn) dans ce bloc en héritent dès l'import de torch/numpy,
+    sans que les threads du processus courant ne soient modifiés.
+    """
+    saved = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(n_threads)
+    try:
+        yield
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
@@ -0,0 +1,85 @@
+import os
+import logging
+import threading
+import httpx
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+
+QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
+QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+# gRPC (protobuf) est nettement plus rapide que REST/JSON pour transférer des vecteurs.
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "0") == "1"
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "60"))
+
+# Pool de connexions HTTP (REST) : par défaut qdrant-client ne garde aucune connexion ouverte.
+QDRANT_MAX_CONNECTIONS = int(os.getenv("QDRANT_MAX_CONNECTIONS", "100"))
+QDRANT_MAX_KEEPALIVE = int(os.getenv("QDRANT_MAX_KEEPALIVE", "20"))
+QDRANT_KEEPALIVE_EXPIRY = float(os.getenv("QDRANT_KEEPALIVE_EXPIRY", "30"))
+# Taille maximale d'un message gRPC : une page de scroll avec vecteurs dépasse vite la limite de 4 Mo.
+QDRANT_GRPC_MAX_MESSAGE_MB = int(os.getenv("QDRANT_GRPC_MAX_MESSAGE_MB", "256"))
+
+
+def client_options() -> dict:
+    """Paramètres communs aux clients Qdrant synchrone et asynchrone."""
+    max_message = QDRANT_GRPC_MAX_MESSAGE_MB * 1024 * 1024
+    return {
+        "host": QDRANT_HOST,
+        "port": QDRANT_PORT,
+        "grpc_port": QDRANT_GRPC_PORT,
+        "prefer_grpc": QDRANT_PREFER_GRPC,
+        "timeout": QDRANT_TIMEOUT,
+        "limits": httpx.Limits(
+            max_connections=QDRANT_MAX_CONNECTIONS,
+            max_keepalive_connections=QDRANT_MAX_KEEPALIVE,
+            keepalive_expiry=QDRANT_KEEPALIVE_EXPIRY,
+        ),
+        "grpc_options": {
+            "grpc.max_send_message_length": max_message,
+            "grpc.max_receive_message_length": max_message,
+            "grpc.keepalive_time_ms": int(QDRANT_KEEPALIVE_EXPIRY * 1000),
+            "grpc.keepalive_permit_without_calls": 1,
+        },
+    }
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> QdrantClient:
+    """
+    Client Qdrant partagé par tout le processus, créé à la première utilisation.
+    Un nouveau client est créé après un fork : les connexions (surtout gRPC)
+    ne se partagent pas entre processus.
+    """
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            transport = "gRPC" if QDRANT_PREFER_GRPC else "REST"
+            logging.info(f"Connexion à Qdrant {QDRANT_HOST} ({transport}, timeout {QDRANT_TIMEOUT}s)...")
+            _client = QdrantClient(**client_options())
+            _client_pid = os.getpid()
+    return _client
+
+
+def get_async_client() -> AsyncQdrantClient:
+    """Nouveau client Qdrant asynchrone (lié à la boucle asyncio qui l'utilise)."""
+    return AsyncQdrantClient(**client_options())
+
+
+class LazyQdrantClient:
+    """
+    Référence différée vers le client partagé : les modules l'exposent sous le nom
+    `client` sans ouvrir de connexion à l'import ; chaque attribut est résolu sur
+    `get_client()` au moment de l'appel.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_client(), name)
+
+
+client = LazyQdrantClient()
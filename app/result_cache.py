@@ -0,0 +1,164 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from prometheus_client import Counter
+from app.cluster_index import current_version as current_cluster_version, write_atomic
+
+
+# Cache sémantique des résultats de /search : une requête dont le vecteur est à une
+# similarité cosinus d'au moins RESULT_CACHE_THRESHOLD d'une requête récente (même
+# code_id, même limit) reçoit la liste de résultats de celle-ci sans interroger Qdrant.
+# Le cache est vidé dès que la génération de l'index (publiée par startup.py) ou celle
+# des clusters (publiée par run_clustering.py) change.
+RESULT_CACHE_THRESHOLD = float(os.getenv("RESULT_CACHE_THRESHOLD", "0.97"))
+RESULT_CACHE_ENTRIES_PER_SCOPE = int(os.getenv("RESULT_CACHE_ENTRIES_PER_SCOPE", "256"))  # 0 pour désactiver
+RESULT_CACHE_MAX_SCOPES = int(os.getenv("RESULT_CACHE_MAX_SCOPES", "512"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "600"))
+RESULT_CACHE_CHECK_INTERVAL = float(os.getenv("RESULT_CACHE_CHECK_INTERVAL", "5"))
+INDEX_GENERATION_FILE = os.getenv(
+    "INDEX_GENERATION_FILE",
+    os.path.join(os.path.expanduser("~"), ".cache", "index_generation")
+)
+
+RESULT_CACHE_HITS = Counter("search_result_cache_hits_total", "Recherches servies depuis le cache sémantique des résultats.")
+RESULT_CACHE_MISSES = Counter("search_result_cache_misses_total", "Recherches absentes du cache sémantique des résultats.")
+RESULT_CACHE_SAVED_SECONDS = Counter(
+    "search_result_cache_saved_qdrant_seconds_total",
+    "Temps d'appel à Qdrant économisé par le cache (durée mesurée de la recherche mise en cache)."
+)
+RESULT_CACHE_INVALIDATIONS = Counter(
+    "search_result_cache_invalidations_total", "Vidages du cache après un changement de génération de l'index ou des clusters."
+)
+
+
+def publish_index_generation() -> str:
+    """
+    Publie une nouvelle génération de l'index après une modification de la collection,
+    pour que les processus de l'API vident leur cache de résultats.
+
+    Returns:
+        str: la nouvelle génération.
+    """
+    generation = f"{time.time_ns()}"
+    os.makedirs(os.path.dirname(INDEX_GENERATION_FILE), exist_ok=True)
+    write_atomic(INDEX_GENERATION_FILE, generation)
+    logging.info(f"Génération de l'index publiée : {generation}.")
+    return generation
+
+
+def current_index_generation():
+    """Génération courante de l'index (None si elle n'a jamais été publiée)."""
+    try:
+        with open(INDEX_GENERATION_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class _Scope:
+    """Tampon circulaire des requêtes récentes d'un couple (code_id, limit)."""
+
+    def __init__(self, capacity: int, dim: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.expires_at = np.zeros(capacity)  # 0 : emplacement libre
+        self.results = [None] * capacity
+        self.costs = [0.0] * capacity
+        self.next = 0
+
+
+class SemanticResultCache:
+    """
+    Cache approximatif des résultats de recherche, indexé par le vecteur de la requête.
+    Thread-safe : les threads Flask et la boucle de /async/search partagent la même instance.
+    """
+
+    def __init__(self, threshold: float = RESULT_CACHE_THRESHOLD, entries_per_scope: int = RESULT_CACHE_ENTRIES_PER_SCOPE,
+                 max_scopes: int = RESULT_CACHE_MAX_SCOPES, ttl_seconds: float = RESULT_CACHE_TTL_SECONDS,
+                 check_interval: float = RESULT_CACHE_CHECK_INTERVAL):
+        self.threshold = threshold
+        self.entries_per_scope = entries_per_scope
+        self.max_scopes = max_scopes
+        self.ttl_seconds = ttl_seconds
+        self.check_interval = check_interval
+        self.generation = None
+        self._scopes = OrderedDict()
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _check_generation(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        generation = (current_index_generation(), current_cluster_version())
+        with self._lock:
+            self._checked_at = now
+            if generation == self.generation:
+                return
+            if self._scopes:
+                RESULT_CACHE_INVALIDATIONS.inc()
+                logging.info(f"Cache des résultats vidé : nouvelle génération de l'index ou des clusters {generation}.")
+            self._scopes.clear()
+            self.generation = generation
+
+    def get(self, vector, code_id, limit: int):
+        """
+        Returns:
+            list | None: les résultats mis en cache de la requête la plus proche, si sa
+            similarité cosinus atteint le seuil ; None sinon.
+        """
+        if self.entries_per_scope <= 0:
+            return None
+        self._check_generation()
+        query = self._normalize(vector)
+        with self._lock:
+            scope = self._scopes.get((code_id, limit))
+            if scope is not None and scope.vectors.shape[1] == query.shape[0]:
+                similarities = scope.vectors @ query
+                similarities[scope.expires_at < time.monotonic()] = -np.inf
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._scopes.move_to_end((code_id, limit))
+                    RESULT_CACHE_HITS.inc()
+                    RESULT_CACHE_SAVED_SECONDS.inc(scope.costs[best])
+                    return scope.results[best]
+        RESULT_CACHE_MISSES.inc()
+        return None
+
+    def put(self, vector, code_id, limit: int, results: list, cost_seconds: float = 0.0) -> None:
+        """Mémorise les résultats d'une requête et la durée de l'appel Qdrant qu'ils ont coûté."""
+        if self.entries_per_scope <= 0:
+            return
+        self._check_generation()
+        query = self._normalize(vector)
+        with self._lock:
+            key = (code_id, limit)
+            scope = self._scopes.get(key)
+            if scope is None or scope.vectors.shape[1] != query.shape[0]:
+                scope = self._scopes[key] = _Scope(self.entries_per_scope, query.shape[0])
+            self._scopes.move_to_end(key)
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+            slot = scope.next
+            scope.vectors[slot] = query
+            scope.expires_at[slot] = time.monotonic() + self.ttl_seconds
+            scope.results[slot] = results
+            scope.costs[slot] = cost_seconds
+            scope.next = (slot + 1) % self.entries_per_scope
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scopes.clear()
+            self.generation = None
+            self._checked_at = 0.0
+
+
+result_cache = SemanticResultCache()
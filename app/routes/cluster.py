@@ -1,9 +1,13 @@
 import os
-from flask import Blueprint, jsonify,request
-from qdrant_client import QdrantClient, models
+import json
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from qdrant_client import models
+from app.qdrant import client
+from app.collection import COLLECTION_NAME
 from app.auth import require_api_key
-from collections import Counter
-import itertools
+from app.cluster_index import ArticleClusterIndex, dominant_clusters
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 import traceback
 import logging
 
@@ -17,59 +21,119 @@ logging.basicConfig(level=logging.INFO,
 
 clusters_bp = Blueprint('clusters_bp', __name__)
 
-QDRANT_HOST = os.getenv("QDRANT_HOST")
-QDRANT_PORT = int(os.getenv("QDRANT_PORT"))
-COLLECTION_NAME = "articles_chunked"
-client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+article_cluster_index = ArticleClusterIndex()
 
-@clusters_bp.route('/clusters_for_articles', methods=['POST'])
-@require_api_key()
-def get_clusters_for_articles():
+SHARD_SIZE = int(os.getenv("CLUSTERS_SHARD_SIZE", "500"))
+SCROLL_PAGE_SIZE = int(os.getenv("CLUSTERS_SCROLL_PAGE_SIZE", "2000"))
+SCROLL_WORKERS = int(os.getenv("CLUSTERS_SCROLL_WORKERS", "4"))
+scroll_executor = ThreadPoolExecutor(max_workers=SCROLL_WORKERS, thread_name_prefix="clusters-scroll")
+
+# Codes entiers réservés pour un `cluster_id` absent (-1, comme avant) ou explicitement nul.
+MISSING_CLUSTER = -1
+NULL_CLUSTER = np.iinfo(np.int64).min
+
+
+def scroll_shard(article_ids: list):
     """
-    Reçoit une liste d'ID d'articles et renvoie leur cluster dominant.
+    Parcourt (avec pagination complète) les chunks d'un lot d'articles et renvoie
+    deux colonnes : l'article de chaque chunk et son cluster encodé en entier.
     """
-    data = request.get_json()
-    if not data or 'article_ids' not in data:
-        return jsonify({"error": "La liste 'article_ids' est requise"}), 400
-
-    article_ids = data['article_ids']
-    logging.info(f"Requête reçue pour trouver les clusters de {len(article_ids)} articles.")
-    
-    try:
-        logging.info(f"Récupération des chunks pour les articles : {article_ids}")
-        response, _ = client.scroll(
+    chunk_articles = []
+    chunk_clusters = []
+    offset = None
+    while True:
+        page, offset = client.scroll(
             collection_name=COLLECTION_NAME,
             scroll_filter=models.Filter(
                 must=[
                     models.FieldCondition(key="original_id", match=models.MatchAny(any=article_ids))
                 ]
             ),
-            limit=len(article_ids) * 20,
+            limit=SCROLL_PAGE_SIZE,
+            offset=offset,
             with_payload=["original_id", "cluster_id"],
             with_vectors=False
         )
-        if not response:
+        for point in page:
+            payload = point.payload or {}
+            article_id = payload.get('original_id')
+            if not article_id:
+                continue
+            cluster_id = payload.get('cluster_id', MISSING_CLUSTER)
+            chunk_articles.append(article_id)
+            chunk_clusters.append(NULL_CLUSTER if cluster_id is None else cluster_id)
+        if offset is None or not page:
+            break
+    return chunk_articles, np.array(chunk_clusters, dtype=np.int64)
+
+
+def clusters_for_shard(article_ids: list) -> dict:
+    """Cluster dominant de chaque article d'un lot (les chunks d'un article sont tous dans le même lot)."""
+    chunk_articles, chunk_clusters = scroll_shard(article_ids)
+    result = dominant_clusters(chunk_articles, chunk_clusters)
+    return {article_id: (None if cluster_id == NULL_CLUSTER else cluster_id) for article_id, cluster_id in result.items()}
+
+
+def submit_shards(article_ids: list) -> list:
+    """Découpe les articles en lots de SHARD_SIZE et lance leur parcours en parallèle."""
+    unique_ids = list(dict.fromkeys(article_ids))
+    shards = [unique_ids[i:i + SHARD_SIZE] for i in range(0, len(unique_ids), SHARD_SIZE)]
+    logging.info(f"Récupération des chunks de {len(unique_ids)} articles en {len(shards)} lots parallèles...")
+    return [scroll_executor.submit(clusters_for_shard, shard) for shard in shards]
+
+
+def stream_clusters(found: dict, article_ids: list):
+    """Génère la réponse NDJSON : d'abord les articles de l'index, puis chaque lot dès qu'il est terminé."""
+    for article_id, cluster_id in found.items():
+        yield json.dumps({"article_id": article_id, "cluster_id": cluster_id}) + "\n"
+    if not article_ids:
+        return
+    try:
+        for future in as_completed(submit_shards(article_ids)):
+            for article_id, cluster_id in future.result().items():
+                yield json.dumps({"article_id": article_id, "cluster_id": cluster_id}) + "\n"
+    except Exception as e:
+        logging.error(f"Erreur lors du streaming des clusters : {e}")
+        yield json.dumps({"error": str(e)}) + "\n"
+
+
+@clusters_bp.route('/clusters_for_articles', methods=['POST'])
+@require_api_key()
+def get_clusters_for_articles():
+    """
+    Reçoit une liste d'ID d'articles et renvoie leur cluster dominant.
+
+    Les articles présents dans l'index précalculé par run_clustering sont servis
+    directement depuis la mémoire ; seuls les autres sont recherchés dans Qdrant,
+    par lots parcourus en parallèle. Avec {"stream": true} (ou l'en-tête
+    `Accept: application/x-ndjson`), la réponse est envoyée en NDJSON au fil des lots.
+    """
+    data = request.get_json()
+    if not data or 'article_ids' not in data:
+        return jsonify({"error": "La liste 'article_ids' est requise"}), 400
+
+    requested_ids = data['article_ids']
+    stream = bool(data.get('stream')) or 'application/x-ndjson' in request.headers.get('Accept', '')
+    logging.info(f"Requête reçue pour trouver les clusters de {len(requested_ids)} articles.")
+
+    try:
+        found, article_ids = article_cluster_index.lookup(requested_ids)
+        logging.info(f"{len(found)} articles servis par l'index précalculé, {len(article_ids)} à rechercher.")
+        if stream:
+            return Response(stream_with_context(stream_clusters(found, article_ids)), mimetype='application/x-ndjson')
+
+        live_clusters = {}
+        if article_ids:
+            for future in submit_shards(article_ids):
+                live_clusters.update(future.result())
+        if not live_clusters and not found:
             logging.error("Aucun chunk trouvé dans la base de données.")
             return jsonify({"error": "No chunks found for this code"}), 404
-        
-        logging.info(f"{len(response)} chunks récupérés. Début de l'agrégation...")
-        points_sorted = sorted(response, key=lambda p: p.payload.get('original_id'))
-
-        clusters_by_article = {}
-        for article_id, group in itertools.groupby(points_sorted, key=lambda p: p.payload.get('original_id')):
-            if article_id:
-                clusters_by_article[article_id] = [point.payload.get('cluster_id', -1) for point in group]
-
-        dominant_clusters = {}
-        for article_id, cluster_list in clusters_by_article.items():
-            if not cluster_list:
-                dominant_clusters[article_id] = -1
-            else:
-                most_common = Counter(cluster_list).most_common(1)[0]
-                dominant_clusters[article_id] = most_common[0]
+
+        found.update(live_clusters)
         logging.info("Calcul des clusters dominants terminé.")
-        return jsonify(dominant_clusters), 200
+        return jsonify(found), 200
     except Exception as e:
         logging.error(f"Erreur lors du traitement des clusters : {e}")
-        traceback.print_exc() 
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
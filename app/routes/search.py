@@ -1,7 +1,11 @@
 import os
+import time
 from flask import Blueprint, request, jsonify
-from qdrant_client import QdrantClient,models
-from app.embeddings import get_embedding 
+from qdrant_client import models
+from app.qdrant import client
+from app.collection import COLLECTION_NAME, search_params
+from app.embeddings import get_embedding, get_embeddings_batch
+from app.result_cache import result_cache
 from app.auth import require_api_key
 import logging
 
@@ -16,13 +20,38 @@ logging.basicConfig(level=logging.INFO,
 search_bp = Blueprint('search_bp', __name__)
 
 
-QDRANT_HOST = os.getenv("QDRANT_HOST")
-QDRANT_PORT = os.getenv("QDRANT_PORT")
-COLLECTION_NAME = "articles_chunked"
+SEARCH_BATCH_MAX_ITEMS = int(os.getenv("SEARCH_BATCH_MAX_ITEMS", "256"))
 
 
-client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+def build_code_filter(code_id):
+    """Construit le filtre Qdrant sur `code_parent` (None si aucun code n'est demandé)."""
+    if not code_id:
+        return None
+    logging.info(f"Application d'un filtre pour le code_id : {code_id}")
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="code_parent",
+                match=models.MatchValue(value=code_id),
+            )
+        ]
+    )
+
 
+def format_hits(points) -> list:
+    """Met en forme les points renvoyés par Qdrant au format de réponse de /search."""
+    results = []
+    for hit in points:
+        payload = hit.payload or {}
+        results.append({
+          
+            "id": payload.get("original_id"), 
+            "score": hit.score,
+            "num": payload.get("title"), 
+            "code_parent": payload.get("code_parent"),
+            "highlight": payload.get("chunk_text") 
+        })
+    return results
 
 
 @search_bp.route('/search', methods=['POST'])
@@ -44,42 +73,78 @@ def semantic_search():
         logging.info(f"Vectorisation de la requête : '{user_query}'")
         query_vector = get_embedding(user_query, is_query=True)
 
-        search_filter = None
-        if code_id:
-            logging.info(f"Application d'un filtre pour le code_id : {code_id}")
-            search_filter = models.Filter(
-                must=[
-                    models.FieldCondition(
-                        key="code_parent",
-                        match=models.MatchValue(value=code_id),
-                    )
-                ]
-            )
+        cached = result_cache.get(query_vector, code_id, limit)
+        if cached is not None:
+            logging.info(f"Résultats servis depuis le cache sémantique. {len(cached)} résultats trouvés.")
+            return jsonify(cached), 200
+
+        search_filter = build_code_filter(code_id)
 
         logging.info("Recherche des points similaires dans Qdrant...")
+        start_time = time.perf_counter()
         search_result = client.query_points(
             collection_name=COLLECTION_NAME,
             query=query_vector,
             query_filter=search_filter, 
+            search_params=search_params(),
             limit=limit,
             with_payload=True
         )
         
-        results = []
-        for hit in search_result.points:
-            payload = hit.payload or {}
-            results.append({
-              
-                "id": payload.get("original_id"), 
-                "score": hit.score,
-                "num": payload.get("title"), 
-                "code_parent": payload.get("code_parent"),
-                "highlight": payload.get("chunk_text") 
-            })
+        results = format_hits(search_result.points)
+        result_cache.put(query_vector, code_id, limit, results, time.perf_counter() - start_time)
         
         logging.info(f"Recherche terminée. {len(results)} résultats trouvés.")
         return jsonify(results), 200
 
     except Exception as e:
         logging.error(f"Erreur lors de la recherche sémantique : {e}")
-        return jsonify({"error": "Une erreur interne est survenue"}), 500
\ No newline at end of file
+        return jsonify({"error": "Une erreur interne est survenue"}), 500
+
+
+@search_bp.route('/search/batch', methods=['POST'])
+@require_api_key()
+def semantic_search_batch():
+    """
+    Endpoint de recherche sémantique par lot : toutes les requêtes sont vectorisées
+    en un seul appel au modèle puis envoyées à Qdrant en une seule requête batch.
+    Exemple: {"queries": [{"query": "...", "code_id": "LEGITEXT000006071307", "limit": 5}, ...]}
+    Renvoie une liste de résultats (même format que /search) par requête, dans l'ordre.
+    """
+    data = request.get_json()
+    items = data.get('queries') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "La requête doit contenir une liste non vide 'queries'"}), 400
+    if len(items) > SEARCH_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Au plus {SEARCH_BATCH_MAX_ITEMS} requêtes par lot"}), 400
+    if not all(isinstance(item, dict) and 'query' in item for item in items):
+        return jsonify({"error": "Chaque élément de 'queries' doit contenir une clé 'query'"}), 400
+
+    try:
+        logging.info(f"Vectorisation d'un lot de {len(items)} requêtes...")
+        query_vectors = get_embeddings_batch([item['query'] for item in items], is_query=True)
+
+        query_requests = [
+            models.QueryRequest(
+                query=vector,
+                filter=build_code_filter(item.get('code_id')),
+                params=search_params(),
+                limit=item.get('limit', 10),
+                with_payload=True
+            )
+            for item, vector in zip(items, query_vectors)
+        ]
+
+        logging.info("Recherche batch des points similaires dans Qdrant...")
+        batch_results = client.query_batch_points(
+            collection_name=COLLECTION_NAME,
+            requests=query_requests
+        )
+
+        results = [format_hits(response.points) for response in batch_results]
+        logging.info(f"Recherche batch terminée pour {len(results)} requêtes.")
+        return jsonify(results), 200
+
+    except Exception as e:
+        logging.error(f"Erreur lors de la recherche sémantique par lot : {e}")
+        return jsonify({"error": "Une erreur interne est survenue"}), 500
@@ -0,0 +1,127 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+from app import auth
+from app.qdrant import get_async_client
+from app.collection import COLLECTION_NAME, search_params
+from app.embeddings import get_embedding
+from app.result_cache import result_cache
+from app.routes.search import build_code_filter, format_hits
+
+
+# Nombre de vectorisations exécutées en parallèle (le CPU est la ressource limitante),
+# nombre maximal d'appels Qdrant simultanés et délai maximal d'une recherche.
+ASYNC_INFERENCE_WORKERS = int(os.getenv("ASYNC_INFERENCE_WORKERS", "2"))
+ASYNC_QDRANT_MAX_IN_FLIGHT = int(os.getenv("ASYNC_QDRANT_MAX_IN_FLIGHT", "64"))
+ASYNC_SEARCH_TIMEOUT = float(os.getenv("ASYNC_SEARCH_TIMEOUT", "30"))
+# Threads qui exécutent les routes Flask (WSGI) montées derrière l'application ASGI.
+WSGI_THREADS = int(os.getenv("WEB_THREADS", "4"))
+
+
+class AsyncSearcher:
+    """
+    Ressources de la recherche asynchrone d'un worker : client Qdrant asynchrone,
+    exécuteur d'inférence borné et sémaphore des appels Qdrant en vol. Elles sont
+    créées au démarrage de la boucle du worker (lifespan ASGI), donc après le fork.
+    """
+
+    def __init__(self, inference_workers: int = ASYNC_INFERENCE_WORKERS, max_in_flight: int = ASYNC_QDRANT_MAX_IN_FLIGHT):
+        self.inference_workers = inference_workers
+        self.max_in_flight = max_in_flight
+        self.client = None
+        self.executor = None
+        self.semaphore = None
+
+    def start(self) -> None:
+        self.client = get_async_client()
+        self.executor = ThreadPoolExecutor(max_workers=self.inference_workers, thread_name_prefix="async-inference")
+        self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        logging.info(f"Recherche asynchrone prête ({self.inference_workers} threads d'inférence, {self.max_in_flight} appels Qdrant simultanés max).")
+
+    async def stop(self) -> None:
+        if self.client is not None:
+            await self.client.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    async def search(self, query: str, code_id=None, limit: int = 10) -> list:
+        loop = asyncio.get_running_loop()
+        query_vector = await loop.run_in_executor(self.executor, lambda: get_embedding(query, is_query=True))
+
+        cached = result_cache.get(query_vector, code_id, limit)
+        if cached is not None:
+            return cached
+
+        start_time = time.perf_counter()
+        async with self.semaphore:
+            search_result = await self.client.query_points(
+                collection_name=COLLECTION_NAME,
+                query=query_vector,
+                query_filter=build_code_filter(code_id),
+                search_params=search_params(),
+                limit=limit,
+                with_payload=True
+            )
+        results = format_hits(search_result.points)
+        result_cache.put(query_vector, code_id, limit, results, time.perf_counter() - start_time)
+        return results
+
+
+searcher = AsyncSearcher()
+
+
+async def async_semantic_search(request):
+    """
+    Variante asynchrone de /search (même requête, même réponse), servie directement par
+    la boucle du worker : vectorisation dans l'exécuteur d'inférence borné et appel Qdrant
+    via le client asynchrone, sans bloquer de thread pendant l'attente.
+    Exemple: {"query": "...", "code_id": "LEGITEXT000006071307"}
+    """
+    if request.headers.get('x-api-key') != auth.API_KEY:
+        return JSONResponse({"error": "Clé API invalide ou manquante."}, status_code=403)
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or 'query' not in data:
+        return JSONResponse({"error": "La requête doit contenir une clé 'query'"}, status_code=400)
+
+    try:
+        results = await asyncio.wait_for(
+            searcher.search(data['query'], data.get('code_id'), data.get('limit', 10)),
+            timeout=ASYNC_SEARCH_TIMEOUT
+        )
+        logging.info(f"Recherche asynchrone terminée. {len(results)} résultats trouvés.")
+        return JSONResponse(results)
+    except Exception as e:
+        logging.error(f"Erreur lors de la recherche sémantique asynchrone : {e!r}")
+        return JSONResponse({"error": "Une erreur interne est survenue"}, status_code=500)
+
+
+def create_asgi_app(flask_app):
+    """
+    Application ASGI du serveur : /async/search est servi nativement en asyncio, toutes
+    les autres routes sont transmises à l'application Flask (exécutée dans WSGI_THREADS threads).
+    """
+    @asynccontextmanager
+    async def lifespan(app):
+        searcher.start()
+        try:
+            yield
+        finally:
+            await searcher.stop()
+
+    return Starlette(
+        routes=[
+            Route('/async/search', async_semantic_search, methods=['POST']),
+            Mount('/', app=WSGIMiddleware(flask_app, workers=WSGI_THREADS)),
+        ],
+        lifespan=lifespan,
+    )
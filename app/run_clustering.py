@@ -1,28 +1,87 @@
 import os
+import json
+import time
+import argparse
+import tempfile
 import numpy as np
-import umap.umap_ as umap
-import hdbscan
 import logging
-from qdrant_client import QdrantClient, models
+from dataclasses import dataclass, field
+from qdrant_client import models
+from app.qdrant import client
+from app.collection import COLLECTION_NAME
+from app.cluster_models import save_cluster_models
+from app.cluster_index import dominant_clusters, publish_article_clusters
+from app.parallel import default_worker_count, limit_worker_threads, worker_pool
+from concurrent.futures import as_completed
 
 
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler("Clustering.log", mode='w'), # 'w' pour écraser le log à chaque lancement
-                        logging.StreamHandler()
-                    ])
+CLUSTERING_LOG_FILE = "Clustering.log"
+FETCH_PAGE_SIZE = int(os.getenv("CLUSTERING_FETCH_PAGE_SIZE", "2000"))
+# Au-delà de ce volume, les vecteurs sont écrits dans un fichier mappé en mémoire plutôt qu'en RAM.
+MEMMAP_THRESHOLD_BYTES = int(os.getenv("CLUSTERING_MEMMAP_THRESHOLD_MB", "1024")) * 1024 * 1024
+MEMMAP_DIR = os.getenv("CLUSTERING_MEMMAP_DIR", tempfile.gettempdir())
 
+SET_PAYLOAD_BATCH_SIZE = int(os.getenv("CLUSTERING_SET_PAYLOAD_BATCH_SIZE", "2000"))
+OPERATIONS_PER_REQUEST = int(os.getenv("CLUSTERING_OPERATIONS_PER_REQUEST", "16"))
 
-QDRANT_HOST = os.getenv("QDRANT_HOST")
-QDRANT_PORT = int(os.getenv("QDRANT_PORT"))
-COLLECTION_NAME = "articles_chunked"
+CLUSTERING_JOBS_CONFIG = os.getenv("CLUSTERING_JOBS_CONFIG", "clustering_jobs.json")
+CLUSTERING_SUMMARY_PATH = os.getenv("CLUSTERING_SUMMARY_PATH", "clustering_summary.json")
+POINT_ID_DTYPE = "U36"  # identifiants de points : UUID textuels
 
-client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT,timeout=60)
 
-def fetch_points_by_code(collection_name: str, code_id: str):
+def setup_logging(mode: str = "a") -> None:
+    """
+    Journalise dans Clustering.log et sur la console. Le lancement écrase le fichier ('w') ;
+    les workers (démarrés en `spawn`, qui réimportent ce module) y ajoutent leurs lignes ('a').
+    """
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[
+                            logging.FileHandler(CLUSTERING_LOG_FILE, mode=mode),
+                            logging.StreamHandler()
+                        ])
+
+
+@dataclass
+class CodePoints:
+    """
+    Points d'un code stockés en colonnes typées, sans objet Python par point : identifiants
+    (POINT_ID_DTYPE), matrice float32 des vecteurs (éventuellement un memmap) et un tableau
+    de chaînes à largeur fixe par champ de payload conservé ("" si le champ est absent).
+    """
+    ids: np.ndarray
+    vectors: np.ndarray
+    payload: dict = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def _allocate_vectors(n_rows: int, dim: int) -> np.ndarray:
+    """Alloue la matrice des vecteurs, en RAM ou dans un fichier temporaire mappé si elle est volumineuse."""
+    if n_rows * dim * 4 <= MEMMAP_THRESHOLD_BYTES:
+        return np.empty((n_rows, dim), dtype=np.float32)
+    logging.info(f"Allocation des vecteurs dans un memmap ({n_rows * dim * 4 / 1024**2:.0f} Mo) sous {MEMMAP_DIR}.")
+    with tempfile.NamedTemporaryFile(dir=MEMMAP_DIR, prefix="vectors_", suffix=".f32", delete=False) as f:
+        path = f.name
+    vectors = np.memmap(path, dtype=np.float32, mode="w+", shape=(n_rows, dim))
+    os.unlink(path)  # le fichier disparaît avec le dernier mapping
+    return vectors
+
+
+def _grow(array: np.ndarray, n_rows: int) -> np.ndarray:
+    """Agrandit un tableau si des points ont été ajoutés pendant le parcours."""
+    grown = _allocate_vectors(n_rows, array.shape[1]) if array.ndim == 2 else np.empty(n_rows, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def fetch_points_by_code(collection_name: str, code_id: str, payload_fields: list = ()) -> CodePoints:
     """
     Récupère tous les points (avec vecteurs et payloads) pour un code de loi spécifique.
+
+    Le scroll est suivi page par page jusqu'au bout ; les vecteurs sont copiés directement
+    dans une matrice float32 préallouée et seuls les champs de payload demandés sont conservés.
     """
     logging.info(f"Étape 1/4 : Récupération des points pour le code '{code_id}'...")
     
@@ -34,18 +93,54 @@ def fetch_points_by_code(collection_name: str, code_id: str):
             )
         ]
     )
-    
-  
-    all_points = client.scroll(
-        collection_name=collection_name,
-        scroll_filter=scroll_filter,
-        limit=10000, 
-        with_payload=True, 
-        with_vectors=True
-    )[0] 
-
-    logging.info(f"{len(all_points)} points récupérés pour le code '{code_id}'.")
-    return all_points
+
+    capacity = client.count(collection_name=collection_name, count_filter=scroll_filter, exact=True).count
+    ids = np.empty(capacity, dtype=POINT_ID_DTYPE)
+    columns = {name: np.empty(capacity, dtype="U1") for name in payload_fields}  # élargies au besoin
+    vectors = None
+    n_rows = 0
+    offset = None
+
+    while True:
+        page, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=scroll_filter,
+            limit=FETCH_PAGE_SIZE,
+            offset=offset,
+            with_payload=list(payload_fields) if payload_fields else False,
+            with_vectors=True
+        )
+        if not page:
+            break
+        if vectors is None:
+            vectors = _allocate_vectors(max(capacity, len(page)), len(page[0].vector))
+        end = n_rows + len(page)
+        if end > len(ids):
+            new_capacity = max(end, 2 * len(ids))
+            ids = _grow(ids, new_capacity)
+            columns = {name: _grow(column, new_capacity) for name, column in columns.items()}
+            vectors = _grow(vectors, new_capacity)
+        ids[n_rows:end] = [str(point.id) for point in page]
+        vectors[n_rows:end] = [point.vector for point in page]
+        payloads = [point.payload or {} for point in page]
+        for name in columns:
+            values = np.array([str(payload.get(name) or "") for payload in payloads])
+            if values.dtype.itemsize > columns[name].dtype.itemsize:
+                columns[name] = columns[name].astype(values.dtype)
+            columns[name][n_rows:end] = values
+        n_rows = end
+        if offset is None:
+            break
+
+    if vectors is None:
+        vectors = np.empty((0, 0), dtype=np.float32)
+    points = CodePoints(
+        ids=ids[:n_rows],
+        vectors=vectors[:n_rows],
+        payload={name: column[:n_rows] for name, column in columns.items()}
+    )
+    logging.info(f"{len(points)} points récupérés pour le code '{code_id}'.")
+    return points
 
 def main(code_id: str, umap_params: dict, hdbscan_params: dict):
     """
@@ -54,12 +149,16 @@ def main(code_id: str, umap_params: dict, hdbscan_params: dict):
     """
     logging.info(f"--- Démarrage du clustering pour le code : {code_id} ---")
     
-    points = fetch_points_by_code(COLLECTION_NAME, code_id)
-    if not points:
+    points = fetch_points_by_code(COLLECTION_NAME, code_id, payload_fields=["original_id"])
+    if not len(points):
         logging.warning(f"Aucun point trouvé pour le code {code_id}. Le traitement est ignoré.")
         return
         
-    vectors = np.array([p.vector for p in points])
+    vectors = points.vectors
+
+    # Imports différés : umap/numba ne sont chargés que par les workers qui ajustent un modèle.
+    import umap.umap_ as umap
+    import hdbscan
 
     logging.info("Étape 2/4 : Réduction de dimensionnalité avec UMAP...")
     reducer = umap.UMAP(
@@ -92,66 +191,172 @@ def main(code_id: str, umap_params: dict, hdbscan_params: dict):
     except Exception as e:
         logging.warning(f"Impossible de calculer le score DBCV : {e}")
 
-    logging.info("Étape 4/4 : Préparation de la mise à jour non-destructive...")
-    
-    points_to_update = []
-    for point, label in zip(points, cluster_labels):
-     
-        payload_base = point.payload or {}
-        
-        updated_payload = {
-            "chunk_text": payload_base.get("chunk_text"),
-            "chunk_index": payload_base.get("chunk_index"),
-            "title": payload_base.get("title"),
-            "original_id": payload_base.get("original_id"),
-            "code_parent": payload_base.get("code_parent"),
-            "cluster_id": int(label) 
-        }
-        
-        points_to_update.append(
-            models.PointStruct(
-                id=point.id,
-                vector=point.vector,
-                payload=updated_payload
-            )
-        )
     try:
-        logging.info(f"Mise à jour des {len(points_to_update)} points dans Qdrant par lots...")
-        BATCH_SIZE = 512 
-
-        for i in range(0, len(points_to_update), BATCH_SIZE):
-            batch = points_to_update[i:i + BATCH_SIZE]
-            current_batch_num = i // BATCH_SIZE + 1
-            total_batches = (len(points_to_update) + BATCH_SIZE - 1) // BATCH_SIZE
-            
-            logging.info(f" -> Envoi du lot {current_batch_num}/{total_batches}...")
-            client.upsert(collection_name=COLLECTION_NAME, points=batch, wait=True)
-        
-        logging.info("Mise à jour de la base de données terminée.")
+        save_cluster_models(code_id, reducer, clusterer, {"umap": umap_params, "hdbscan": hdbscan_params})
+    except Exception as e:
+        logging.warning(f"Impossible de sauvegarder les modèles de clustering : {e}")
+
+    logging.info("Étape 4/4 : Mise à jour non-destructive des cluster_id (payload uniquement)...")
+    try:
+        stats = write_cluster_ids(COLLECTION_NAME, points.ids, cluster_labels)
+        logging.info(
+            f"Mise à jour de la base de données terminée : {stats['operations']} opérations en {stats['requests']} requêtes, "
+            f"{stats['bytes_sent'] / 1024:.0f} Ko envoyés en {stats['elapsed_sec']:.2f}s "
+            f"(≈ {vectors.nbytes / 1024**2:.0f} Mo de vecteurs float32 non renvoyés)."
+        )
     except Exception as e:
         logging.error(f"Erreur lors de la mise à jour des points dans Qdrant : {e}")
         raise e
 
+    article_ids = points.payload["original_id"]
+    has_article = article_ids != ""
+    publish_article_clusters(code_id, dominant_clusters(article_ids[has_article], cluster_labels[has_article]))
 
-if __name__ == "__main__":
-    
-   
-    
-  
-    code_defense_id = "LEGITEXT000006071307" 
-    defense_umap_params = {'n_neighbors': 15, 'n_components': 30}
-    defense_hdbscan_params = {'min_cluster_size': 82, 'min_samples': 13}
-
-   
-    code_fonc_pub_id = "LEGITEXT000044416551" 
-    fonc_pub_umap_params = {'n_neighbors': 15, 'n_components': 30} 
-    fonc_pub_hdbscan_params = {'min_cluster_size': 34, 'min_samples': 29} 
-    
-    
+
+def build_set_payload_operations(point_ids: np.ndarray, labels: np.ndarray) -> list:
+    """
+    Regroupe les points par label : chaque label devient une ou plusieurs opérations
+    `set_payload` portant sur une liste d'identifiants (au plus SET_PAYLOAD_BATCH_SIZE).
+    """
+    labels = np.asarray(labels)
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    unique_labels, starts = np.unique(sorted_labels, return_index=True)
+    bounds = list(starts) + [len(order)]
+
+    operations = []
+    for label, start, end in zip(unique_labels, bounds[:-1], bounds[1:]):
+        label_ids = point_ids[order[start:end]].tolist()
+        for i in range(0, len(label_ids), SET_PAYLOAD_BATCH_SIZE):
+            operations.append(
+                models.SetPayloadOperation(
+                    set_payload=models.SetPayload(
+                        payload={"cluster_id": int(label)},
+                        points=label_ids[i:i + SET_PAYLOAD_BATCH_SIZE]
+                    )
+                )
+            )
+    return operations
+
+
+def write_cluster_ids(collection_name: str, point_ids: np.ndarray, labels: np.ndarray) -> dict:
+    """
+    Écrit les `cluster_id` sans renvoyer les vecteurs. Les requêtes sont envoyées sans
+    attendre leur application (`wait=False`), sauf la dernière : Qdrant appliquant les
+    mises à jour d'une collection dans l'ordre, son acquittement garantit que tout est écrit.
+
+    Returns:
+        dict: statistiques d'envoi (opérations, requêtes, octets envoyés, durée).
+    """
+    start_time = time.time()
+    operations = build_set_payload_operations(point_ids, labels)
+    requests_batches = [operations[i:i + OPERATIONS_PER_REQUEST] for i in range(0, len(operations), OPERATIONS_PER_REQUEST)]
+
+    bytes_sent = 0
+    for n, batch in enumerate(requests_batches, start=1):
+        is_last = n == len(requests_batches)
+        logging.info(f" -> Envoi de la requête {n}/{len(requests_batches)} ({len(batch)} opérations)...")
+        client.batch_update_points(collection_name=collection_name, update_operations=batch, wait=is_last)
+        bytes_sent += sum(len(op.model_dump_json(exclude_none=True)) for op in batch)
+
+    return {
+        "operations": len(operations),
+        "requests": len(requests_batches),
+        "bytes_sent": bytes_sent,
+        "elapsed_sec": time.time() - start_time,
+    }
+
+
+def load_job_specs(config_path: str) -> dict:
+    """
+    Lit la configuration des jobs de clustering (un job par code).
+
+    Format :
+        {"max_workers": 2, "threads_per_job": 4,
+         "jobs": [{"code_id": "...", "umap": {...}, "hdbscan": {...}, "threads": 8}, ...]}
+    `threads` est optionnel et remplace `threads_per_job` pour un job donné.
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    threads_per_job = int(config.get("threads_per_job", 1))
+    jobs = []
+    for job in config["jobs"]:
+        for key in ("code_id", "umap", "hdbscan"):
+            if key not in job:
+                raise ValueError(f"Job de clustering invalide, clé '{key}' manquante : {job}")
+        jobs.append({**job, "threads": int(job.get("threads", threads_per_job))})
+    return {
+        "max_workers": int(config.get("max_workers", default_worker_count(threads_per_job))),
+        "threads_per_job": threads_per_job,
+        "jobs": jobs,
+    }
+
+
+def run_job(job: dict) -> dict:
+    """
+    Exécute le clustering d'un code dans un worker, avec son budget de threads.
+    Les erreurs sont capturées : un code en échec n'interrompt pas les autres.
+    """
+    setup_logging()
+    limit_worker_threads(job["threads"])
+    start_time = time.time()
     try:
-        main(code_id=code_defense_id, umap_params=defense_umap_params, hdbscan_params=defense_hdbscan_params)
-        main(code_id=code_fonc_pub_id, umap_params=fonc_pub_umap_params, hdbscan_params=fonc_pub_hdbscan_params)
-        logging.info("--- Tous les traitements de clustering sont terminés avec succès. ---")
+        main(code_id=job["code_id"], umap_params=job["umap"], hdbscan_params=job["hdbscan"])
+        status, error = "success", None
     except Exception as e:
-        logging.error(f"Le script de clustering s'est arrêté à cause d'une erreur : {e}")
+        logging.error(f"Échec du clustering pour le code {job['code_id']} : {e}")
+        status, error = "failed", str(e)
+    return {
+        "code_id": job["code_id"],
+        "status": status,
+        "error": error,
+        "threads": job["threads"],
+        "elapsed_sec": round(time.time() - start_time, 2),
+    }
 
+
+def run_jobs(config_path: str = CLUSTERING_JOBS_CONFIG, summary_path: str = CLUSTERING_SUMMARY_PATH, max_workers: int = None) -> list:
+    """
+    Lance tous les jobs de la configuration en parallèle sur un pool de processus,
+    puis écrit un récapitulatif (statut et durée par code) dans `summary_path`.
+    """
+    config = load_job_specs(config_path)
+    max_workers = max_workers or config["max_workers"]
+    logging.info(f"--- Clustering de {len(config['jobs'])} codes sur {max_workers} workers ---")
+
+    start_time = time.time()
+    summary = []
+    with worker_pool(max_workers, config["threads_per_job"]) as pool:
+        futures = {pool.submit(run_job, job): job for job in config["jobs"]}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # Le worker lui-même a échoué (ex. : processus tué par manque de mémoire).
+                result = {"code_id": job["code_id"], "status": "failed", "error": str(e),
+                          "threads": job["threads"], "elapsed_sec": None}
+            logging.info(f"Code {result['code_id']} : {result['status']} ({result['elapsed_sec']}s)")
+            summary.append(result)
+
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump({"total_elapsed_sec": round(time.time() - start_time, 2), "jobs": summary}, f, indent=2)
+    n_failed = sum(1 for result in summary if result["status"] != "success")
+    logging.info(f"Récapitulatif écrit dans {summary_path} ({len(summary) - n_failed} succès, {n_failed} échecs).")
+    return summary
+
+
+if __name__ == "__main__":
+    setup_logging(mode='w')  # 'w' pour écraser le log à chaque lancement
+    parser = argparse.ArgumentParser(description="Clustering UMAP/HDBSCAN des codes configurés.")
+    parser.add_argument("--config", default=CLUSTERING_JOBS_CONFIG, help="Fichier JSON des jobs de clustering.")
+    parser.add_argument("--summary", default=CLUSTERING_SUMMARY_PATH, help="Fichier JSON du récapitulatif des temps.")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de codes traités en parallèle.")
+    args = parser.parse_args()
+
+    results = run_jobs(args.config, args.summary, args.workers)
+    if all(result["status"] == "success" for result in results):
+        logging.info("--- Tous les traitements de clustering sont terminés avec succès. ---")
+    else:
+        logging.error("--- Le clustering a échoué pour au moins un code (voir le récapitulatif). ---")
+        raise SystemExit(1)
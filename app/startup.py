@@ -1,8 +1,24 @@
 import os
+import json
+import argparse
+import hashlib
+import queue
+import threading
+import ijson
 import requests
 import uuid
-from qdrant_client import QdrantClient, models
+from qdrant_client import models
+from app.qdrant import client
+from app.collection import COLLECTION_NAME, collection_schema, ensure_payload_indexes, update_collection_schema, wait_for_green
+from app.collection_versions import (
+    REINDEX_INDEX_TIMEOUT, delete_version, list_versions, new_version_name, prune_versions,
+    published_versions, resolve_alias, rollback, switch_alias, validate_collection,
+)
 from app.embeddings import get_embeddings_batch, load_model
+from app.chunking import chunk_text_robust, make_chunker
+from app.cluster_models import assign_clusters
+from app.cluster_index import clear_article_clusters, forget_article_clusters
+from app.result_cache import publish_index_generation
 import logging 
 
 logging.basicConfig(level=logging.INFO,
@@ -13,142 +29,427 @@ logging.basicConfig(level=logging.INFO,
                     ])
 
 
-QDRANT_HOST = os.getenv("QDRANT_HOST")
-QDRANT_PORT = os.getenv("QDRANT_PORT")
-COLLECTION_NAME = "articles_chunked" 
 URL_ARTICLE = os.getenv("URL_ARTICLE")
 API_KEY = os.getenv("API_KEY_ETL") 
 
+# Espace de noms fixe : un même chunk produit toujours le même identifiant de point.
+POINT_ID_NAMESPACE = uuid.UUID("6f1c7a52-3d4e-4b8a-9f21-0c5e8d7b3a10")
+SCROLL_PAGE_SIZE = 10000
+DELETE_BATCH_SIZE = 1000
+PAYLOAD_UPDATE_BATCH_SIZE = 1000
+# Champs recopiés de l'article dans chaque chunk, absents de l'identifiant du point.
+METADATA_FIELDS = ("title", "code_parent")
+EMBED_BATCH_SIZE = int(os.getenv("ETL_EMBED_BATCH_SIZE", "256"))
+UPLOAD_BATCH_SIZE = int(os.getenv("ETL_UPLOAD_BATCH_SIZE", "256"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("ETL_QUEUE_SIZE", "4"))
+ASSIGN_CLUSTERS = os.getenv("ETL_ASSIGN_CLUSTERS", "1") == "1"
 
-client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+_END_OF_STREAM = object()
 
 
 def get_all_articles_from_api():
-    """Récupère tous les articles depuis l'API de E1."""
+    """
+    Récupère tous les articles depuis l'API de E1.
+
+    La réponse JSON est lue en flux (ijson) : les articles sont renvoyés un par un
+    par un itérateur, sans jamais charger la réponse complète en mémoire.
+    """
     headers = { 'x-api-key': API_KEY }
     try:
         
-        response = requests.get(URL_ARTICLE, headers=headers, timeout=60) 
+        response = requests.get(URL_ARTICLE, headers=headers, timeout=60, stream=True) 
         response.raise_for_status()  
-        return response.json()
+        response.raw.decode_content = True
+        return ijson.items(response.raw, "item")
     except requests.exceptions.RequestException as e:
         logging.error(f"Erreur lors de la récupération des articles: {e}")
         return None
 
-def chunk_text_robust(content: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> list[str]:
+def content_hash(text: str) -> str:
+    """Empreinte SHA-256 (tronquée) du contenu d'un chunk."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+def compute_point_id(original_id: str, chunk_index: int, chunk_hash: str) -> str:
     """
-    Découpe un texte en chunks de taille fixe avec un chevauchement.
-    Cette méthode est robuste aux variations de formatage.
+    Identifiant déterministe d'un point : il ne change que si l'article, la position
+    du chunk ou son contenu changent, ce qui rend la réindexation idempotente.
     """
-    if not isinstance(content, str) or not content.strip():
-        return []
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{original_id}:{chunk_index}:{chunk_hash}"))
 
-   
-    chunks_by_paragraph = content.split('\n\n')
-    
-    final_chunks = []
-    for paragraph in chunks_by_paragraph:
-        paragraph = paragraph.strip()
-        if not paragraph:
-            continue
-        
-        # Si un paragraphe est plus grand que notre taille cible, on le découpe
-        if len(paragraph) > chunk_size:
-            start_index = 0
-            while start_index < len(paragraph):
-                end_index = start_index + chunk_size
-                final_chunks.append(paragraph[start_index:end_index])
-                start_index += chunk_size - chunk_overlap
-        else:
-            final_chunks.append(paragraph)
-            
-    return final_chunks
-
-def initialize_vector_index():
-    """
-    Initialise la collection de vecteurs dans Qdrant et la peuple avec des chunks d'articles.
+def metadata_hash(payload: dict) -> str:
+    """Empreinte des métadonnées d'un chunk (METADATA_FIELDS), pour détecter un titre ou un code modifié."""
+    return content_hash(json.dumps([payload.get(key) for key in METADATA_FIELDS], ensure_ascii=False))
+
+def fetch_existing_point_ids(collection_name: str) -> dict:
+    """
+    Récupère (sans vecteurs) les identifiants de tous les points de la collection,
+    associés à l'empreinte de leurs métadonnées (absente pour les points antérieurs)
+    et à l'article dont ils proviennent.
+    """
+    existing_ids = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=SCROLL_PAGE_SIZE,
+            offset=offset,
+            with_payload=["metadata_hash", "original_id"],
+            with_vectors=False
+        )
+        for point in points:
+            existing_ids[str(point.id)] = point.payload or {}
+        if offset is None:
+            return existing_ids
+
+def delete_points(collection_name: str, point_ids: list) -> None:
+    """Supprime les points obsolètes par lots."""
+    for i in range(0, len(point_ids), DELETE_BATCH_SIZE):
+        client.delete(
+            collection_name=collection_name,
+            points_selector=models.PointIdsList(points=point_ids[i:i + DELETE_BATCH_SIZE]),
+            wait=True
+        )
+
+def update_payloads(collection_name: str, updates: list) -> None:
+    """Réécrit par lots les métadonnées des chunks inchangés, sans les revectoriser."""
+    for i in range(0, len(updates), PAYLOAD_UPDATE_BATCH_SIZE):
+        client.batch_update_points(
+            collection_name=collection_name,
+            update_operations=[
+                models.SetPayloadOperation(set_payload=models.SetPayload(payload=payload, points=[point_id]))
+                for point_id, payload in updates[i:i + PAYLOAD_UPDATE_BATCH_SIZE]
+            ],
+            wait=True
+        )
+
+def prepare_collection(vector_size: int, full_rebuild: bool = False, update_config: bool = False):
+    """
+    Choisit la collection à alimenter.
+
+    Synchronisation incrémentale : la collection servie par l'alias COLLECTION_NAME
+    (ou l'ancienne collection non versionnée du même nom), avec `update_config` pour
+    lui appliquer le schéma courant. Reconstruction complète, ou premier lancement :
+    une nouvelle collection versionnée, créée avec le schéma configuré (quantification,
+    vecteurs sur disque, HNSW ; voir app/collection.py), que l'alias ne désignera qu'une
+    fois remplie et validée. Les index de payload manquants sont créés dans tous les cas.
+
+    Returns:
+        (target, served, new_version): la collection à alimenter, la collection servie
+        actuellement (None s'il n'y en a pas) et si `target` est une nouvelle version.
+    """
+    served = resolve_alias(client, COLLECTION_NAME)
+    if served is None and client.collection_exists(COLLECTION_NAME):
+        served = COLLECTION_NAME
+
+    if full_rebuild or served is None:
+        target = new_version_name(COLLECTION_NAME)
+        logging.info(f"Création de la nouvelle version '{target}' (la collection servie reste '{served}' jusqu'à la bascule)...")
+        client.create_collection(collection_name=target, **collection_schema(vector_size))
+        new_version = True
+    else:
+        target = served
+        new_version = False
+        logging.info(f"Collection '{target}' existante : synchronisation incrémentale.")
+        if update_config:
+            update_collection_schema(client, target)
+    ensure_payload_indexes(client, target)
+    return target, served, new_version
+
+def publish_version(target: str, served: str, skip_check: bool = False) -> bool:
+    """
+    Attend l'indexation de la nouvelle version, la valide (sauf `skip_check`) puis bascule
+    l'alias vers elle. Une version rejetée est supprimée aussitôt ; après la bascule, les
+    versions trop anciennes sont supprimées.
+    """
+    wait_for_green(client, target, timeout=REINDEX_INDEX_TIMEOUT)
+    if not skip_check:
+        ok, report = validate_collection(client, target, previous=served)
+        logging.info(f"Contrôle de la version '{target}' : {report}")
+        if not ok:
+            logging.error(f"Version '{target}' rejetée ({'; '.join(report['problems'])}) : suppression, l'alias reste sur '{served}'.")
+            delete_version(client, target)
+            return False
+    switch_alias(client, COLLECTION_NAME, target)
+    clear_article_clusters()
+    publish_index_generation()
+    prune_versions(client, COLLECTION_NAME)
+    return True
+
+def initialize_vector_index(full_rebuild: bool = False, update_config: bool = False, skip_check: bool = False):
+    """
+    Initialise la collection de vecteurs dans Qdrant et la synchronise avec les chunks d'articles.
+
+    Par défaut, la synchronisation est incrémentale : seuls les chunks nouveaux ou modifiés
+    sont vectorisés et insérés, les chunks disparus sont supprimés et les points inchangés
+    (et donc leur `cluster_id`) sont conservés. Les articles modifiés sont retirés de l'index
+    article -> cluster (voir app/cluster_index.py) jusqu'au prochain clustering.
+
+    Une reconstruction complète remplit une nouvelle collection versionnée pendant que
+    l'API continue de servir l'ancienne, puis bascule l'alias une fois la nouvelle validée.
+
+    Args:
+        full_rebuild (bool): Revectorise tout le corpus dans une nouvelle version de la collection.
+        update_config (bool): Applique le schéma configuré à la collection existante.
+        skip_check (bool): Bascule l'alias sans contrôler la nouvelle version.
     """
     logging.info("Initialisation du service de modèle...")
     model = load_model()
     
     try:
-        logging.info(f"Tentative de recréation de la collection '{COLLECTION_NAME}'...")
-        client.recreate_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config=models.VectorParams(
-                size=model.get_sentence_embedding_dimension(), 
-                distance=models.Distance.COSINE
-            )
-        )
-        logging.info(f"Collection '{COLLECTION_NAME}' créée/réinitialisée.")
+        target, served, new_version = prepare_collection(model.get_sentence_embedding_dimension(), full_rebuild=full_rebuild, update_config=update_config)
+        existing_ids = {} if new_version else fetch_existing_point_ids(target)
+        logging.info(f"{len(existing_ids)} points déjà présents dans la collection '{target}'.")
     except Exception as e:
-        logging.error(f"Erreur critique lors de la création de la collection: {e}")
+        logging.error(f"Erreur critique lors de la préparation de la collection: {e}")
         return
 
     logging.info("Démarrage de la récupération des articles...")
     articles = get_all_articles_from_api()
-    if not articles:
+    if articles is None:
         logging.warning("Aucun article à indexer.")
         return
 
-    logging.info("Démarrage du processus de segmentation (chunking)...")
-    texts_to_embed = []
-    metadata_for_points = []
+    stats = {"articles": 0, "chunks": 0, "embedded": 0, "assigned": 0, "uploaded": 0}
+    desired_ids = set()
+    payload_updates = []
+    touched_articles = set()
+    stop = threading.Event()
+    errors = []
+    chunk_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    upload_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
 
+    logging.info(
+        f"Démarrage du pipeline en flux (lots de {EMBED_BATCH_SIZE} chunks, "
+        f"files bornées à {PIPELINE_QUEUE_SIZE} lots)..."
+    )
+    stages = [
+        threading.Thread(
+            target=_run_stage, name="etl-chunking",
+            args=(produce_chunk_batches, (articles, make_chunker(model), existing_ids, desired_ids, payload_updates, touched_articles, chunk_queue, stop, stats), chunk_queue, stop, errors)
+        ),
+        threading.Thread(
+            target=_run_stage, name="etl-embedding",
+            args=(embed_batches, (chunk_queue, upload_queue, stop, stats, ASSIGN_CLUSTERS and not new_version), upload_queue, stop, errors)
+        ),
+        threading.Thread(
+            target=_run_stage, name="etl-upload",
+            args=(upload_batches, (target, upload_queue, stop, stats), None, stop, errors)
+        ),
+    ]
+    for stage in stages:
+        stage.start()
+    for stage in stages:
+        stage.join()
+
+    if errors:
+        logging.error(f"Pipeline interrompu ({errors[0]}) : les chunks obsolètes ne sont pas supprimés.")
+        if new_version:
+            logging.error(f"La version incomplète '{target}' est supprimée, '{served}' reste servie.")
+            client.delete_collection(target)
+        elif stats["uploaded"]:
+            forget_article_clusters(touched_articles)
+            publish_index_generation()
+        return
+
+    if not desired_ids:
+        logging.warning("Aucun contenu textuel trouvé après segmentation.")
+        if new_version:
+            client.delete_collection(target)
+        return
+
+    stale_ids = list(existing_ids.keys() - desired_ids)
+    logging.info(
+        f"{stats['articles']} articles ont été segmentés en {len(desired_ids)} chunks : "
+        f"{stats['embedded']} nouveaux ou modifiés, {len(stale_ids)} obsolètes, "
+        f"{len(desired_ids) - stats['embedded']} inchangés (dont {len(payload_updates)} aux métadonnées modifiées)."
+    )
+
+    if stale_ids:
+        logging.info(f"Suppression de {len(stale_ids)} chunks obsolètes...")
+        try:
+            delete_points(target, stale_ids)
+        except Exception as e:
+            logging.error(f"Erreur lors de la suppression des chunks obsolètes: {e}")
+
+    if payload_updates:
+        logging.info(f"Mise à jour des métadonnées de {len(payload_updates)} chunks...")
+        try:
+            update_payloads(target, payload_updates)
+        except Exception as e:
+            logging.error(f"Erreur lors de la mise à jour des métadonnées: {e}")
+
+    logging.info(
+        f"Indexation terminée. {stats['uploaded']} chunks insérés, "
+        f"dont {stats['assigned']} affectés à un cluster existant."
+    )
+
+    if new_version:
+        publish_version(target, served, skip_check=skip_check)
+    elif stats["uploaded"] or stale_ids or payload_updates:
+        touched_articles.update(existing_ids[point_id].get("original_id") for point_id in stale_ids)
+        touched_articles.discard(None)
+        forget_article_clusters(touched_articles)
+        publish_index_generation()
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Dépose un élément dans une file bornée sans bloquer indéfiniment si le pipeline s'arrête."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q: queue.Queue, stop: threading.Event):
+    """Lit l'élément suivant d'une file ; renvoie la fin de flux si le pipeline s'arrête."""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    return _END_OF_STREAM
+
+def _run_stage(stage_fn, args: tuple, out_queue, stop: threading.Event, errors: list) -> None:
+    """
+    Exécute une étape du pipeline. En cas d'erreur, tout le pipeline est arrêté ;
+    sinon la fin de flux est propagée à l'étape suivante.
+    """
+    try:
+        stage_fn(*args)
+        if out_queue is not None:
+            _put(out_queue, _END_OF_STREAM, stop)
+    except Exception as e:
+        logging.error(f"Erreur dans l'étape '{threading.current_thread().name}' du pipeline : {e}")
+        errors.append(e)
+        stop.set()
+
+def produce_chunk_batches(articles, chunker, existing_ids: dict, desired_ids: set, payload_updates: list, touched_articles: set, out_queue: queue.Queue, stop: threading.Event, stats: dict) -> None:
+    """
+    Étape 1 : lit les articles au fil de l'eau, les segmente (voir app/chunking.py) et
+    émet des lots de chunks nouveaux ou modifiés (de taille EMBED_BATCH_SIZE). Les chunks
+    inchangés dont les métadonnées ont changé sont ajoutés à `payload_updates`, et les
+    articles concernés par l'un ou l'autre à `touched_articles`.
+    """
+    batch = []
     for article in articles:
+        if stop.is_set():
+            return
+        stats["articles"] += 1
         content = article.get("content")
         if not content:
             continue
         
-        chunks = chunk_text_robust(content, chunk_size=1000, chunk_overlap=200)
+        chunks = chunker(content)
         
         for i, chunk_text in enumerate(chunks):
-            texts_to_embed.append(chunk_text)
-            metadata_for_points.append({
+            chunk_hash = content_hash(chunk_text)
+            point_id = compute_point_id(article.get("_key"), i, chunk_hash)
+            desired_ids.add(point_id)
+            stats["chunks"] += 1
+            payload = {
                 "chunk_text": chunk_text,
                 "chunk_index": i, 
                 "title": article.get("num"),
                 "original_id": article.get("_key"),
-                "code_parent": article.get("code_parent")
-            })
-    
-    if not texts_to_embed:
-        logging.warning("Aucun contenu textuel trouvé après segmentation.")
-        return
-        
-    logging.info(f"{len(articles)} articles ont été segmentés en {len(texts_to_embed)} chunks.")
+                "code_parent": article.get("code_parent"),
+                "content_hash": chunk_hash
+            }
+            payload["metadata_hash"] = metadata_hash(payload)
+            if point_id in existing_ids:
+                if existing_ids[point_id].get("metadata_hash") != payload["metadata_hash"]:
+                    payload_updates.append((point_id, {key: payload[key] for key in METADATA_FIELDS + ("metadata_hash",)}))
+                    touched_articles.add(payload["original_id"])
+                continue
+            touched_articles.add(payload["original_id"])
+            batch.append((point_id, payload))
+            if len(batch) >= EMBED_BATCH_SIZE:
+                if not _put(out_queue, batch, stop):
+                    return
+                batch = []
+    if batch:
+        _put(out_queue, batch, stop)
 
-   
-    logging.info(f"Vectorisation par batch de {len(texts_to_embed)} chunks...")
-    vectors = get_embeddings_batch(texts_to_embed)
-    
-   
-    points = [
-        models.PointStruct(
-            id=str(uuid.uuid4()),
-            vector=vector,
-            payload=metadata 
-        ) for vector, metadata in zip(vectors, metadata_for_points)
-    ]
-    
+def embed_batches(in_queue: queue.Queue, out_queue: queue.Queue, stop: threading.Event, stats: dict, assign: bool = False) -> None:
+    """
+    Étape 2 : vectorise chaque lot de chunks. Avec `assign` (synchronisation incrémentale
+    uniquement), les nouveaux chunks reçoivent un cluster à partir des modèles sauvegardés.
+    """
+    while True:
+        batch = _get(in_queue, stop)
+        if batch is _END_OF_STREAM:
+            return
+        vectors = get_embeddings_batch([payload["chunk_text"] for _, payload in batch], use_store=True)
+        if assign:
+            assign_batch_clusters(batch, vectors, stats)
+        stats["embedded"] += len(batch)
+        logging.info(f"{stats['embedded']} chunks vectorisés...")
+        if not _put(out_queue, (batch, vectors), stop):
+            return
 
-    if points:
-        BATCH_SIZE = 128
-        logging.info(f"Démarrage de l'insertion de {len(points)} points (chunks)...")
+def assign_batch_clusters(batch: list, vectors, stats: dict) -> None:
+    """
+    Renseigne directement le `cluster_id` des nouveaux chunks à partir des modèles
+    UMAP/HDBSCAN sauvegardés par run_clustering (code par code). Les chunks d'un code
+    sans modèle restent sans cluster jusqu'au prochain clustering complet.
+    """
+    rows_by_code = {}
+    for row, (_, payload) in enumerate(batch):
+        rows_by_code.setdefault(payload.get("code_parent"), []).append(row)
+
+    for code_id, rows in rows_by_code.items():
         try:
-           
-            client.upload_points(
-                collection_name=COLLECTION_NAME,
-                points=points,
-                batch_size=BATCH_SIZE,
-                parallel=2 
-            )
-            logging.info(f"Indexation terminée. {len(points)} chunks insérés.")
+            labels = assign_clusters(code_id, vectors[rows])
         except Exception as e:
-            logging.error(f"Erreur lors de l'insertion des vecteurs dans Qdrant: {e}")
+            logging.warning(f"Affectation incrémentale des clusters impossible pour le code '{code_id}' : {e}")
+            continue
+        if labels is None:
+            continue
+        for row, label in zip(rows, labels):
+            batch[row][1]["cluster_id"] = int(label)
+        stats["assigned"] += len(rows)
+
+def upload_batches(collection_name: str, in_queue: queue.Queue, stop: threading.Event, stats: dict) -> None:
+    """
+    Étape 3 : insère chaque lot vectorisé dans Qdrant. La matrice float32 des vecteurs
+    est transmise telle quelle à `upload_collection`, sans objet Python par point.
+    """
+    while True:
+        item = _get(in_queue, stop)
+        if item is _END_OF_STREAM:
+            return
+        batch, vectors = item
+        client.upload_collection(
+            collection_name=collection_name,
+            vectors=vectors,
+            payload=[payload for _, payload in batch],
+            ids=[point_id for point_id, _ in batch],
+            batch_size=UPLOAD_BATCH_SIZE,
+            wait=True
+        )
+        stats["uploaded"] += len(batch)
 
 
 if __name__ == "__main__":
-    logging.info("--- Lancement du script d'initialisation (avec chunking) ---")
-    initialize_vector_index()
-    logging.info("--- Script terminé ---")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Indexation des chunks d'articles dans Qdrant.")
+    parser.add_argument("--full", action="store_true", help="Revectorise tout le corpus dans une nouvelle version de la collection, puis bascule l'alias.")
+    parser.add_argument("--update-config", action="store_true", help="Applique le schéma configuré (quantification, stockage, HNSW) à la collection existante.")
+    parser.add_argument("--skip-check", action="store_true", help="Bascule l'alias sans contrôler la nouvelle version.")
+    parser.add_argument("--rollback", action="store_true", help="Rebascule l'alias vers la version précédente et quitte.")
+    parser.add_argument("--list-versions", action="store_true", help="Affiche les versions de la collection et quitte.")
+    args = parser.parse_args()
+
+    if args.list_versions:
+        served = resolve_alias(client, COLLECTION_NAME)
+        published = set(published_versions(client, COLLECTION_NAME))
+        for name in list_versions(client, COLLECTION_NAME):
+            print(f"{name}{'  <- servie' if name == served else ''}{'' if name in published else '  (jamais servie)'}")
+    elif args.rollback:
+        logging.info(f"Rollback : l'alias '{COLLECTION_NAME}' désigne maintenant '{rollback(client, COLLECTION_NAME)}'.")
+        clear_article_clusters()
+        publish_index_generation()
+    else:
+        logging.info("--- Lancement du script d'initialisation (avec chunking) ---")
+        initialize_vector_index(full_rebuild=args.full, update_config=args.update_config, skip_check=args.skip_check)
+        logging.info("--- Script terminé ---")
\ No newline at end of file
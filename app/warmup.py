@@ -0,0 +1,72 @@
+import os
+import time
+import logging
+import threading
+
+
+# Mode de préchauffage du modèle au démarrage de l'API :
+#   "off"        : aucun préchauffage, l'API est prête immédiatement (le modèle sera chargé à la première requête) ;
+#   "background" : chargement dans un thread, /ready renvoie 503 tant qu'il n'est pas terminé ;
+#   "sync"       : chargement bloquant dans create_app (utile avec un serveur qui précharge l'application).
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "background")
+WARMUP_ENCODES = int(os.getenv("WARMUP_ENCODES", "3"))
+WARMUP_MODES = ("off", "background", "sync")
+
+_ready = threading.Event()
+_state = {"status": "pending", "error": None, "seconds": None}
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def warmup_state() -> dict:
+    return dict(_state)
+
+
+def mark_ready() -> None:
+    _state["status"] = "ready"
+    _ready.set()
+
+
+def warm_up(n_encodes: int = WARMUP_ENCODES) -> None:
+    """
+    Charge le modèle d'embedding configuré et exécute quelques encodages factices
+    (requête et passage) pour que la première vraie requête ne paie ni le chargement
+    ni l'initialisation des noyaux. Marque l'application comme prête à la fin.
+    """
+    from app.embeddings import DEFAULT_MODEL, load_model
+
+    _state["status"] = "warming"
+    start = time.perf_counter()
+    try:
+        model = load_model(DEFAULT_MODEL)
+        load_seconds = time.perf_counter() - start
+        logging.info(f"Préchauffage : modèle '{DEFAULT_MODEL}' chargé en {load_seconds:.2f}s.")
+        for i in range(n_encodes):
+            encode_start = time.perf_counter()
+            model.encode(["query: préchauffage du modèle", "passage: texte factice de préchauffage"])
+            logging.info(f"Préchauffage : encodage factice {i + 1}/{n_encodes} en {time.perf_counter() - encode_start:.3f}s.")
+    except Exception as e:
+        _state["status"] = "failed"
+        _state["error"] = str(e)
+        logging.error(f"Échec du préchauffage du modèle : {e}")
+        return
+    _state["seconds"] = round(time.perf_counter() - start, 3)
+    logging.info(f"Préchauffage terminé en {_state['seconds']:.2f}s, l'API est prête.")
+    mark_ready()
+
+
+def start_warmup(mode: str = None) -> None:
+    """Lance le préchauffage selon le mode demandé (voir MODEL_WARMUP)."""
+    mode = mode or MODEL_WARMUP
+    if mode not in WARMUP_MODES:
+        raise ValueError(f"Mode de préchauffage inconnu : '{mode}' (attendu : {', '.join(WARMUP_MODES)}).")
+    if _ready.is_set():
+        return
+    if mode == "off":
+        mark_ready()
+    elif mode == "sync":
+        warm_up()
+    else:
+        threading.Thread(target=warm_up, name="model-warmup", daemon=True).start()
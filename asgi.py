@@ -0,0 +1,7 @@
+from app import create_app
+from app.routes.search_async import create_asgi_app
+
+# Point d'entrée ASGI du serveur de production (voir gunicorn.conf.py, WEB_ASGI) :
+# /async/search est servi par la boucle asyncio de chaque worker, les autres routes
+# par l'application Flask, chargée et préchauffée avant la création des workers.
+app = create_asgi_app(create_app(warmup="sync"))
@@ -2,8 +2,8 @@ import logging
 import time
 import os
 import numpy as np
-import itertools
 import requests
+from concurrent.futures import FIRST_COMPLETED, wait
 from sklearn.decomposition import PCA
 from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_score
@@ -12,6 +12,10 @@ import hdbscan
 import mlflow
 from sentence_transformers import SentenceTransformer
 from typing import List
+from app.chunking import encode_length_bucketed, make_chunker
+from app.embedding_store import encode_with_store
+from app.embeddings import EncodePool, encode_process_count
+from app.parallel import default_worker_count, worker_pool
 
 
 
@@ -20,6 +24,10 @@ from typing import List
 E1_API_ALL_ARTICLES_URL = os.getenv("URL_ARTICLE")
 E1_API_KEY = os.getenv("API_KEY_ETL")
 
+# Chaque worker de la grille est limité à BENCHMARK_THREADS_PER_WORKER threads (BLAS, numba).
+BENCHMARK_THREADS_PER_WORKER = int(os.getenv("BENCHMARK_THREADS_PER_WORKER", "1"))
+BENCHMARK_WORKERS = int(os.getenv("BENCHMARK_WORKERS", str(default_worker_count(BENCHMARK_THREADS_PER_WORKER))))
+
 
 CODE_IDS_TO_TEST = [
     "LEGITEXT000006071307", 
@@ -87,34 +95,72 @@ def get_all_articles_from_api() -> List[dict]:
         return []
 
 _models_cache = {}
-def get_embeddings_batch(texts: List[str], model_name: str) -> List[List[float]]:
+_pools_cache = {}
+def get_model(model_name: str) -> SentenceTransformer:
     if model_name not in _models_cache:
         logging.info(f"Chargement du modèle SentenceTransformer: {model_name}...")
         _models_cache[model_name] = SentenceTransformer(model_name)
-    model = _models_cache[model_name]
-    return model.encode(texts, show_progress_bar=True).tolist()
-
-def chunk_text_robust(content: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> list[str]:
-    if not isinstance(content, str) or not content.strip(): return []
-    chunks_by_paragraph = content.split('\n\n')
-    final_chunks = []
-    for paragraph in chunks_by_paragraph:
-        paragraph = paragraph.strip()
-        if not paragraph: continue
-        if len(paragraph) > chunk_size:
-            start_index = 0
-            while start_index < len(paragraph):
-                final_chunks.append(paragraph[start_index:start_index + chunk_size])
-                start_index += chunk_size - chunk_overlap
-        else:
-            final_chunks.append(paragraph)
-    return final_chunks
-
-
-def run_experiment(code_id, embedding_model, reducer_name, reducer_params, clusterer_name, clusterer_params, vectors):
+        # Pool d'encodage multi-processus si EMBEDDING_PROCESSES est défini (voir app/embeddings.py).
+        processes = encode_process_count()
+        _pools_cache[model_name] = EncodePool(_models_cache[model_name], processes) if processes > 1 else None
+    return _models_cache[model_name]
+
+def get_embeddings_batch(texts: List[str], model_name: str) -> np.ndarray:
+    """Vectorise les chunks en ne calculant que ceux absents du stockage d'embeddings partagé avec startup.py."""
+    def encode(missing_texts: List[str]):
+        vectors, _ = encode_length_bucketed(get_model(model_name), missing_texts, pool=_pools_cache[model_name])
+        return vectors
+    return encode_with_store(texts, model_name, "none", encode)
+
+
+def fit_reducer(reducer_name: str, reducer_params: dict, vectors: np.ndarray):
+    """Ajuste une réduction de dimension (exécuté dans un worker). Renvoie (embeddings réduits, durée)."""
+    start_time = time.time()
+    if reducer_name == "UMAP":
+        reducer = umap.UMAP(**reducer_params, metric='cosine', random_state=42)
+    elif reducer_name == "PCA":
+        reducer = PCA(**reducer_params, random_state=42)
+    else:
+        raise ValueError(f"Reducer inconnu: {reducer_name}")
+    embeddings_reduced = reducer.fit_transform(vectors)
+    return np.ascontiguousarray(embeddings_reduced, dtype=np.float32), time.time() - start_time
+
+
+def fit_clusterer(clusterer_name: str, clusterer_params: dict, embeddings_reduced: np.ndarray) -> dict:
+    """Ajuste un clustering sur des embeddings déjà réduits (exécuté dans un worker) et calcule ses métriques."""
+    start_time = time.time()
+    if clusterer_name == "HDBSCAN":
+        clusterer = hdbscan.HDBSCAN(**clusterer_params, metric='euclidean', gen_min_span_tree=True)
+    elif clusterer_name == "KMeans":
+        clusterer = KMeans(**clusterer_params, random_state=42, n_init='auto')
+    else:
+        raise ValueError(f"Clusterer inconnu: {clusterer_name}")
+    cluster_labels = clusterer.fit_predict(embeddings_reduced)
+    clustering_time = time.time() - start_time
+
+    n_clusters_set = set(cluster_labels)
+    n_clusters = len(n_clusters_set) - (1 if -1 in n_clusters_set else 0)
+    metrics = {
+        "clustering_time_sec": clustering_time,
+        "num_clusters_found": n_clusters if n_clusters > 0 else clusterer_params.get('n_clusters', 0),
+    }
+
+    if clusterer_name == "HDBSCAN":
+        metrics["noise_percentage"] = np.sum(cluster_labels == -1) / len(cluster_labels) * 100 if len(cluster_labels) > 0 else 0
+        try:
+            if n_clusters > 1:
+                metrics["dbcv_score"] = clusterer.relative_validity_
+        except Exception:
+            logging.warning("Score DBCV non calculable.")
+    elif clusterer_name == "KMeans":
+        if n_clusters > 1:
+            metrics["silhouette_score"] = silhouette_score(embeddings_reduced, cluster_labels)
+    return metrics
+
+
+def log_experiment(code_id, embedding_model, reducer_name, reducer_params, clusterer_name, clusterer_params, reducer_time, metrics):
+    """Enregistre une combinaison (réduction, clustering) comme un run MLflow."""
     run_name = f"{embedding_model.split('/')[-1]}_{reducer_name}_{clusterer_name}"
-    logging.info(f"--- Running: {run_name} with params {reducer_params} & {clusterer_params} ---")
-    
     mlflow.set_experiment(f"Benchmark_{code_id}")
     with mlflow.start_run(run_name=run_name):
         mlflow.log_param("code_id", code_id)
@@ -123,50 +169,51 @@ def run_experiment(code_id, embedding_model, reducer_name, reducer_params, clust
         mlflow.log_params(reducer_params)
         mlflow.log_param("clustering_algorithm", clusterer_name)
         mlflow.log_params(clusterer_params)
+        mlflow.log_metric("reducer_time_sec", reducer_time)
+        mlflow.log_metric("processing_time_sec", reducer_time + metrics["clustering_time_sec"])
+        mlflow.log_metrics(metrics)
 
-        start_time = time.time()
-        
-        if reducer_name == "UMAP":
-            reducer = umap.UMAP(**reducer_params, metric='cosine', random_state=42)
-        elif reducer_name == "PCA":
-            reducer = PCA(**reducer_params, random_state=42)
-        else:
-            raise ValueError(f"Reducer inconnu: {reducer_name}")
-        embeddings_reduced = reducer.fit_transform(vectors)
-        
-        if clusterer_name == "HDBSCAN":
-            clusterer = hdbscan.HDBSCAN(**clusterer_params, metric='euclidean', gen_min_span_tree=True)
-        elif clusterer_name == "KMeans":
-            clusterer = KMeans(**clusterer_params, random_state=42, n_init='auto')
-        else:
-            raise ValueError(f"Clusterer inconnu: {clusterer_name}")
-        cluster_labels = clusterer.fit_predict(embeddings_reduced)
-
-        processing_time = time.time() - start_time
-        mlflow.log_metric("processing_time_sec", processing_time)
-
-        n_clusters_set = set(cluster_labels)
-        n_clusters = len(n_clusters_set) - (1 if -1 in n_clusters_set else 0)
-        mlflow.log_metric("num_clusters_found", n_clusters if n_clusters > 0 else clusterer_params.get('n_clusters', 0))
-
-        if clusterer_name == "HDBSCAN":
-            noise_percentage = np.sum(cluster_labels == -1) / len(cluster_labels) * 100 if len(cluster_labels) > 0 else 0
-            mlflow.log_metric("noise_percentage", noise_percentage)
-            dbcv_score = -1.0
+    if clusterer_name == "HDBSCAN":
+        logging.info(f"    -> {run_name} {reducer_params} & {clusterer_params} : DBCV={metrics.get('dbcv_score', -1.0):.4f}, "
+                     f"Clusters={metrics['num_clusters_found']}, Bruit={metrics['noise_percentage']:.2f}%")
+    else:
+        logging.info(f"    -> {run_name} {reducer_params} & {clusterer_params} : Silhouette={metrics.get('silhouette_score', -1.0):.4f}, "
+                     f"Clusters={metrics['num_clusters_found']}")
+
+
+def run_grid(pool, code_id, embedding_model, vectors, reducer_configs, clusterer_configs):
+    """
+    Exécute la grille (réductions x clusterings) comme un graphe de tâches :
+    chaque réduction est ajustée une seule fois, puis ses embeddings réduits sont
+    réutilisés par toutes les configurations de clustering, réparties sur le pool.
+    Les runs MLflow (un par combinaison) sont enregistrés depuis le processus principal.
+    """
+    pending = {}
+    for reducer_name, reducer_params in reducer_configs:
+        future = pool.submit(fit_reducer, reducer_name, reducer_params, vectors)
+        pending[future] = ("reducer", (reducer_name, reducer_params))
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            kind, task = pending.pop(future)
             try:
-                if n_clusters > 1:
-                    dbcv_score = clusterer.relative_validity_
-                    mlflow.log_metric("dbcv_score", dbcv_score)
-            except Exception:
-                logging.warning("Score DBCV non calculable.")
-            logging.info(f"    -> Résultat: DBCV={dbcv_score:.4f}, Clusters={n_clusters}, Bruit={noise_percentage:.2f}%")
-        
-        elif clusterer_name == "KMeans":
-            silhouette = -1.0
-            if n_clusters > 1:
-                silhouette = silhouette_score(embeddings_reduced, cluster_labels)
-                mlflow.log_metric("silhouette_score", silhouette)
-            logging.info(f"    -> Résultat: Silhouette={silhouette:.4f}, Clusters={n_clusters}")
+                result = future.result()
+            except Exception as e:
+                logging.error(f"Échec de la tâche {kind} {task} : {e}")
+                continue
+
+            if kind == "reducer":
+                reducer_name, reducer_params = task
+                embeddings_reduced, reducer_time = result
+                logging.info(f"  Réduction {reducer_name} {reducer_params} ajustée en {reducer_time:.1f}s.")
+                for clusterer_name, clusterer_params in clusterer_configs:
+                    clusterer_future = pool.submit(fit_clusterer, clusterer_name, clusterer_params, embeddings_reduced)
+                    pending[clusterer_future] = ("clusterer", (reducer_name, reducer_params, reducer_time, clusterer_name, clusterer_params))
+            else:
+                reducer_name, reducer_params, reducer_time, clusterer_name, clusterer_params = task
+                log_experiment(code_id, embedding_model, reducer_name, reducer_params,
+                               clusterer_name, clusterer_params, reducer_time, result)
 
 
 
@@ -182,6 +229,7 @@ if __name__ == "__main__":
     else:
         reducer_configs = [(name, params) for name, p_list in DIM_REDUCTION_GRID.items() for params in p_list]
         clusterer_configs = [(name, params) for name, p_list in CLUSTERING_GRID.items() for params in p_list]
+        pool = worker_pool(BENCHMARK_WORKERS, BENCHMARK_THREADS_PER_WORKER)
         
         for code_id in CODE_IDS_TO_TEST:
             logging.info(f"\n{'#'*20} DÉMARRAGE DU BENCHMARK POUR LE CODE : {code_id} {'#'*20}")
@@ -192,20 +240,21 @@ if __name__ == "__main__":
                 logging.warning(f"Aucun article trouvé pour le code {code_id} dans les données récupérées. Passage au suivant.")
                 continue
 
-            all_chunks = [chunk for article in articles_for_code if article.get("content") for chunk in chunk_text_robust(article["content"])]
-            if not all_chunks:
-                logging.warning(f"Aucun contenu textuel (chunk) à traiter pour le code {code_id}. Passage au suivant.")
-                continue
-            
-            logging.info(f"Total de {len(all_chunks)} chunks à traiter pour le code {code_id}.")
-
             for model_name in EMBEDDING_MODELS_TO_TEST:
-                logging.info(f"  Génération des embeddings avec le modèle : {model_name}")
-                vectors = np.array(get_embeddings_batch(all_chunks, model_name=model_name))
+                # Découpage selon CHUNKING_MODE (fenêtres de caractères par défaut, ou limite de tokens de chaque modèle).
+                chunker = make_chunker(get_model(model_name))
+                all_chunks = [chunk for article in articles_for_code if article.get("content") for chunk in chunker(article["content"])]
+                if not all_chunks:
+                    logging.warning(f"Aucun contenu textuel (chunk) à traiter pour le code {code_id}. Passage au suivant.")
+                    break
+
+                logging.info(f"  Génération des embeddings de {len(all_chunks)} chunks avec le modèle : {model_name}")
+                vectors = get_embeddings_batch(all_chunks, model_name=model_name)
                 
-                for reducer_config, clusterer_config in itertools.product(reducer_configs, clusterer_configs):
-                    reducer_name, reducer_params = reducer_config
-                    clusterer_name, clusterer_params = clusterer_config
-                    run_experiment(code_id, model_name, reducer_name, reducer_params, clusterer_name, clusterer_params, vectors)
+                run_grid(pool, code_id, model_name, vectors, reducer_configs, clusterer_configs)
 
+        pool.shutdown()
+        for encode_pool in _pools_cache.values():
+            if encode_pool is not None:
+                encode_pool.close()
         logging.info(f"\n{'#'*20} BENCHMARKS TERMINÉS {'#'*20}")
@@ -0,0 +1,124 @@
+import json
+import time
+import logging
+import argparse
+import numpy as np
+from qdrant_client import models
+from app.qdrant import get_client
+from app.collection import collection_schema, ensure_payload_indexes, search_params, wait_for_green
+
+# Benchmark des recherches filtrées, avant/après index de payload : un corpus synthétique
+# réparti sur de nombreux codes (tailles de codes très inégales, comme les codes juridiques)
+# est chargé dans deux collections, l'une sans index, l'autre avec les index de
+# app/collection.py (code_parent en clé de tenant). On mesure les latences p50/p99 de la
+# recherche filtrée par code (/search) et du scroll MatchAny sur original_id (/clusters_for_articles).
+# Exemple :
+#   python benchmark_filters.py --points 200000 --codes 80 --queries 300
+
+UPLOAD_BATCH_SIZE = 512
+
+
+def synthetic_corpus(n_points: int, n_codes: int, dim: int, chunks_per_article: int, seed: int = 0):
+    """Vecteurs aléatoires normalisés et payloads (code_parent, original_id, cluster_id)."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n_points, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Loi de Zipf : quelques codes très volumineux, beaucoup de petits codes.
+    weights = 1.0 / np.arange(1, n_codes + 1)
+    codes = rng.choice(n_codes, size=n_points, p=weights / weights.sum())
+    payloads = [
+        {
+            "code_parent": f"CODE{code:04d}",
+            "original_id": f"ART{i // chunks_per_article:08d}",
+            "cluster_id": int(rng.integers(-1, 50)),
+        }
+        for i, code in enumerate(codes)
+    ]
+    return vectors, payloads
+
+
+def load_collection(name: str, vectors: np.ndarray, payloads: list, indexed: bool) -> None:
+    client = get_client()
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    client.create_collection(collection_name=name, **collection_schema(vectors.shape[1]))
+    if indexed:
+        ensure_payload_indexes(client, name)
+    client.upload_collection(collection_name=name, vectors=vectors, payload=payloads, ids=range(len(vectors)), batch_size=UPLOAD_BATCH_SIZE, wait=True)
+    wait_for_green(client, name, timeout=900)
+
+
+def percentiles(latencies: list) -> dict:
+    latencies = np.array(latencies) * 1000
+    return {"p50_ms": round(float(np.percentile(latencies, 50)), 2), "p99_ms": round(float(np.percentile(latencies, 99)), 2)}
+
+
+def measure(name: str, vectors: np.ndarray, payloads: list, n_queries: int, ids_per_request: int, seed: int = 1) -> dict:
+    """Latences de la recherche filtrée par code et du scroll MatchAny sur original_id."""
+    client = get_client()
+    rng = np.random.default_rng(seed)
+    codes = sorted({p["code_parent"] for p in payloads})
+    articles = sorted({p["original_id"] for p in payloads})
+
+    search_latencies = []
+    for _ in range(n_queries):
+        code = codes[rng.integers(len(codes))]
+        start = time.perf_counter()
+        client.query_points(
+            collection_name=name,
+            query=vectors[rng.integers(len(vectors))],
+            query_filter=models.Filter(must=[models.FieldCondition(key="code_parent", match=models.MatchValue(value=code))]),
+            search_params=search_params(),
+            limit=10,
+            with_payload=True
+        )
+        search_latencies.append(time.perf_counter() - start)
+
+    scroll_latencies = []
+    for _ in range(n_queries):
+        article_ids = [articles[i] for i in rng.choice(len(articles), size=min(ids_per_request, len(articles)), replace=False)]
+        start = time.perf_counter()
+        offset = None
+        while True:
+            page, offset = client.scroll(
+                collection_name=name,
+                scroll_filter=models.Filter(must=[models.FieldCondition(key="original_id", match=models.MatchAny(any=article_ids))]),
+                limit=2000,
+                offset=offset,
+                with_payload=["original_id", "cluster_id"],
+                with_vectors=False
+            )
+            if offset is None or not page:
+                break
+        scroll_latencies.append(time.perf_counter() - start)
+
+    return {"filtered_search": percentiles(search_latencies), "match_any_scroll": percentiles(scroll_latencies)}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Latences des recherches filtrées avec et sans index de payload.")
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--codes", type=int, default=80)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--chunks-per-article", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--ids-per-request", type=int, default=100, help="Articles par scroll MatchAny.")
+    parser.add_argument("--keep", action="store_true", help="Conserve les collections de test.")
+    parser.add_argument("--output", help="Fichier JSON où écrire les résultats.")
+    args = parser.parse_args()
+
+    vectors, payloads = synthetic_corpus(args.points, args.codes, args.dim, args.chunks_per_article)
+    results = {}
+    for label, indexed in (("sans_index", False), ("avec_index", True)):
+        name = f"bench_filters_{label}"
+        logging.info(f"Chargement de {args.points} points ({args.codes} codes) dans '{name}'...")
+        load_collection(name, vectors, payloads, indexed)
+        results[label] = measure(name, vectors, payloads, args.queries, args.ids_per_request)
+        logging.info(f"{label} : {json.dumps(results[label])}")
+        if not args.keep:
+            get_client().delete_collection(name)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
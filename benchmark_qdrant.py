@@ -0,0 +1,142 @@
+import json
+import time
+import logging
+import argparse
+import numpy as np
+from app.qdrant import get_client
+from app.collection import COLLECTION_NAME, collection_schema, search_params, wait_for_green
+
+# Benchmark des configurations de stockage de la collection : pour chaque configuration,
+# les vecteurs de `articles_chunked` sont copiés dans une collection temporaire, puis on
+# mesure le recall@k par rapport à une recherche exacte (calculée avec NumPy) et les
+# latences p50/p99. Exemple :
+#   python benchmark_qdrant.py --queries 500 --k 10 --output bench_qdrant.json
+
+SOURCE_COLLECTION = COLLECTION_NAME
+SCROLL_PAGE_SIZE = 2000
+
+DEFAULT_CONFIGS = [
+    {"name": "float32_ram", "quantization": "none", "on_disk": False},
+    {"name": "scalar_int8", "quantization": "scalar", "on_disk": True, "rescore": True, "oversampling": 2.0},
+    {"name": "scalar_int8_no_rescore", "quantization": "scalar", "on_disk": True, "rescore": False},
+    {"name": "binary", "quantization": "binary", "on_disk": True, "rescore": True, "oversampling": 3.0},
+]
+
+
+def fetch_vectors(collection_name: str, max_points: int = None):
+    """Récupère (ids, vecteurs float32) de la collection source."""
+    client = get_client()
+    ids, vectors = [], []
+    offset = None
+    while True:
+        page, offset = client.scroll(
+            collection_name=collection_name,
+            limit=SCROLL_PAGE_SIZE,
+            offset=offset,
+            with_payload=False,
+            with_vectors=True
+        )
+        for point in page:
+            ids.append(point.id)
+            vectors.append(point.vector)
+        if offset is None or not page or (max_points and len(ids) >= max_points):
+            break
+    if max_points:
+        ids, vectors = ids[:max_points], vectors[:max_points]
+    return ids, np.asarray(vectors, dtype=np.float32)
+
+
+def exact_neighbors(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Indices des k plus proches voisins exacts (similarité cosinus)."""
+    corpus = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    neighbors = []
+    for start in range(0, len(queries), 256):
+        scores = queries[start:start + 256] @ corpus.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        neighbors.append(np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1))
+    return np.vstack(neighbors)
+
+
+def estimated_ram_bytes(n_points: int, dim: int, config: dict) -> int:
+    """RAM approximative occupée par les vecteurs (hors graphe HNSW et payloads)."""
+    ram = 0 if config.get("on_disk") else n_points * dim * 4
+    quantization = config.get("quantization", "none")
+    if quantization == "scalar":
+        ram += n_points * dim
+    elif quantization == "binary":
+        ram += n_points * dim // 8
+    return ram
+
+
+def benchmark_config(config: dict, ids: list, vectors: np.ndarray, query_indices: np.ndarray, truth: np.ndarray, k: int, keep: bool = False) -> dict:
+    """Crée la collection de test pour une configuration et mesure recall@k et latences."""
+    client = get_client()
+    name = f"bench_{config['name']}"
+    schema = collection_schema(
+        vectors.shape[1],
+        quantization=config.get("quantization", "none"),
+        on_disk=config.get("on_disk", False),
+        m=config.get("m"),
+        ef_construct=config.get("ef_construct"),
+    )
+    logging.info(f"Configuration '{config['name']}' : copie de {len(ids)} vecteurs dans '{name}'...")
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    client.create_collection(collection_name=name, **schema)
+    client.upload_collection(collection_name=name, vectors=vectors, ids=ids, batch_size=256, wait=True)
+    wait_for_green(client, name)
+
+    params = search_params(hnsw_ef=config.get("hnsw_ef"), rescore=config.get("rescore"), oversampling=config.get("oversampling"))
+    position = {point_id: i for i, point_id in enumerate(ids)}
+    latencies, hits = [], 0
+    for row, query_index in enumerate(query_indices):
+        start = time.perf_counter()
+        result = client.query_points(collection_name=name, query=vectors[query_index], search_params=params, limit=k, with_payload=False)
+        latencies.append(time.perf_counter() - start)
+        found = {position[point.id] for point in result.points}
+        hits += len(found.intersection(truth[row].tolist()))
+
+    if not keep:
+        client.delete_collection(name)
+    latencies = np.array(latencies)
+    return {
+        "config": config["name"],
+        f"recall@{k}": round(hits / (len(query_indices) * k), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 2),
+        "estimated_vector_ram_mb": round(estimated_ram_bytes(len(ids), vectors.shape[1], config) / 1024 ** 2, 1),
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Recall@k et latences des configurations de stockage Qdrant.")
+    parser.add_argument("--configs", help="Fichier JSON listant les configurations (par défaut : jeu intégré).")
+    parser.add_argument("--queries", type=int, default=200, help="Nombre de vecteurs du corpus utilisés comme requêtes.")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--max-points", type=int, help="Limite le nombre de vecteurs copiés.")
+    parser.add_argument("--keep", action="store_true", help="Conserve les collections de test.")
+    parser.add_argument("--output", help="Fichier JSON où écrire les résultats.")
+    args = parser.parse_args()
+
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, "r", encoding="utf-8") as f:
+            configs = json.load(f)
+
+    ids, vectors = fetch_vectors(SOURCE_COLLECTION, args.max_points)
+    logging.info(f"{len(ids)} vecteurs récupérés depuis '{SOURCE_COLLECTION}'.")
+    rng = np.random.default_rng(0)
+    query_indices = rng.choice(len(ids), size=min(args.queries, len(ids)), replace=False)
+    truth = exact_neighbors(vectors, vectors[query_indices], args.k)
+
+    results = []
+    for config in configs:
+        stats = benchmark_config(config, ids, vectors, query_indices, truth, args.k, keep=args.keep)
+        logging.info(json.dumps(stats))
+        results.append(stats)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
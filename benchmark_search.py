@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+import numpy as np
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+# Benchmark de charge des endpoints de recherche : compare le chemin synchrone (/search)
+# et le chemin asynchrone (/async/search, servi en ASGI) d'une API déjà démarrée, à
+# plusieurs niveaux de concurrence. Exemple :
+#   python benchmark_search.py --url http://localhost:5001 --concurrency 1 8 32 --requests 500
+
+DEFAULT_QUERIES = [
+    "délit de fuite",
+    "congé maladie d'un fonctionnaire",
+    "réquisition des biens en temps de guerre",
+    "durée légale du travail",
+    "protection des données personnelles",
+    "responsabilité du gardien d'un animal",
+    "obligation de réserve des agents publics",
+    "service national universel",
+]
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def timed_request(url: str, api_key: str, payload: dict):
+    """Envoie une recherche et renvoie (latence en secondes, succès)."""
+    start = time.perf_counter()
+    try:
+        response = _session().post(url, json=payload, headers={"x-api-key": api_key}, timeout=60)
+        ok = response.status_code == 200
+    except requests.RequestException:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run_load(base_url: str, endpoint: str, api_key: str, queries: list, concurrency: int, n_requests: int, code_id=None) -> dict:
+    """Envoie `n_requests` recherches avec `concurrency` clients simultanés et mesure débit et latences."""
+    url = base_url.rstrip("/") + endpoint
+    rng = random.Random(0)
+    payloads = []
+    for i in range(n_requests):
+        # Suffixe unique : chaque requête est réellement vectorisée (pas de hit du cache des requêtes).
+        payload = {"query": f"{rng.choice(queries)} {i}", "limit": 10}
+        if code_id:
+            payload["code_id"] = code_id
+        payloads.append(payload)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda p: timed_request(url, api_key, p), payloads))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for latency, ok in results if ok])
+    errors = sum(1 for _, ok in results if not ok)
+    stats = {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": errors,
+        "throughput_rps": round((n_requests - errors) / elapsed, 2) if elapsed else 0.0,
+    }
+    if len(latencies):
+        for q in (50, 95, 99):
+            stats[f"p{q}_ms"] = round(float(np.percentile(latencies, q)) * 1000, 1)
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Compare /search et /async/search sous charge.")
+    parser.add_argument("--url", default="http://localhost:5001", help="URL de base de l'API.")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY"), help="Clé API (par défaut : variable API_KEY).")
+    parser.add_argument("--endpoints", nargs="+", default=["/search", "/async/search"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Nombre de recherches par mesure.")
+    parser.add_argument("--queries", help="Fichier de requêtes (une par ligne).")
+    parser.add_argument("--code-id", help="Filtre code_id appliqué à toutes les recherches.")
+    parser.add_argument("--output", help="Fichier JSON où écrire les résultats.")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    all_stats = []
+    for concurrency in args.concurrency:
+        for endpoint in args.endpoints:
+            stats = run_load(args.url, endpoint, args.api_key, queries, concurrency, args.requests, args.code_id)
+            logging.info(json.dumps(stats, ensure_ascii=False))
+            all_stats.append(stats)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(all_stats, f, indent=2)
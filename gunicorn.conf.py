@@ -0,0 +1,55 @@
+import gc
+import os
+import shutil
+import logging
+
+from app.parallel import default_worker_count, limit_torch_threads
+
+# Configuration du serveur de production : `gunicorn -c gunicorn.conf.py`
+#
+# Le modèle d'embedding est chargé (et préchauffé) une seule fois dans le processus maître
+# (`preload_app`), puis les workers sont créés par fork : les poids sont partagés en
+# copy-on-write au lieu d'être dupliqués dans chaque worker.
+#
+# Avec WEB_ASGI=1 (défaut), chaque worker exécute une boucle asyncio (uvicorn) qui sert
+# /async/search nativement et transmet les autres routes à Flask dans WEB_THREADS threads ;
+# avec WEB_ASGI=0, seule l'application Flask est servie par des workers gthread.
+
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", "2"))
+WEB_ASGI = os.getenv("WEB_ASGI", "1") == "1"
+
+wsgi_app = "asgi:app" if WEB_ASGI else "wsgi:app"
+bind = os.getenv("WEB_BIND", "0.0.0.0:5001")
+workers = int(os.getenv("WEB_WORKERS", str(default_worker_count(TORCH_THREADS_PER_WORKER))))
+worker_class = "uvicorn.workers.UvicornWorker" if WEB_ASGI else "gthread"
+threads = int(os.getenv("WEB_THREADS", "4"))
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+preload_app = True
+
+# Le maître n'exécute que le préchauffage : un seul thread OpenMP, pour qu'aucun pool de
+# threads natifs ne soit créé avant le fork (les pools OpenMP ne survivent pas au fork).
+os.environ["OMP_NUM_THREADS"] = "1"
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+# Métriques Prometheus agrégées entre workers (mode multiprocess de prometheus_client) :
+# le répertoire est vidé avant le chargement de l'application, qui y crée ses fichiers.
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def when_ready(server):
+    # Les objets chargés par le maître (modèle compris) sont exclus du ramasse-miettes :
+    # ses passages n'écrivent plus dans leurs pages, qui restent partagées avec les workers.
+    gc.freeze()
+    logging.info(f"Serveur prêt : {workers} workers x {threads} threads, {TORCH_THREADS_PER_WORKER} thread(s) torch par worker.")
+
+
+def post_fork(server, worker):
+    limit_torch_threads(TORCH_THREADS_PER_WORKER)
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,12 +1,39 @@
+import os
 import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+# Les tests n'ont pas besoin du modèle : pas de préchauffage (défini avant l'import de l'application).
+os.environ.setdefault("MODEL_WARMUP", "off")
+
 from app import create_app
 
-@pytest.fixture
-def test_client(monkeypatch):
-  
+@pytest.fixture(autouse=True)
+def isolated_index_files(monkeypatch, tmp_path):
+    """Les fichiers partagés entre processus (index article -> cluster, génération de l'index) restent dans tmp_path."""
+    monkeypatch.setattr('app.cluster_index.CLUSTER_INDEX_DIR', str(tmp_path / "cluster_index"))
+    monkeypatch.setattr('app.result_cache.INDEX_GENERATION_FILE', str(tmp_path / "index_generation"))
+
+def make_test_app(monkeypatch, tmp_path):
     monkeypatch.setattr('app.auth.API_KEY', 'super-secret-test-key')
+    from app.result_cache import result_cache
+    result_cache.clear()
     flask_app = create_app()
     flask_app.config['TESTING'] = True
+    return flask_app
+
+@pytest.fixture
+def test_client(monkeypatch, tmp_path):
+  
+    flask_app = make_test_app(monkeypatch, tmp_path)
     with flask_app.test_client() as testing_client:
         with flask_app.app_context():
-            yield testing_client
\ No newline at end of file
+            yield testing_client
+
+@pytest.fixture
+def asgi_client(monkeypatch, tmp_path):
+    """Client de l'application ASGI (asgi.py), avec un client Qdrant asynchrone simulé."""
+    from starlette.testclient import TestClient
+    from app.routes.search_async import create_asgi_app
+    monkeypatch.setattr('app.routes.search_async.get_async_client', lambda: MagicMock(close=AsyncMock()))
+    with TestClient(create_asgi_app(make_test_app(monkeypatch, tmp_path))) as testing_client:
+        yield testing_client
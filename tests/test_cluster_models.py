@@ -0,0 +1,44 @@
+import numpy as np
+import hdbscan
+from unittest.mock import MagicMock
+from sklearn.decomposition import PCA
+from app import cluster_models
+
+def _fit_models(seed=0):
+    rng = np.random.RandomState(seed)
+    vectors = np.vstack([rng.normal(0, 0.05, (40, 8)), rng.normal(5, 0.05, (40, 8))]).astype(np.float32)
+    reducer = PCA(n_components=2, random_state=42)
+    reduced = reducer.fit_transform(vectors)
+    clusterer = hdbscan.HDBSCAN(min_cluster_size=10, prediction_data=True)
+    labels = clusterer.fit_predict(reduced)
+    return vectors, labels, reducer, clusterer
+
+def test_save_and_assign_new_vectors(tmp_path, monkeypatch):
+    """Teste que des vecteurs proches d'un cluster existant reçoivent son label sans réajustement."""
+    monkeypatch.setattr(cluster_models, "CLUSTER_MODELS_DIR", str(tmp_path))
+    monkeypatch.setattr(cluster_models, "_loaded", {})
+    vectors, labels, reducer, clusterer = _fit_models()
+
+    version = cluster_models.save_cluster_models("CODE_TEST", reducer, clusterer, {"umap": {}, "hdbscan": {}})
+    assert cluster_models.latest_version("CODE_TEST") == version
+
+    assigned = cluster_models.assign_clusters("CODE_TEST", vectors[[0, 79]] + 0.01)
+    assert assigned.tolist() == [labels[0], labels[79]]
+
+def test_assign_without_model_returns_none(tmp_path, monkeypatch):
+    """Teste qu'un code sans modèle sauvegardé n'est pas affecté."""
+    monkeypatch.setattr(cluster_models, "CLUSTER_MODELS_DIR", str(tmp_path))
+    assert cluster_models.assign_clusters("CODE_INCONNU", np.zeros((1, 8))) is None
+
+def test_startup_sets_cluster_id_on_new_chunks(mocker):
+    """Teste que l'ETL renseigne le cluster_id des nouveaux chunks à partir des modèles sauvegardés."""
+    from app import startup
+    mocker.patch('app.startup.assign_clusters', side_effect=lambda code_id, vectors: np.array([3]) if code_id == "CODE_A" else None)
+    batch = [("id1", {"code_parent": "CODE_A"}), ("id2", {"code_parent": "CODE_B"})]
+    stats = {"assigned": 0}
+
+    startup.assign_batch_clusters(batch, np.array([[0.1], [0.2]], dtype=np.float32), stats)
+
+    assert batch[0][1]["cluster_id"] == 3
+    assert "cluster_id" not in batch[1][1]
+    assert stats["assigned"] == 1
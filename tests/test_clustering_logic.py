@@ -20,17 +20,20 @@ def test_main_clustering_logic_success(mocker):
         'app.run_clustering.client.scroll',
         return_value=([mock_point_1, mock_point_2], None)
     )
+    mocker.patch('app.run_clustering.client.count', return_value=MagicMock(count=2))
     
     mocker.patch(
-        'app.run_clustering.umap.UMAP.fit_transform',
+        'umap.umap_.UMAP.fit_transform',
         return_value=np.array([[1.0, 2.0], [3.0, 4.0]])
     )
     mocker.patch(
-        'app.run_clustering.hdbscan.HDBSCAN.fit_predict',
+        'hdbscan.HDBSCAN.fit_predict',
         return_value=np.array([0, 1]) 
     )
 
-    mock_upsert = mocker.patch('app.run_clustering.client.upsert')
+    mock_update = mocker.patch('app.run_clustering.client.batch_update_points')
+    mock_save = mocker.patch('app.run_clustering.save_cluster_models')
+    mock_publish = mocker.patch('app.run_clustering.publish_article_clusters')
 
     main(
         code_id="CODE_TEST",
@@ -38,12 +41,108 @@ def test_main_clustering_logic_success(mocker):
         hdbscan_params={'min_cluster_size': 2, 'min_samples': 2}
     )
 
-    assert mock_upsert.called
-    upsert_call = mock_upsert.call_args[1]
-    points_to_update = upsert_call['points']
+    assert mock_update.called
+    update_call = mock_update.call_args[1]
+    operations = update_call['update_operations']
 
-    assert points_to_update[0].id == 'id1'
-    assert points_to_update[0].payload['cluster_id'] == 0
+    assert operations[0].set_payload.points == ['id1']
+    assert operations[0].set_payload.payload == {'cluster_id': 0}
     
-    assert points_to_update[1].id == 'id2'
-    assert points_to_update[1].payload['cluster_id'] == 1
\ No newline at end of file
+    assert operations[1].set_payload.points == ['id2']
+    assert operations[1].set_payload.payload == {'cluster_id': 1}
+    assert update_call['wait'] is True
+    assert mock_save.call_args[0][0] == "CODE_TEST"
+    mock_publish.assert_called_once_with("CODE_TEST", {'art1': 0, 'art2': 1})
+
+def test_fetch_points_by_code_follows_pagination(mocker):
+    """Teste que toutes les pages du scroll sont lues et stockées dans une matrice float32."""
+    from app.run_clustering import fetch_points_by_code
+
+    def make_point(point_id, article_id):
+        point = MagicMock()
+        point.id = point_id
+        point.vector = [1.0, 2.0, 3.0]
+        point.payload = {'original_id': article_id}
+        return point
+
+    mock_scroll = mocker.patch(
+        'app.run_clustering.client.scroll',
+        side_effect=[
+            ([make_point('id1', 'art1'), make_point('id2', 'art1')], 'offset_page_2'),
+            ([make_point('id3', 'art2')], None),
+        ]
+    )
+    # Le comptage sous-estime volontairement : la matrice doit être agrandie.
+    mocker.patch('app.run_clustering.client.count', return_value=MagicMock(count=2))
+
+    points = fetch_points_by_code("articles_chunked", "CODE_TEST", payload_fields=["original_id"])
+
+    assert mock_scroll.call_args_list[1][1]['offset'] == 'offset_page_2'
+    assert list(points.ids) == ['id1', 'id2', 'id3']
+    assert points.vectors.shape == (3, 3)
+    assert points.vectors.dtype == np.float32
+    assert list(points.payload['original_id']) == ['art1', 'art1', 'art2']
+    assert points.ids.dtype == np.dtype('U36')
+    assert points.payload['original_id'].dtype.kind == 'U'
+
+def test_fetch_points_by_code_uses_memmap_for_large_codes(mocker):
+    """Teste qu'au-delà du seuil configuré, les vecteurs sont écrits dans un memmap."""
+    from app.run_clustering import fetch_points_by_code
+    mocker.patch('app.run_clustering.MEMMAP_THRESHOLD_BYTES', 0)
+    point = MagicMock(id='id1', vector=[0.5, 0.5], payload={})
+    mocker.patch('app.run_clustering.client.scroll', return_value=([point], None))
+    mocker.patch('app.run_clustering.client.count', return_value=MagicMock(count=1))
+
+    points = fetch_points_by_code("articles_chunked", "CODE_TEST", payload_fields=[])
+
+    assert isinstance(points.vectors, np.memmap)
+    assert points.vectors[0].tolist() == [0.5, 0.5]
+
+def test_write_cluster_ids_groups_by_label_and_pipelines(mocker):
+    """Teste le regroupement des points par label et l'attente sur la seule dernière requête."""
+    from app.run_clustering import write_cluster_ids
+    mocker.patch('app.run_clustering.SET_PAYLOAD_BATCH_SIZE', 2)
+    mocker.patch('app.run_clustering.OPERATIONS_PER_REQUEST', 2)
+    mock_update = mocker.patch('app.run_clustering.client.batch_update_points')
+
+    ids = np.array(['a', 'b', 'c', 'd', 'e'], dtype=object)
+    labels = np.array([1, -1, 1, 1, -1])
+    stats = write_cluster_ids("articles_chunked", ids, labels)
+
+    sent = [op.set_payload for call in mock_update.call_args_list for op in call[1]['update_operations']]
+    assert [(p.payload['cluster_id'], p.points) for p in sent] == [(-1, ['b', 'e']), (1, ['a', 'c']), (1, ['d'])]
+    assert [call[1]['wait'] for call in mock_update.call_args_list] == [False, True]
+    assert stats['operations'] == 3 and stats['requests'] == 2
+    assert stats['bytes_sent'] > 0
+
+def test_run_jobs_isolates_failures_and_writes_summary(mocker, tmp_path):
+    """Teste qu'un code en échec n'interrompt pas les autres et que le récapitulatif est écrit."""
+    import json
+    from concurrent.futures import ThreadPoolExecutor
+    from app import run_clustering
+
+    config_path = tmp_path / "jobs.json"
+    config_path.write_text(json.dumps({
+        "max_workers": 2,
+        "threads_per_job": 2,
+        "jobs": [
+            {"code_id": "CODE_OK", "umap": {}, "hdbscan": {}, "threads": 3},
+            {"code_id": "CODE_KO", "umap": {}, "hdbscan": {}},
+        ]
+    }))
+    summary_path = tmp_path / "summary.json"
+
+    def fake_main(code_id, umap_params, hdbscan_params):
+        if code_id == "CODE_KO":
+            raise RuntimeError("Qdrant indisponible")
+
+    mocker.patch('app.run_clustering.main', side_effect=fake_main)
+    mock_limit = mocker.patch('app.run_clustering.limit_worker_threads')
+    mocker.patch('app.run_clustering.worker_pool', return_value=ThreadPoolExecutor(max_workers=2))
+
+    run_clustering.run_jobs(str(config_path), str(summary_path))
+
+    summary = json.loads(summary_path.read_text())
+    status_by_code = {job["code_id"]: job["status"] for job in summary["jobs"]}
+    assert status_by_code == {"CODE_OK": "success", "CODE_KO": "failed"}
+    assert sorted(call[0][0] for call in mock_limit.call_args_list) == [2, 3]
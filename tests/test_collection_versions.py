@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from qdrant_client import QdrantClient, models
+from app import collection_versions as versions
+from app.cluster_index import ArticleClusterIndex, publish_article_clusters
+
+
+ALIAS = "articles_chunked"
+
+def make_collection(client, name, n_points, dim=4):
+    client.create_collection(collection_name=name, vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE))
+    if n_points:
+        vectors = np.random.default_rng(len(name)).normal(size=(n_points, dim)).tolist()
+        client.upsert(collection_name=name, points=[models.PointStruct(id=i, vector=v) for i, v in enumerate(vectors)])
+
+@pytest.fixture
+def client():
+    return QdrantClient(":memory:")
+
+def test_switch_alias_replaces_legacy_collection_and_rolls_back(client):
+    """Teste la bascule depuis une collection non versionnée, conservée comme première cible de rollback."""
+    make_collection(client, ALIAS, 5)
+    make_collection(client, f"{ALIAS}_v20250101T000000", 6)
+    make_collection(client, f"{ALIAS}_v20250201T000000", 7)
+
+    versions.switch_alias(client, ALIAS, f"{ALIAS}_v20250101T000000")
+    assert versions.resolve_alias(client, ALIAS) == f"{ALIAS}_v20250101T000000"
+    assert ALIAS not in [c.name for c in client.get_collections().collections]
+    assert versions.published_versions(client, ALIAS) == [f"{ALIAS}_v00000000T000000", f"{ALIAS}_v20250101T000000"]
+
+    versions.switch_alias(client, ALIAS, f"{ALIAS}_v20250201T000000")
+    assert client.count(collection_name=ALIAS).count == 7
+
+    assert versions.rollback(client, ALIAS) == f"{ALIAS}_v20250101T000000"
+    assert versions.rollback(client, ALIAS) == f"{ALIAS}_v00000000T000000"
+    assert client.count(collection_name=ALIAS).count == 5
+    with pytest.raises(RuntimeError):
+        versions.rollback(client, ALIAS)
+
+def test_prune_versions_keeps_previous_versions(client):
+    """Teste que seules les versions au-delà des `keep` précédentes sont supprimées."""
+    names = [f"{ALIAS}_v2025010{i}T000000" for i in range(1, 5)]
+    for name in names:
+        make_collection(client, name, 1)
+        versions.switch_alias(client, ALIAS, name)
+
+    assert versions.prune_versions(client, ALIAS, keep=1) == names[:2]
+    assert versions.list_versions(client, ALIAS) == names[2:]
+
+def test_rejected_build_is_never_a_rollback_target(client, mocker):
+    """Teste qu'une version rejetée, puis une version validée, laissent le rollback sur la dernière version servie."""
+    from app import startup
+    mocker.patch('app.startup.client', client)
+    mocker.patch('app.startup.publish_index_generation')
+    good, rejected, latest = (f"{ALIAS}_v2025010{i}T000000" for i in range(1, 4))
+    make_collection(client, good, 20)
+    versions.switch_alias(client, ALIAS, good)
+
+    make_collection(client, rejected, 2)
+    assert not startup.publish_version(rejected, good)
+    assert rejected not in versions.list_versions(client, ALIAS)
+
+    make_collection(client, latest, 20)
+    assert startup.publish_version(latest, good)
+    assert versions.list_versions(client, ALIAS) == [good, latest]
+    assert versions.rollback(client, ALIAS) == good
+
+def test_prune_removes_versions_never_served(client):
+    """Teste qu'une version jamais servie (build interrompu) est supprimée et ignorée par le rollback."""
+    served, interrupted, latest = (f"{ALIAS}_v2025010{i}T000000" for i in range(1, 4))
+    for name in (served, interrupted, latest):
+        make_collection(client, name, 1)
+    versions.switch_alias(client, ALIAS, served)
+    versions.switch_alias(client, ALIAS, latest)
+
+    assert versions.prune_versions(client, ALIAS, keep=1) == [interrupted]
+    assert versions.rollback(client, ALIAS) == served
+
+def test_validate_collection_rejects_shrunken_version(client):
+    """Teste le contrôle de taille et d'auto-recherche avant bascule."""
+    make_collection(client, "ancienne", 20)
+    make_collection(client, "complete", 20)
+    make_collection(client, "partielle", 5)
+
+    ok, report = versions.validate_collection(client, "complete", previous="ancienne", samples=5)
+    assert ok and report["self_recall"] == 1.0
+
+    ok, report = versions.validate_collection(client, "partielle", previous="ancienne", samples=5)
+    assert not ok and report["problems"]
+
+def test_validate_collection_accepts_duplicate_chunks(client):
+    """Teste que des chunks identiques, à égalité en tête de leur recherche, ne font pas échouer l'auto-recherche."""
+    client.create_collection(collection_name="doublons", vectors_config=models.VectorParams(size=4, distance=models.Distance.COSINE))
+    client.upsert(collection_name="doublons", points=[models.PointStruct(id=i, vector=[1.0, 0.0, 0.0, 0.0]) for i in range(15)])
+
+    ok, report = versions.validate_collection(client, "doublons", samples=15)
+    assert ok and report["self_recall"] == 1.0
+
+def test_full_rebuild_switches_alias_after_build(client, mocker):
+    """Teste qu'une reconstruction complète remplit une nouvelle version et ne bascule l'alias qu'à la fin."""
+    from app import startup
+    make_collection(client, f"{ALIAS}_v20250101T000000", 1, dim=3)
+    versions.switch_alias(client, ALIAS, f"{ALIAS}_v20250101T000000")
+
+    articles = [{"_key": f"art{i}", "num": f"Art. {i}", "content": f"Texte {i}.", "code_parent": "CODE"} for i in range(3)]
+    served_during_build = []
+
+    def fake_embed(texts, use_store=False):
+        served_during_build.append(versions.resolve_alias(client, ALIAS))
+        return np.random.default_rng(len(texts)).normal(size=(len(texts), 3)).astype(np.float32)
+
+    mocker.patch('app.startup.client', client)
+    mocker.patch('app.startup.load_model', return_value=MagicMock(get_sentence_embedding_dimension=lambda: 3))
+    mocker.patch('app.chunking.CHUNKING_MODE', 'chars')
+    mocker.patch('app.startup.publish_index_generation')
+    mocker.patch('app.startup.get_all_articles_from_api', return_value=articles)
+    mocker.patch('app.startup.get_embeddings_batch', side_effect=fake_embed)
+    mock_assign = mocker.patch('app.startup.assign_clusters')
+    mocker.patch('app.startup.new_version_name', return_value=f"{ALIAS}_v20250301T000000")
+
+    publish_article_clusters("CODE", {"art0": 1})
+    startup.initialize_vector_index(full_rebuild=True)
+
+    assert not mock_assign.called
+    assert ArticleClusterIndex(check_interval=0).lookup(["art0"]) == ({}, ["art0"])
+
+    assert served_during_build == [f"{ALIAS}_v20250101T000000"]
+    assert versions.resolve_alias(client, ALIAS) == f"{ALIAS}_v20250301T000000"
+    assert client.count(collection_name=ALIAS).count == 3
+    assert f"{ALIAS}_v20250101T000000" in versions.list_versions(client, ALIAS)
@@ -0,0 +1,40 @@
+import numpy as np
+from unittest.mock import MagicMock
+from app import embedding_store
+from app.embedding_store import EmbeddingStore, encode_with_store
+
+def test_store_roundtrip_and_reopen(tmp_path):
+    """Teste qu'un vecteur ajouté est relu à l'identique, y compris après réouverture du stockage."""
+    store = EmbeddingStore("org/modele", "none", root_dir=str(tmp_path))
+    vectors = np.array([[1.0, 2.0], [3.0, 4.0]], dtype=np.float32)
+    store.add(["a", "b"], vectors)
+
+    reopened = EmbeddingStore("org/modele", "none", root_dir=str(tmp_path))
+    rows, missing = reopened.lookup(["b", "inconnu", "a"])
+    assert missing == [1]
+    np.testing.assert_array_equal(reopened.read(rows[[0, 2]]), vectors[[1, 0]])
+
+def test_store_repairs_truncated_write(tmp_path):
+    """Teste qu'une écriture interrompue (clé sans vecteur complet) est ignorée à la réouverture."""
+    store = EmbeddingStore("modele", "none", root_dir=str(tmp_path))
+    store.add(["a"], np.array([[1.0, 2.0]], dtype=np.float32))
+    with open(store.vectors_path, "ab") as f:
+        f.write(b"\x00\x00")
+    with open(store.keys_path, "ab") as f:
+        f.write(b"k" * embedding_store.KEY_SIZE)
+
+    reopened = EmbeddingStore("modele", "none", root_dir=str(tmp_path))
+    assert len(reopened) == 1
+
+def test_encode_with_store_only_computes_missing(tmp_path, monkeypatch):
+    """Teste que seuls les textes absents du stockage sont envoyés au modèle."""
+    monkeypatch.setattr(embedding_store, "EMBEDDING_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(embedding_store, "_stores", {})
+    encode = MagicMock(side_effect=lambda texts: np.array([[float(len(t)), 0.0] for t in texts]))
+
+    encode_with_store(["a", "bb"], "modele", "none", encode)
+    result = encode_with_store(["bb", "ccc", "a"], "modele", "none", encode)
+
+    assert encode.call_args_list[1][0][0] == ["ccc"]
+    np.testing.assert_array_equal(result[:, 0], [2.0, 3.0, 1.0])
+    assert result.dtype == np.float32
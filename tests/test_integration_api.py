@@ -1,6 +1,8 @@
+import threading
 import json
+import numpy as np
 from qdrant_client import models
-from unittest.mock import MagicMock 
+from unittest.mock import AsyncMock, MagicMock 
 
 TEST_API_KEY = 'super-secret-test-key'
 
@@ -68,6 +70,82 @@ def test_search_endpoint_with_code_filter_success(test_client, mocker):
     assert call_kwargs['query_filter'].must[0].key == "code_parent"
     assert call_kwargs['query_filter'].must[0].match.value == 'CODE_TEST_PARENT'
 
+# --- Tests pour le endpoint /async/search (application ASGI) ---
+
+def test_async_search_endpoint_success(asgi_client, mocker):
+    """Teste /async/search : vectorisation dans l'exécuteur puis appel au client Qdrant asynchrone."""
+    from app.routes.search_async import searcher
+    mock_point = MagicMock()
+    mock_point.payload = {'original_id': 'article_async_1', 'code_parent': 'CODE_TEST_PARENT', 'title': 'Art. 1'}
+    mock_point.score = 0.9
+    searcher.client.query_points = AsyncMock(return_value=MagicMock(points=[mock_point]))
+    mock_embed = mocker.patch('app.routes.search_async.get_embedding', return_value=np.array([0.1, 0.2], dtype=np.float32))
+
+    headers = {'x-api-key': TEST_API_KEY}
+    payload = {'query': 'recherche asynchrone', 'code_id': 'CODE_TEST_PARENT', 'limit': 3}
+    response = asgi_client.post('/async/search', json=payload, headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()[0]['id'] == 'article_async_1'
+    mock_embed.assert_called_once_with('recherche asynchrone', is_query=True)
+    call_kwargs = searcher.client.query_points.call_args[1]
+    assert call_kwargs['limit'] == 3
+    assert call_kwargs['query_filter'].must[0].match.value == 'CODE_TEST_PARENT'
+
+def test_async_search_endpoint_rejects_bad_requests(asgi_client):
+    """Teste /async/search sans clé API, puis sans clé 'query'."""
+    assert asgi_client.post('/async/search', json={'query': 'x'}).status_code == 403
+    response = asgi_client.post('/async/search', json={'code_id': 'X'}, headers={'x-api-key': TEST_API_KEY})
+    assert response.status_code == 400
+
+def test_asgi_app_forwards_other_routes_to_flask(asgi_client):
+    """Teste que les routes Flask restent servies derrière l'application ASGI."""
+    response = asgi_client.post('/search', json={'code_id': 'X'}, headers={'x-api-key': TEST_API_KEY})
+    assert response.status_code == 400
+    assert asgi_client.get('/ready').status_code == 200
+
+# --- Tests pour le endpoint /search/batch ---
+
+def test_search_batch_endpoint_success(test_client, mocker):
+    """Teste /search/batch : un seul appel au modèle et un seul appel batch à Qdrant."""
+    mock_embed = mocker.patch(
+        'app.routes.search.get_embeddings_batch',
+        return_value=np.array([[0.1, 0.2], [0.3, 0.4]], dtype=np.float32)
+    )
+    mock_point = MagicMock()
+    mock_point.payload = {'original_id': 'article_1', 'code_parent': 'CODE_A', 'title': 'Art. 1', 'chunk_text': 'Extrait'}
+    mock_point.score = 0.9
+    mock_batch = mocker.patch(
+        'app.routes.search.client.query_batch_points',
+        return_value=[MagicMock(points=[mock_point]), MagicMock(points=[])]
+    )
+
+    headers = {'x-api-key': TEST_API_KEY, 'Content-Type': 'application/json'}
+    payload = {'queries': [
+        {'query': 'premier', 'code_id': 'CODE_A', 'limit': 3},
+        {'query': 'second'}
+    ]}
+    response = test_client.post('/search/batch', data=json.dumps(payload), headers=headers)
+
+    assert response.status_code == 200
+    response_data = response.get_json()
+    assert len(response_data) == 2
+    assert response_data[0][0]['id'] == 'article_1'
+    assert response_data[1] == []
+
+    mock_embed.assert_called_once_with(['premier', 'second'], is_query=True)
+    requests_sent = mock_batch.call_args[1]['requests']
+    assert requests_sent[0].limit == 3
+    assert requests_sent[0].filter.must[0].match.value == 'CODE_A'
+    assert requests_sent[1].filter is None
+
+def test_search_batch_endpoint_bad_request(test_client):
+    """Teste l'échec de /search/batch quand un élément n'a pas de 'query'."""
+    headers = {'x-api-key': TEST_API_KEY, 'Content-Type': 'application/json'}
+    payload = {'queries': [{'code_id': 'CODE_A'}]}
+    response = test_client.post('/search/batch', data=json.dumps(payload), headers=headers)
+    assert response.status_code == 400
+
 # --- Tests pour le endpoint /clusters_for_articles ---
 
 def test_clusters_endpoint_success(test_client, mocker):
@@ -115,6 +193,16 @@ def test_clusters_endpoint_no_chunks_found(test_client, mocker):
     assert response.is_json
     assert "No chunks found for this code" in response.get_json().get('error')
 
+def test_clusters_endpoint_empty_list_not_found(test_client, mocker):
+    """Teste qu'une liste d'articles vide renvoie 404, sans appel à Qdrant."""
+    mock_scroll = mocker.patch('app.routes.cluster.client.scroll')
+
+    headers = {'x-api-key': TEST_API_KEY, 'Content-Type': 'application/json'}
+    response = test_client.post('/clusters_for_articles', data=json.dumps({'article_ids': []}), headers=headers)
+
+    assert response.status_code == 404
+    assert not mock_scroll.called
+
 def test_clusters_endpoint_article_with_no_cluster_id(test_client, mocker):
     """Teste le cas où un chunk n'a pas d'ID de cluster."""
     
@@ -133,3 +221,110 @@ def test_clusters_endpoint_article_with_no_cluster_id(test_client, mocker):
     assert response.status_code == 200
     response_data = response.get_json()
     assert response_data == {'article_sans_cluster': None}
+
+def test_clusters_endpoint_served_from_precomputed_index(test_client, mocker):
+    """Teste que les articles présents dans l'index publié par run_clustering ne déclenchent aucun appel à Qdrant."""
+    from app.cluster_index import ArticleClusterIndex, publish_article_clusters
+    publish_article_clusters('CODE_TEST', {'article_indexe': 7})
+    mocker.patch('app.routes.cluster.article_cluster_index', ArticleClusterIndex(check_interval=0))
+    mock_scroll = mocker.patch('app.routes.cluster.client.scroll')
+
+    headers = {'x-api-key': TEST_API_KEY, 'Content-Type': 'application/json'}
+    payload = {'article_ids': ['article_indexe']}
+    response = test_client.post('/clusters_for_articles', data=json.dumps(payload), headers=headers)
+
+    assert response.status_code == 200
+    assert response.get_json() == {'article_indexe': 7}
+    assert not mock_scroll.called
+
+def test_clusters_endpoint_falls_back_to_qdrant_for_unindexed_articles(test_client, mocker):
+    """Teste que les articles absents de l'index sont recherchés dans Qdrant et fusionnés au résultat."""
+    from app.cluster_index import ArticleClusterIndex, publish_article_clusters
+    publish_article_clusters('CODE_TEST', {'article_indexe': 7})
+    mocker.patch('app.routes.cluster.article_cluster_index', ArticleClusterIndex(check_interval=0))
+    mock_point = MagicMock()
+    mock_point.payload = {'original_id': 'article_nouveau', 'cluster_id': 2}
+    mock_scroll = mocker.patch('app.routes.cluster.client.scroll', return_value=([mock_point], None))
+
+    headers = {'x-api-key': TEST_API_KEY, 'Content-Type': 'application/json'}
+    payload = {'article_ids': ['article_indexe', 'article_nouveau']}
+    response = test_client.post('/clusters_for_articles', data=json.dumps(payload), headers=headers)
+
+    assert response.get_json() == {'article_indexe': 7, 'article_nouveau': 2}
+    scroll_filter = mock_scroll.call_args[1]['scroll_filter']
+    assert scroll_filter.must[0].match.any == ['article_nouveau']
+
+def test_clusters_endpoint_shards_and_paginates(test_client, mocker):
+    """Teste le découpage des grandes listes en lots et le suivi de la pagination du scroll."""
+    mocker.patch('app.routes.cluster.SHARD_SIZE', 2)
+
+    def fake_scroll(**kwargs):
+        article_ids = kwargs['scroll_filter'].must[0].match.any
+        if kwargs['offset'] is None:
+            return [MagicMock(payload={'original_id': a, 'cluster_id': 1}) for a in article_ids], 'page_2'
+        return [MagicMock(payload={'original_id': a, 'cluster_id': 4}) for a in article_ids] * 2, None
+
+    mock_scroll = mocker.patch('app.routes.cluster.client.scroll', side_effect=fake_scroll)
+
+    headers = {'x-api-key': TEST_API_KEY, 'Content-Type': 'application/json'}
+    payload = {'article_ids': ['a1', 'a2', 'a3']}
+    response = test_client.post('/clusters_for_articles', data=json.dumps(payload), headers=headers)
+
+    assert response.status_code == 200
+    assert response.get_json() == {'a1': 4, 'a2': 4, 'a3': 4}
+    shards = sorted(tuple(call[1]['scroll_filter'].must[0].match.any) for call in mock_scroll.call_args_list)
+    assert shards == [('a1', 'a2'), ('a1', 'a2'), ('a3',), ('a3',)]
+
+def test_clusters_endpoint_ndjson_stream(test_client, mocker):
+    """Teste la réponse NDJSON en streaming."""
+    mock_point = MagicMock()
+    mock_point.payload = {'original_id': 'article_1', 'cluster_id': 3}
+    mocker.patch('app.routes.cluster.client.scroll', return_value=([mock_point], None))
+
+    headers = {'x-api-key': TEST_API_KEY, 'Content-Type': 'application/json'}
+    payload = {'article_ids': ['article_1'], 'stream': True}
+    response = test_client.post('/clusters_for_articles', data=json.dumps(payload), headers=headers)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines == [{'article_id': 'article_1', 'cluster_id': 3}]
+
+def test_ready_endpoint_without_warmup(test_client):
+    """Teste que sans préchauffage (MODEL_WARMUP=off), l'API se déclare prête immédiatement."""
+    response = test_client.get('/ready')
+    assert response.status_code == 200
+    assert response.json['status'] == 'ready'
+
+def test_ready_endpoint_reports_warmup_in_progress(test_client, mocker):
+    """Teste que /ready renvoie 503 tant que le préchauffage n'est pas terminé."""
+    mocker.patch('app.warmup._ready', new=threading.Event())
+    mocker.patch.dict('app.warmup._state', {"status": "warming"})
+    response = test_client.get('/ready')
+    assert response.status_code == 503
+    assert response.json['status'] == 'warming'
+
+def test_search_endpoint_serves_repeated_query_from_result_cache(test_client, mocker):
+    """Teste qu'une requête proche d'une requête récente n'interroge pas Qdrant une seconde fois."""
+    mock_point = MagicMock()
+    mock_point.payload = {'original_id': 'article_1', 'code_parent': 'CODE_A', 'title': 'Art. 1', 'chunk_text': 'Extrait'}
+    mock_point.score = 0.9
+    mocker.patch('app.routes.search.get_embedding', side_effect=[np.array([1.0, 0.0], dtype=np.float32), np.array([0.999, 0.02], dtype=np.float32)])
+    mock_query = mocker.patch('app.routes.search.client.query_points', return_value=MagicMock(points=[mock_point]))
+
+    headers = {'x-api-key': TEST_API_KEY, 'Content-Type': 'application/json'}
+    first = test_client.post('/search', data=json.dumps({'query': 'délai de prescription', 'code_id': 'CODE_A'}), headers=headers)
+    second = test_client.post('/search', data=json.dumps({'query': 'délais de prescription', 'code_id': 'CODE_A'}), headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.get_json() == first.get_json()
+    mock_query.assert_called_once()
+
+def test_metrics_endpoint_exposes_application_metrics(test_client):
+    """Teste que /metrics (servi par PrometheusMetrics) expose les métriques HTTP et celles de l'application."""
+    test_client.get('/ready')
+    response = test_client.get('/metrics')
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert 'flask_http_request_total' in body
+    assert 'search_result_cache_hits_total' in body
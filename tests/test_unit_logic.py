@@ -1,4 +1,6 @@
 import pytest
+import numpy as np
+from unittest.mock import MagicMock
 from app.startup import chunk_text_robust
 
 def test_chunk_text_robust_short_text():
@@ -35,4 +37,520 @@ def test_chunk_text_robust_with_paragraphs():
     chunks = chunk_text_robust(content, chunk_size=1000, chunk_overlap=200)
     assert len(chunks) == 2
     assert chunks[0] == "Premier paragraphe."
-    assert chunks[1] == "Deuxième paragraphe qui est un peu plus long pour voir."
\ No newline at end of file
+    assert chunks[1] == "Deuxième paragraphe qui est un peu plus long pour voir."
+
+# --- Tests pour le cache des embeddings de requêtes ---
+
+def test_get_embedding_uses_query_cache(mocker):
+    """Teste qu'une requête répétée (aux espaces près) ne repasse pas par le modèle, qui reçoit le texte normalisé."""
+    from app import embeddings
+    embeddings._query_cache.clear()
+    mock_model = MagicMock()
+    mock_model.encode.side_effect = lambda texts: np.tile([0.1, 0.2, 0.3], (len(texts), 1))
+    mocker.patch('app.embeddings.load_model', return_value=mock_model)
+
+    first = embeddings.get_embedding("  délit   de fuite ", is_query=True)
+    second = embeddings.get_embedding("délit de fuite", is_query=True)
+
+    assert mock_model.encode.call_count == 1
+    assert mock_model.encode.call_args[0][0] == ["query: délit de fuite"]
+    assert isinstance(first, np.ndarray) and first.dtype == np.float32
+    assert np.array_equal(first, second)
+    embeddings._query_cache.clear()
+
+def test_query_cache_lru_eviction():
+    """Teste que l'entrée la moins récemment utilisée est évincée."""
+    from app.embeddings import QueryEmbeddingCache
+    cache = QueryEmbeddingCache(max_size=2, ttl_seconds=60)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    cache.get("a")
+    cache.put("c", [3.0])
+    assert cache.get("b") is None
+    assert cache.get("a") == [1.0]
+    assert cache.get("c") == [3.0]
+
+def test_query_cache_ttl_expiration(mocker):
+    """Teste qu'une entrée expirée n'est plus servie."""
+    from app.embeddings import QueryEmbeddingCache
+    cache = QueryEmbeddingCache(max_size=10, ttl_seconds=5)
+    mock_time = mocker.patch('app.embeddings.time.monotonic', return_value=100.0)
+    cache.put("a", [1.0])
+    mock_time.return_value = 106.0
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+# --- Tests pour le micro-batching des requêtes ---
+
+def test_microbatcher_groups_concurrent_requests(mocker):
+    """Teste que des requêtes concurrentes sont vectorisées en un seul appel à encode."""
+    from app.embeddings import MicroBatcher
+    mock_model = MagicMock()
+    mock_model.encode.side_effect = lambda texts: np.array([[float(len(t))] for t in texts])
+    mocker.patch('app.embeddings.load_model', return_value=mock_model)
+
+    batcher = MicroBatcher("modele_test", max_batch_size=3, max_wait_ms=1000)
+    futures = [batcher.submit(text) for text in ["a", "bb", "ccc"]]
+    results = [future.result(timeout=5) for future in futures]
+
+    assert mock_model.encode.call_count == 1
+    assert [r[0] for r in results] == [1.0, 2.0, 3.0]
+
+def test_microbatcher_propagates_errors(mocker):
+    """Teste qu'une erreur d'encodage est remontée à chaque appelant du lot."""
+    from app.embeddings import MicroBatcher
+    mock_model = MagicMock()
+    mock_model.encode.side_effect = RuntimeError("boom")
+    mocker.patch('app.embeddings.load_model', return_value=mock_model)
+
+    batcher = MicroBatcher("modele_test", max_batch_size=8, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.submit("texte").result(timeout=5)
+
+# --- Tests pour la réindexation incrémentale ---
+
+def test_compute_point_id_is_deterministic():
+    """Teste qu'un même chunk donne toujours le même identifiant, et qu'un contenu modifié en change."""
+    from app.startup import compute_point_id, content_hash
+    first = compute_point_id("art1", 0, content_hash("texte"))
+    assert first == compute_point_id("art1", 0, content_hash("texte"))
+    assert first != compute_point_id("art1", 0, content_hash("texte modifié"))
+    assert first != compute_point_id("art1", 1, content_hash("texte"))
+
+@pytest.fixture
+def startup_mocks(mocker):
+    """Dépendances d'initialize_vector_index simulées pour une synchronisation incrémentale (collection existante, vide)."""
+    mocker.patch('app.startup.load_model', return_value=MagicMock(get_sentence_embedding_dimension=lambda: 3))
+    mocker.patch('app.chunking.CHUNKING_MODE', 'chars')
+    mocker.patch('app.startup.resolve_alias', return_value=None)
+    mocker.patch('app.startup.client.collection_exists', return_value=True)
+    mocker.patch('app.startup.ensure_payload_indexes')
+    return {
+        "articles": mocker.patch('app.startup.get_all_articles_from_api', return_value=[]),
+        "scroll": mocker.patch('app.startup.client.scroll', return_value=([], None)),
+        "embed": mocker.patch('app.startup.get_embeddings_batch', return_value=np.array([[0.1, 0.2, 0.3]], dtype=np.float32)),
+        "upload": mocker.patch('app.startup.client.upload_collection'),
+        "delete": mocker.patch('app.startup.client.delete'),
+        "set_payload": mocker.patch('app.startup.client.batch_update_points'),
+        "publish": mocker.patch('app.startup.publish_index_generation'),
+        "forget": mocker.patch('app.startup.forget_article_clusters'),
+    }
+
+def test_initialize_vector_index_delta_sync(startup_mocks):
+    """Teste que seuls les chunks nouveaux sont vectorisés et que les chunks obsolètes sont supprimés."""
+    from app import startup
+    startup_mocks["articles"].return_value = [
+        {"_key": "art1", "num": "Art. 1", "content": "Inchangé.", "code_parent": "CODE"},
+        {"_key": "art2", "num": "Art. 2", "content": "Nouveau.", "code_parent": "CODE"},
+    ]
+    unchanged_id = startup.compute_point_id("art1", 0, startup.content_hash("Inchangé."))
+    unchanged_hash = startup.metadata_hash({"title": "Art. 1", "code_parent": "CODE"})
+    startup_mocks["scroll"].return_value = ([
+        MagicMock(id=unchanged_id, payload={"metadata_hash": unchanged_hash, "original_id": "art1"}),
+        MagicMock(id="obsolete", payload={"original_id": "art3"})
+    ], None)
+
+    startup.initialize_vector_index()
+
+    startup_mocks["embed"].assert_called_once_with(["Nouveau."], use_store=True)
+    assert not startup_mocks["set_payload"].called
+    assert startup_mocks["delete"].call_args[1]['points_selector'].points == ["obsolete"]
+    uploaded = startup_mocks["upload"].call_args[1]
+    assert uploaded['ids'] == [startup.compute_point_id("art2", 0, startup.content_hash("Nouveau."))]
+    assert uploaded['payload'][0]['content_hash'] == startup.content_hash("Nouveau.")
+    assert uploaded['vectors'].dtype == np.float32
+    startup_mocks["forget"].assert_called_once_with({"art2", "art3"})
+
+def test_initialize_vector_index_updates_changed_metadata_without_reembedding(startup_mocks):
+    """Teste qu'un titre modifié met à jour le payload du chunk inchangé sans le revectoriser."""
+    from app import startup
+    startup_mocks["articles"].return_value = [{"_key": "art1", "num": "Art. 1 (nouveau titre)", "content": "Inchangé.", "code_parent": "CODE"}]
+    point_id = startup.compute_point_id("art1", 0, startup.content_hash("Inchangé."))
+    old_hash = startup.metadata_hash({"title": "Art. 1", "code_parent": "CODE"})
+    startup_mocks["scroll"].return_value = ([MagicMock(id=point_id, payload={"metadata_hash": old_hash})], None)
+
+    startup.initialize_vector_index()
+
+    assert not startup_mocks["embed"].called and not startup_mocks["upload"].called
+    operation = startup_mocks["set_payload"].call_args[1]['update_operations'][0].set_payload
+    assert operation.points == [point_id]
+    assert operation.payload['title'] == "Art. 1 (nouveau titre)"
+    assert operation.payload['metadata_hash'] == startup.metadata_hash({"title": "Art. 1 (nouveau titre)", "code_parent": "CODE"})
+    startup_mocks["publish"].assert_called_once()
+
+def test_initialize_vector_index_keeps_stale_points_on_stream_error(startup_mocks):
+    """Teste qu'une erreur en cours de flux n'entraîne aucune suppression de points."""
+    from app import startup
+
+    def broken_stream():
+        yield {"_key": "art1", "num": "Art. 1", "content": "Texte.", "code_parent": "CODE"}
+        raise ValueError("flux JSON tronqué")
+
+    startup_mocks["articles"].return_value = broken_stream()
+    startup_mocks["scroll"].return_value = ([MagicMock(id="ancien", payload={})], None)
+
+    startup.initialize_vector_index()
+
+    assert not startup_mocks["delete"].called
+
+# --- Tests pour l'index article -> cluster dominant ---
+
+def test_dominant_clusters_majority_vote():
+    """Teste le vote majoritaire vectorisé par article."""
+    from app.cluster_index import dominant_clusters
+    result = dominant_clusters(["a", "a", "a", "b", "b", "c"], [3, 1, 3, -1, -1, 5])
+    assert result == {"a": 3, "b": -1, "c": 5}
+
+def test_dominant_clusters_tie_keeps_first_encountered():
+    """Teste qu'en cas d'égalité le premier cluster rencontré l'emporte, comme Counter.most_common."""
+    from app.cluster_index import dominant_clusters
+    from app.routes.cluster import NULL_CLUSTER
+    result = dominant_clusters(["a", "a", "b", "b", "c", "c"], [7, 2, 4, NULL_CLUSTER, -1, 3])
+    assert result == {"a": 7, "b": 4, "c": -1}
+
+def test_dominant_clusters_many_articles_and_clusters():
+    """Teste le vote sur de nombreux articles et clusters, sans matrice dense articles x clusters."""
+    from app.cluster_index import dominant_clusters
+    article_ids = [f"art_{i}" for i in range(5000) for _ in range(3)]
+    cluster_ids = [c for i in range(5000) for c in (i, 10**12 + i, i)]
+    result = dominant_clusters(article_ids, cluster_ids)
+    assert len(result) == 5000
+    assert result["art_4999"] == 4999
+
+def test_write_atomic_leaves_no_temporary_file(tmp_path):
+    """Teste l'écriture atomique via un fichier temporaire unique."""
+    from app.cluster_index import write_atomic
+    target = tmp_path / "VERSION"
+    write_atomic(str(target), "1")
+    write_atomic(str(target), "2")
+    assert target.read_text(encoding="utf-8") == "2"
+    assert [p.name for p in tmp_path.iterdir()] == ["VERSION"]
+
+def test_article_cluster_index_reloads_on_new_version(tmp_path, monkeypatch):
+    """Teste que l'index en mémoire est rechargé quand une nouvelle version est publiée."""
+    from app import cluster_index
+    monkeypatch.setattr(cluster_index, "CLUSTER_INDEX_DIR", str(tmp_path))
+    index = cluster_index.ArticleClusterIndex(check_interval=0)
+
+    assert index.lookup(["a"]) == ({}, ["a"])
+    cluster_index.publish_article_clusters("CODE_1", {"a": 1})
+    cluster_index.publish_article_clusters("CODE_2", {"b": 2})
+    assert index.lookup(["a", "b", "c"]) == ({"a": 1, "b": 2}, ["c"])
+    cluster_index.publish_article_clusters("CODE_1", {"a": 4})
+    assert index.lookup(["a"]) == ({"a": 4}, [])
+
+def test_forget_and_clear_article_clusters(tmp_path, monkeypatch):
+    """Teste que les articles modifiés sont retirés de l'index, puis que l'index est vidé."""
+    from app import cluster_index
+    monkeypatch.setattr(cluster_index, "CLUSTER_INDEX_DIR", str(tmp_path))
+    index = cluster_index.ArticleClusterIndex(check_interval=0)
+    cluster_index.publish_article_clusters("CODE_1", {"a": 1, "b": 1})
+    cluster_index.publish_article_clusters("CODE_2", {"c": 2})
+
+    assert cluster_index.forget_article_clusters(["inconnu"]) is None
+    assert cluster_index.forget_article_clusters(["a", "c"]) == cluster_index.current_version()
+    assert index.lookup(["a", "b", "c"]) == ({"b": 1}, ["a", "c"])
+    assert cluster_index.clear_article_clusters() is not None
+    assert index.lookup(["b"]) == ({}, ["b"])
+    assert cluster_index.clear_article_clusters() is None
+
+# --- Tests pour les backends d'inférence ---
+
+def test_load_model_rejects_int8_outside_onnx():
+    """Teste que la quantification int8 n'est acceptée qu'avec le backend onnx."""
+    from app.embeddings import load_model
+    with pytest.raises(ValueError):
+        load_model("modele_test", backend="openvino", quantization="int8")
+
+def test_load_model_reuses_exported_onnx_model(mocker, tmp_path):
+    """Teste qu'un modèle déjà exporté est rechargé depuis le cache sans nouvel export."""
+    from app import embeddings
+    mocker.patch('app.embeddings.EMBEDDING_EXPORT_DIR', str(tmp_path))
+    mocker.patch.dict('app.embeddings._models', clear=True)
+    export_dir = tmp_path / "org__modele" / "onnx"
+    (export_dir / "onnx").mkdir(parents=True)
+    (export_dir / "onnx" / "model.onnx").write_bytes(b"")
+    mock_st = mocker.patch('sentence_transformers.SentenceTransformer')
+
+    embeddings.load_model("org/modele", backend="onnx", quantization="none")
+    embeddings.load_model("org/modele", backend="onnx", quantization="none")
+
+    mock_st.assert_called_once_with(str(export_dir), backend="onnx", model_kwargs={"file_name": "onnx/model.onnx"})
+
+def test_check_backend_quality_reports_similarity(mocker):
+    """Teste le rapport de comparaison d'un backend à la référence fp32."""
+    from app.embeddings import check_backend_quality
+    rng = np.random.RandomState(0)
+    reference = rng.rand(6, 4)
+    reference_model = MagicMock(encode=lambda texts, normalize_embeddings: reference / np.linalg.norm(reference, axis=1, keepdims=True))
+    mocker.patch('app.embeddings.load_model', side_effect=lambda name, backend, quantization: reference_model)
+
+    report = check_backend_quality(["t"] * 6, backend="onnx", quantization="int8", k=2)
+
+    assert report["cosine_min"] == pytest.approx(1.0)
+    assert report["topk_overlap"] == 1.0
+    assert report["k"] == 2
+
+# --- Tests pour le préchauffage et les workers du serveur ---
+
+def test_warm_up_loads_model_and_marks_ready(mocker):
+    """Teste que le préchauffage charge le modèle, exécute les encodages factices puis marque l'API prête."""
+    import threading
+    from app import warmup
+    mocker.patch.object(warmup, '_ready', threading.Event())
+    mocker.patch.dict(warmup._state, {"status": "pending", "error": None, "seconds": None})
+    fake_model = MagicMock()
+    mocker.patch('app.embeddings.load_model', return_value=fake_model)
+
+    warmup.start_warmup("sync")
+
+    assert warmup.is_ready()
+    assert fake_model.encode.call_count == warmup.WARMUP_ENCODES
+    assert warmup.warmup_state()["status"] == "ready"
+
+def test_warm_up_failure_keeps_api_not_ready(mocker):
+    """Teste qu'un échec du chargement du modèle laisse l'API non prête et conserve l'erreur."""
+    import threading
+    from app import warmup
+    mocker.patch.object(warmup, '_ready', threading.Event())
+    mocker.patch.dict(warmup._state, {"status": "pending", "error": None, "seconds": None})
+    mocker.patch('app.embeddings.load_model', side_effect=OSError("modèle introuvable"))
+
+    warmup.start_warmup("sync")
+
+    assert not warmup.is_ready()
+    assert warmup.warmup_state()["status"] == "failed"
+    assert "introuvable" in warmup.warmup_state()["error"]
+
+def test_limit_torch_threads_caps_intra_op_threads(monkeypatch):
+    """Teste que chaque worker du serveur plafonne les threads intra-op de torch."""
+    import os
+    import torch
+    from app.parallel import limit_torch_threads
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        monkeypatch.setenv(var, "8")
+    previous = torch.get_num_threads()
+    try:
+        limit_torch_threads(1)
+        assert torch.get_num_threads() == 1
+        assert os.environ["OMP_NUM_THREADS"] == "1"
+    finally:
+        torch.set_num_threads(previous)
+
+# --- Tests pour le client Qdrant et le schéma de la collection ---
+
+def test_qdrant_client_is_created_lazily_and_shared(mocker):
+    """Teste que le client Qdrant n'est créé qu'à la première utilisation, puis partagé par tous les modules."""
+    from app import qdrant
+    mocker.patch.object(qdrant, '_client', None)
+    mocker.patch.object(qdrant, '_client_pid', None)
+    mock_cls = mocker.patch('app.qdrant.QdrantClient')
+
+    import app.routes.cluster, app.startup
+    assert mock_cls.call_count == 0
+
+    app.startup.client.get_collections()
+    app.routes.cluster.client.get_collections()
+
+    assert mock_cls.call_count == 1
+    assert mock_cls.return_value.get_collections.call_count == 2
+
+def test_qdrant_client_recreated_after_fork(mocker):
+    """Teste qu'un nouveau client est créé après un fork (pid différent)."""
+    from app import qdrant
+    mocker.patch.object(qdrant, '_client', None)
+    mocker.patch.object(qdrant, '_client_pid', None)
+    mock_cls = mocker.patch('app.qdrant.QdrantClient', side_effect=[MagicMock(), MagicMock()])
+
+    first = qdrant.get_client()
+    mocker.patch('app.qdrant.os.getpid', return_value=-1)
+    second = qdrant.get_client()
+
+    assert first is not second
+    assert mock_cls.call_count == 2
+
+def test_qdrant_client_options_grpc(mocker):
+    """Teste que le transport gRPC et le pool de connexions sont configurables."""
+    from app import qdrant
+    mocker.patch.object(qdrant, 'QDRANT_PREFER_GRPC', True)
+    mocker.patch.object(qdrant, 'QDRANT_MAX_KEEPALIVE', 7)
+    options = qdrant.client_options()
+    assert options['prefer_grpc'] is True
+    assert options['limits'].max_keepalive_connections == 7
+    assert options['grpc_options']['grpc.max_receive_message_length'] >= 64 * 1024 * 1024
+
+def test_collection_schema_quantized_on_disk(mocker):
+    """Teste que le schéma par défaut garde les vecteurs originaux sur disque et une copie int8 en RAM."""
+    from qdrant_client import models
+    from app.collection import collection_schema
+    schema = collection_schema(1024, quantization="scalar", on_disk=True, m=32, ef_construct=200)
+    assert schema['vectors_config'].size == 1024
+    assert schema['vectors_config'].on_disk is True
+    assert schema['quantization_config'].scalar.type == models.ScalarType.INT8
+    assert schema['quantization_config'].scalar.always_ram is True
+    assert schema['hnsw_config'].m == 32 and schema['hnsw_config'].ef_construct == 200
+
+    assert collection_schema(1024, quantization="none")['quantization_config'] is None
+    assert isinstance(collection_schema(1024, quantization="binary")['quantization_config'], models.BinaryQuantization)
+    with pytest.raises(ValueError):
+        collection_schema(1024, quantization="pq")
+
+def test_prepare_collection_creates_version_with_configured_schema(mocker):
+    """Teste qu'une nouvelle version reçoit le schéma configuré, et que --update-config l'applique à la collection servie."""
+    import app.startup
+    mocker.patch('app.startup.ensure_payload_indexes')
+    mocker.patch('app.startup.resolve_alias', return_value=None)
+    mocker.patch('app.startup.client.collection_exists', return_value=False)
+    mock_create = mocker.patch('app.startup.client.create_collection')
+    target, served, new_version = app.startup.prepare_collection(1024)
+    assert new_version and served is None
+    assert target.startswith(app.startup.COLLECTION_NAME + "_v")
+    kwargs = mock_create.call_args[1]
+    assert kwargs['vectors_config'].size == 1024
+    assert 'quantization_config' in kwargs and 'hnsw_config' in kwargs
+
+    mocker.patch('app.startup.resolve_alias', return_value="articles_chunked_v20250101T000000")
+    mock_update = mocker.patch('app.startup.client.update_collection')
+    assert app.startup.prepare_collection(1024) == ("articles_chunked_v20250101T000000", "articles_chunked_v20250101T000000", False)
+    mock_update.assert_not_called()
+    app.startup.prepare_collection(1024, update_config=True)
+    mock_update.assert_called_once()
+
+def test_ensure_payload_indexes_creates_missing_indexes(mocker):
+    """Teste que seuls les index absents sont créés, code_parent étant déclaré clé de tenant."""
+    from app.collection import ensure_payload_indexes
+    client = MagicMock()
+    client.get_collection.return_value.payload_schema = {"original_id": MagicMock()}
+
+    ensure_payload_indexes(client, "articles_chunked")
+
+    created = {c[1]['field_name']: c[1]['field_schema'] for c in client.create_payload_index.call_args_list}
+    assert set(created) == {"code_parent", "cluster_id"}
+    assert created["code_parent"].is_tenant is True
+
+# --- Tests pour le découpage par tokens et l'encodage ---
+
+class WhitespaceTokenizer:
+    """Tokenizer minimal (un token par mot) exposant input_ids et offset_mapping."""
+
+    def __call__(self, texts, add_special_tokens=True, return_offsets_mapping=False, truncation=False, max_length=None):
+        import re
+        offsets = [[m.span() for m in re.finditer(r"\S+", text)] for text in texts]
+        if add_special_tokens:
+            offsets = [[(0, 0)] + o + [(0, 0)] for o in offsets]
+        if truncation:
+            offsets = [o[:max_length] for o in offsets]
+        encoded = {"input_ids": [list(range(len(o))) for o in offsets]}
+        if return_offsets_mapping:
+            encoded["offset_mapping"] = offsets
+        return encoded
+
+def test_token_chunker_windows_overlap_without_loss():
+    """Teste le découpage d'un paragraphe trop long en fenêtres chevauchantes extraites du texte d'origine, sans perte."""
+    from app.chunking import TokenChunker
+    words = [f"mot{i}" for i in range(25)]
+    content = "Titre court.\n\n" + " ".join(words)
+
+    chunks = TokenChunker(WhitespaceTokenizer(), max_tokens=10, overlap_tokens=3).chunk(content)
+
+    assert chunks[0] == "Titre court."
+    windows = [c.split() for c in chunks[1:]]
+    assert all(len(w) <= 10 for w in windows)
+    assert windows[0] == words[:10] and windows[1][:3] == words[7:10]
+    assert windows[-1][-1] == words[-1]
+    assert set(words) == {w for window in windows for w in window}
+    with pytest.raises(ValueError):
+        TokenChunker(WhitespaceTokenizer(), max_tokens=10, overlap_tokens=10)
+
+def test_encode_length_bucketed_single_encode_call():
+    """Teste que les textes sont confiés en un seul appel à model.encode (qui trie par longueur) et le décompte des tokens."""
+    from app.chunking import encode_length_bucketed
+    model = MagicMock(max_seq_length=50, tokenizer=WhitespaceTokenizer())
+    model.encode.side_effect = lambda texts, **kwargs: np.array([[float(len(t.split()))] for t in texts])
+    texts = ["a " * n for n in (50, 1, 48, 2, 49, 3)]
+
+    vectors, stats = encode_length_bucketed(model, texts, batch_size=3)
+
+    assert vectors.dtype == np.float32
+    assert vectors[:, 0].tolist() == [50, 1, 48, 2, 49, 3]
+    model.encode.assert_called_once_with(texts, batch_size=3)
+    assert stats["tokens"] == 50 + 3 + 50 + 4 + 50 + 5  # tokens spéciaux inclus, tronqués à max_seq_length
+    assert stats["tokens_per_second"] is None or stats["tokens_per_second"] > 0
+
+def test_encode_length_bucketed_uses_pool_only_for_large_inputs():
+    """Teste que les gros lots sont répartis sur le pool multi-processus et que les petits restent dans le processus."""
+    from app.chunking import encode_length_bucketed
+    model = MagicMock(max_seq_length=512, tokenizer=WhitespaceTokenizer())
+    model.encode.side_effect = lambda texts, **kwargs: np.array([[float(len(t.split()))] for t in texts])
+    pool = MagicMock(min_texts=4)
+    pool.encode.side_effect = model.encode.side_effect
+
+    encode_length_bucketed(model, ["a b", "a"], pool=pool)
+    pool.encode.assert_not_called()
+
+    texts = ["a " * n for n in (5, 1, 4, 2)]
+    vectors, _ = encode_length_bucketed(model, texts, pool=pool)
+    assert pool.encode.call_args[0][0] == sorted(texts, key=len)
+    assert vectors[:, 0].tolist() == [5, 1, 4, 2]
+
+def test_encode_pool_disabled_by_default_and_thread_env_restored(monkeypatch):
+    """Teste qu'aucun pool n'est créé sans EMBEDDING_PROCESSES et que thread_env restaure l'environnement."""
+    import os
+    from app import embeddings
+    from app.parallel import thread_env
+    monkeypatch.setattr(embeddings, 'EMBEDDING_PROCESSES', "0")
+    assert embeddings.get_encode_pool("modele") is None
+
+    monkeypatch.setenv("OMP_NUM_THREADS", "8")
+    monkeypatch.delenv("MKL_NUM_THREADS", raising=False)
+    with thread_env(2):
+        assert os.environ["OMP_NUM_THREADS"] == os.environ["MKL_NUM_THREADS"] == "2"
+    assert os.environ["OMP_NUM_THREADS"] == "8" and "MKL_NUM_THREADS" not in os.environ
+
+def test_get_embeddings_batch_returns_float32_matrix(mocker):
+    """Teste que les vecteurs sont renvoyés en matrice float32 contiguë, normalisés sur demande."""
+    from app import embeddings
+    mocker.patch('app.embeddings._encode_texts', return_value=np.array([[3.0, 4.0], [0.0, 0.0]]))
+
+    vectors = embeddings.get_embeddings_batch(["a", "b"])
+    assert vectors.dtype == np.float32 and vectors.flags.c_contiguous and vectors.shape == (2, 2)
+
+    normalized = embeddings.get_embeddings_batch(["a", "b"], normalize=True)
+    assert np.allclose(normalized, [[0.6, 0.8], [0.0, 0.0]])
+
+# --- Tests pour le cache sémantique des résultats ---
+
+def test_result_cache_hits_close_queries_within_scope(tmp_path, monkeypatch):
+    """Teste qu'une requête proche (cosinus >= seuil) de même code_id et limit est servie depuis le cache."""
+    from app import result_cache as rc
+    monkeypatch.setattr(rc, 'INDEX_GENERATION_FILE', str(tmp_path / "index_generation"))
+    monkeypatch.setattr('app.cluster_index.CLUSTER_INDEX_DIR', str(tmp_path / "cluster_index"))
+    cache = rc.SemanticResultCache(threshold=0.95, entries_per_scope=2, check_interval=0)
+
+    cache.put(np.array([1.0, 0.0, 0.0]), "CODE", 10, [{"id": "a"}], cost_seconds=0.02)
+    assert cache.get(np.array([0.99, 0.05, 0.0]), "CODE", 10) == [{"id": "a"}]
+    assert cache.get(np.array([0.0, 1.0, 0.0]), "CODE", 10) is None
+    assert cache.get(np.array([1.0, 0.0, 0.0]), "AUTRE", 10) is None
+    assert cache.get(np.array([1.0, 0.0, 0.0]), "CODE", 5) is None
+
+    cache.put(np.array([0.0, 1.0, 0.0]), "CODE", 10, [{"id": "b"}])
+    cache.put(np.array([0.0, 0.0, 1.0]), "CODE", 10, [{"id": "c"}])
+    assert cache.get(np.array([1.0, 0.0, 0.0]), "CODE", 10) is None  # évincée (2 entrées par scope)
+
+def test_result_cache_cleared_on_new_generation(tmp_path, monkeypatch):
+    """Teste que le cache est vidé quand une nouvelle génération de l'index ou des clusters est publiée."""
+    from app import result_cache as rc
+    from app.cluster_index import publish_article_clusters
+    monkeypatch.setattr(rc, 'INDEX_GENERATION_FILE', str(tmp_path / "index_generation"))
+    monkeypatch.setattr('app.cluster_index.CLUSTER_INDEX_DIR', str(tmp_path / "cluster_index"))
+    cache = rc.SemanticResultCache(check_interval=0)
+    vector = np.array([0.3, 0.4])
+
+    cache.put(vector, None, 10, [{"id": "a"}])
+    assert cache.get(vector, None, 10) == [{"id": "a"}]
+    rc.publish_index_generation()
+    assert cache.get(vector, None, 10) is None
+
+    cache.put(vector, None, 10, [{"id": "a"}])
+    publish_article_clusters("CODE", {"a": 1})
+    assert cache.get(vector, None, 10) is None
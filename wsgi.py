@@ -0,0 +1,5 @@
+from app import create_app
+
+# Point d'entrée du serveur de production (voir gunicorn.conf.py) : le modèle est
+# chargé et préchauffé avant que le processus maître ne crée les workers.
+app = create_app(warmup="sync")